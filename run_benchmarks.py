@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+This file benchmarks the cost of the Projection method solvers (Gauge, Alg1, Alg2, Alg3)
+for the test problems and a range of grid sizes, and compares two benchmark results files
+
+usage: python run_benchmarks.py run results.json [--grids 32 64 128] [--steps 10] ...
+       python run_benchmarks.py compare old_results.json new_results.json [--threshold 0.1]
+       python run_benchmarks.py kernels [--tol 1e-12]
+       python run_benchmarks.py ensemble [--members 1 4 16] [--grid 64] ...
+"""
+
+from __future__ import division
+import sys
+import os
+import time
+import json
+import resource
+import argparse
+import multiprocessing
+from Queue import Empty
+import numpy as np
+import structure3
+import solvers3
+
+methods = ['Gauge', 'Alg1', 'Alg2', 'Alg3']
+test_problems = ['Taylor', 'periodic_forcing_1', 'periodic_forcing_2', 'driven_cavity']
+gridsizes = [32, 64, 128, 256, 512, 1024]
+# the timings compared by compare_results
+timings = ['setup_time', 'time_per_step']
+
+# spatial domain of the test problems (same defaults as run_solvers.get_inputs)
+def spatial_domain(test_problem_name):
+	if test_problem_name == 'Taylor':
+		xl, xr = -np.pi/4.0, np.pi/4.0
+	elif test_problem_name == 'periodic_forcing_1':
+		xl, xr = -1, 1
+	else:
+		xl, xr = 0, 1
+	return [[xl,xr],[xl,xr]]
+
+# runs nsteps time steps of one method and test problem on a gridsize x gridsize grid
+# returns the set up time, the time per step, the stage timings and solver iterations per step and the peak memory
+def benchmark_case(method, test_problem_name, gridsize, nsteps=10, CFL=0.1, Re=1.0, solve_method='ILU', velocity_solve_method='BICG', memory_report=False):
+	mesh = structure3.mesh([gridsize, gridsize], spatial_domain(test_problem_name), [0, 1], CFL, Re)
+	profiler = solvers3.Solver_profiler(diagnostics=False, memory=memory_report)
+	start = time.time()
+	ic = structure3.InitialCondition(mesh).select_initial_conditions(test_problem_name)
+	if method == 'Gauge':
+		solver = solvers3.Gauge_method(Re, mesh)
+		ic = ic[0]
+	elif method == 'Alg1':
+		solver = solvers3.Alg1_method(Re, mesh)
+	elif method == 'Alg2':
+		solver = solvers3.Alg2_method(Re, mesh)
+	elif method == 'Alg3':
+		solver = solvers3.Alg3_method(Re, mesh)
+		ic = ic[0]
+	else:
+		raise TypeError('unknown method '+method)
+	init_setup = solver.setup(ic, test_problem_name, solve_method=solve_method, velocity_solve_method=velocity_solve_method, profiler=profiler)
+	setup_time = time.time() - start
+	# the methods used, 'auto' is resolved by the set up (the set up lists end with
+	# solve_method, velocity_solve_method, warm_start and the profiler)
+	used_solve_method, used_velocity_solve_method = init_setup[-4], init_setup[-3]
+	if memory_report:
+		setup_memory = solvers3.Memory_report().setup_bytes(init_setup, mesh)
+	start = time.time()
+	solver.iterative_solver(test_problem_name, nsteps, init_setup)
+	solve_time = time.time() - start
+
+	totals = profiler.totals()
+	result = {'method': method, 'test_problem': test_problem_name, 'gridsize': gridsize, 'steps': nsteps,
+		  'CFL': CFL, 'Re': Re, 'solve_method': used_solve_method, 'velocity_solve_method': used_velocity_solve_method,
+		  'requested_solve_method': solve_method, 'requested_velocity_solve_method': velocity_solve_method,
+		  'setup_time': setup_time, 'time_per_step': solve_time/nsteps,
+		  # ru_maxrss is in kilobytes on Linux
+		  'peak_memory_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0}
+	for key, value in totals.items():
+		if key.startswith('iterations'):
+			result[key.replace(' ', '_')+'_per_step'] = value/nsteps
+		elif key.startswith('peak'):
+			# step_peak_memory_mb (traced allocations) or step_peak_rss_mb (resident set size samples)
+			result['step_'+key.replace(' ', '_')+'_mb'] = value/2**20 if value is not None else None
+		elif key.startswith('memory') or key.startswith('rss'):
+			result['stage_'+key.replace(' ', '_')+'_mb'] = value/nsteps/2**20
+		elif key != 'total':
+			result['stage_'+key.replace(' ', '_')] = value/nsteps
+	if memory_report:
+		for key, value in setup_memory.items():
+			result['setup_memory_'+key.replace(' ', '_')+'_mb'] = value/2**20
+	return result
+
+# time per step of Alg 1 ensembles of every size in members (one block solve per operator and step, see
+# Alg1_method.ensemble_solver), the time per member shows how far the shared block solves scale sub-linearly
+def benchmark_ensemble(members, test_problem_name='Taylor', gridsize=64, nsteps=10, CFL=0.1, Re=1.0, solve_method='DIR', velocity_solve_method='LU'):
+	results = []
+	mesh = structure3.mesh([gridsize, gridsize], spatial_domain(test_problem_name), [0, 1], CFL, Re)
+	ic_uv, ic_p = structure3.InitialCondition(mesh).select_initial_conditions(test_problem_name)
+	for k in members:
+		solver = solvers3.Alg1_method(Re, mesh)
+		setups = solver.ensemble_setup([[ic_uv, ic_p]]*k, test_problem_name, solve_method=solve_method, velocity_solve_method=velocity_solve_method, profiler=solvers3.Solver_profiler(diagnostics=False))
+		start = time.time()
+		solver.ensemble_solver(test_problem_name, nsteps, setups)
+		time_per_step = (time.time() - start)/nsteps
+		results.append({'members': k, 'time_per_step': time_per_step, 'time_per_member_step': time_per_step/k})
+		print '%4d members %.4fs per step, %.4fs per member and step' % (k, time_per_step, time_per_step/k)
+	return results
+
+# runs benchmark_case in a new process (so the peak memory belongs to this case only)
+# the output of the solvers is discarded
+def benchmark_process(queue, args):
+	sys.stdout = open(os.devnull, 'w')
+	try:
+		queue.put(benchmark_case(*args))
+	except Exception as e:
+		queue.put({'error': repr(e)})
+
+# waits for the result of a benchmark process, a process which exits without a result (e.g. killed when it runs out of
+# memory) or runs longer than timeout seconds (None: no limit) gives an error entry instead
+def benchmark_result(queue, process, timeout=None, poll=1.0):
+	start = time.time()
+	while True:
+		try:
+			return queue.get(timeout=poll)
+		except Empty:
+			if not process.is_alive():
+				# the result may have been posted just before the process exited
+				try:
+					return queue.get(timeout=poll)
+				except Empty:
+					return {'error': 'benchmark process exited with code %s' % process.exitcode}
+			if timeout is not None and time.time() - start > timeout:
+				process.terminate()
+				return {'error': 'timed out after %gs' % timeout}
+
+def run_benchmarks(results_file, methods=methods, test_problems=test_problems, gridsizes=gridsizes, nsteps=10, CFL=0.1, Re=1.0, solve_method='ILU', velocity_solve_method='BICG', memory_report=False, timeout=None):
+	results = []
+	for gridsize in gridsizes:
+		for test_problem_name in test_problems:
+			for method in methods:
+				args = (method, test_problem_name, gridsize, nsteps, CFL, Re, solve_method, velocity_solve_method, memory_report)
+				queue = multiprocessing.Queue()
+				process = multiprocessing.Process(target=benchmark_process, args=(queue, args))
+				process.start()
+				result = benchmark_result(queue, process, timeout)
+				process.join()
+				result.update({'method': method, 'test_problem': test_problem_name, 'gridsize': gridsize})
+				results.append(result)
+				if 'error' in result:
+					print method, test_problem_name, gridsize, 'failed:', result['error']
+				else:
+					print method, test_problem_name, gridsize, 'setup %.3fs, %.4fs per step, %.1f MB' % (result['setup_time'], result['time_per_step'], result['peak_memory_mb'])
+				# write after every case, so that a long sweep can be inspected (or interrupted) early
+				with open(results_file, 'w') as f:
+					json.dump({'python': sys.version, 'numpy': np.__version__, 'kernel_backend': structure3.kernel_backend(), 'results': results}, f, indent=2, sort_keys=True)
+	return results
+
+# identifies a benchmark case in the results files
+def case_key(result):
+	return (result['method'], result['test_problem'], result['gridsize'], result.get('solve_method'), result.get('velocity_solve_method'))
+
+# compares the timings of the cases present in both results files
+# returns the cases which are slower than (1 + threshold) times the old timing
+def compare_results(old_file, new_file, threshold=0.1):
+	with open(old_file, 'r') as f:
+		old = dict((case_key(result), result) for result in json.load(f)['results'] if 'error' not in result)
+	with open(new_file, 'r') as f:
+		new = [result for result in json.load(f)['results'] if 'error' not in result]
+	slowdowns = []
+	for result in new:
+		key = case_key(result)
+		if key not in old:
+			continue
+		for timing in timings:
+			ratio = result[timing]/max(old[key][timing], 1e-12)
+			flag = ''
+			if ratio > 1 + threshold:
+				flag = 'SLOWER'
+				slowdowns.append((key, timing, ratio))
+			print '%-6s %-20s %5d %-14s %10.4f %10.4f %6.2fx %s' % (key[0], key[1], key[2], timing, old[key][timing], result[timing], ratio, flag)
+	print len(slowdowns), 'slowdowns beyond %d%%' % (100*threshold)
+	return slowdowns
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='benchmarks of the Projection method solvers')
+	subparsers = parser.add_subparsers(dest='command')
+	run_parser = subparsers.add_parser('run', help='run the benchmarks and write a results file')
+	run_parser.add_argument('results_file')
+	run_parser.add_argument('--methods', nargs='+', default=methods)
+	run_parser.add_argument('--problems', nargs='+', default=test_problems)
+	run_parser.add_argument('--grids', nargs='+', type=int, default=gridsizes)
+	run_parser.add_argument('--steps', type=int, default=10)
+	run_parser.add_argument('--CFL', type=float, default=0.1)
+	run_parser.add_argument('--Re', type=float, default=1.0)
+	run_parser.add_argument('--solve-method', default='ILU')
+	run_parser.add_argument('--velocity-solve-method', default='BICG')
+	run_parser.add_argument('--memory-report', action='store_true', help='record the set up memory and the memory of every stage (slower)')
+	run_parser.add_argument('--timeout', type=float, default=None, help='seconds after which a case is stopped and recorded as failed')
+	compare_parser = subparsers.add_parser('compare', help='compare two results files')
+	compare_parser.add_argument('old_file')
+	compare_parser.add_argument('new_file')
+	compare_parser.add_argument('--threshold', type=float, default=0.1)
+	kernels_parser = subparsers.add_parser('kernels', help='cross-check the numba stencil kernels against the NumPy ones')
+	kernels_parser.add_argument('--tol', type=float, default=1e-12)
+	ensemble_parser = subparsers.add_parser('ensemble', help='time Alg 1 ensembles of several sizes on one mesh')
+	ensemble_parser.add_argument('--members', nargs='+', type=int, default=[1, 4, 16])
+	ensemble_parser.add_argument('--problem', default='Taylor')
+	ensemble_parser.add_argument('--grid', type=int, default=64)
+	ensemble_parser.add_argument('--steps', type=int, default=10)
+	ensemble_parser.add_argument('--solve-method', default='DIR')
+	ensemble_parser.add_argument('--velocity-solve-method', default='LU')
+	args = parser.parse_args()
+
+	if args.command == 'run':
+		run_benchmarks(args.results_file, args.methods, args.problems, args.grids, args.steps, args.CFL, args.Re, args.solve_method, args.velocity_solve_method, args.memory_report, args.timeout)
+	elif args.command == 'compare':
+		slowdowns = compare_results(args.old_file, args.new_file, args.threshold)
+		sys.exit(1 if slowdowns else 0)
+	elif args.command == 'ensemble':
+		benchmark_ensemble(args.members, args.problem, args.grid, args.steps, solve_method=args.solve_method, velocity_solve_method=args.velocity_solve_method)
+	else:
+		if structure3.numba is None:
+			print 'numba is not installed, the kernel check is skipped'
+			sys.exit(0)
+		differences = structure3.check_kernel_backends()
+		for name in sorted(differences):
+			print '%-22s %.3e' % (name, differences[name])
+		sys.exit(1 if max(differences.values()) > args.tol else 0)
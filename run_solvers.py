@@ -228,7 +228,7 @@ def error_analysis(xl, xr, t0, tf, method, test_problem_name, CFL=0.1, Re=1.0, N
 
 	plt.show()
 
-def run_Navier_Stokes_solver(xl, xr, t0, tf, gridsize, method, test_problem_name, plot_option, CFL=0.1, Re=1.0):
+def run_Navier_Stokes_solver(xl, xr, t0, tf, gridsize, method, test_problem_name, plot_option, CFL=0.1, Re=1.0, solve_method='ILU', velocity_solve_method='BICG', warm_start=False, cache_dir=None, profile_file=None, diagnostics=True, memory_report=False):
 	grid_size_domain = [gridsize, gridsize]
 	m, n = grid_size_domain
 	spatial_domain = [[xl,xr],[xl,xr]]
@@ -246,13 +246,21 @@ def run_Navier_Stokes_solver(xl, xr, t0, tf, gridsize, method, test_problem_name
 	XPint = mesh.pintmg("x")
 	YPint = mesh.pintmg("y")
 	tend = mesh.tdomain[1]
+	# the assembled operators and factorisations are reused across runs if a cache directory is given
+	if cache_dir is None:
+		operator_cache = None
+	else:
+		operator_cache = solvers3.Operator_cache(cache_dir)
+	# timings of the stages of every time step, diagnostics=False skips the residual and integral checks
+	# memory_report=True also records the memory of the set up objects and the peak memory of every step
+	profiler = solvers3.Solver_profiler(diagnostics, memory_report)
 
 	if method == 'Gauge':
 		ic_uv_init = structure3.InitialCondition(mesh).select_initial_conditions(test_problem_name)[0]
 		# use Gauge method
 		Gauge = solvers3.Gauge_method(Re, mesh)
 		# initial set up
-		init_setup = Gauge.setup(ic_uv_init, test_problem_name)
+		init_setup = Gauge.setup(ic_uv_init, test_problem_name, solve_method=solve_method, velocity_solve_method=velocity_solve_method, warm_start=warm_start, operator_cache=operator_cache, profiler=profiler)
 		# iterative solve process
 		uvf_cmp, pf, gradp = Gauge.iterative_solver(test_problem_name, mesh.Tn, init_setup)
 	
@@ -261,7 +269,7 @@ def run_Navier_Stokes_solver(xl, xr, t0, tf, gridsize, method, test_problem_name
 		# use Alg 1 method
 		Alg1 = solvers3.Alg1_method(Re, mesh)
 		# initial set up
-		init_setup = Alg1.setup(ic_init, test_problem_name)
+		init_setup = Alg1.setup(ic_init, test_problem_name, solve_method=solve_method, velocity_solve_method=velocity_solve_method, warm_start=warm_start, operator_cache=operator_cache, profiler=profiler)
 		# iterative solve process
 		uvf_cmp, pf, gradp = Alg1.iterative_solver(test_problem_name, mesh.Tn, init_setup)
 	
@@ -270,7 +278,7 @@ def run_Navier_Stokes_solver(xl, xr, t0, tf, gridsize, method, test_problem_name
 		ic_uv_init = structure3.InitialCondition(mesh).select_initial_conditions(test_problem_name)
 		Alg2 = solvers3.Alg2_method(Re, mesh)
 		# initial set up
-		init_setup = Alg2.setup(ic_uv_init, test_problem_name)
+		init_setup = Alg2.setup(ic_uv_init, test_problem_name, solve_method=solve_method, velocity_solve_method=velocity_solve_method, warm_start=warm_start, operator_cache=operator_cache, profiler=profiler)
 		# iterative solve process
 		uvf_cmp, pf, gradp = Alg2.iterative_solver(test_problem_name, mesh.Tn, init_setup)
 	
@@ -280,9 +288,18 @@ def run_Navier_Stokes_solver(xl, xr, t0, tf, gridsize, method, test_problem_name
 		# use Alg1 method
 		Alg3 = solvers3.Alg3_method(Re, mesh)
 		# initial set up
-		init_setup = Alg3.setup(ic_init, test_problem_name)
+		init_setup = Alg3.setup(ic_init, test_problem_name, solve_method=solve_method, velocity_solve_method=velocity_solve_method, warm_start=warm_start, operator_cache=operator_cache, profiler=profiler)
 		# iterative solve process
 		uvf_cmp, pf, gradp = Alg3.iterative_solver(test_problem_name, mesh.Tn, init_setup)
+
+	if memory_report:
+		profiler.setup_memory = solvers3.Memory_report().setup_bytes(init_setup, mesh)
+		print profiler.setup_memory, 'set up memory (bytes)'
+		label = 'peak ' + profiler.memory_report.label
+		print profiler.totals()[label], label + ' of a time step (bytes)'
+	if profile_file is not None:
+		profiler.save(profile_file)
+		print profiler.totals(), 'profile totals'
 	
 	# comparison and error analysis
 	if test_problem_name == 'driven_cavity':
@@ -376,6 +393,37 @@ def run_Navier_Stokes_solver(xl, xr, t0, tf, gridsize, method, test_problem_name
 		plt.show()
 		return Velocity_error, Pressure_error, avg_gradp_error, mesh.dt
 
+# runs an ensemble of members perturbed from the initial condition of the test problem with Alg 1 (see Alg1_method.ensemble_solver)
+# all members share the mesh, the matrices and the factorisations, and every step does one block solve per operator
+# member j adds j*perturbation times uniform random noise (seed) to the interior velocities of the initial condition
+# returns the list of the velocity errors of the members (the final velocity fields for the driven cavity)
+def run_Navier_Stokes_ensemble(xl, xr, t0, tf, gridsize, test_problem_name, members, perturbation=1e-3, seed=0, CFL=0.1, Re=1.0, solve_method='DIR', velocity_solve_method='LU', warm_start=False, cache_dir=None, profile_file=None, diagnostics=False):
+	mesh = structure3.mesh([gridsize, gridsize], [[xl,xr],[xl,xr]], [t0,tf], CFL, Re)
+	ic_uv, ic_p = structure3.InitialCondition(mesh).select_initial_conditions(test_problem_name)
+	rng = np.random.RandomState(seed)
+	ic_list = []
+	for j in xrange(members):
+		ic_list.append([[ic_uv[0] + j*perturbation*rng.rand(*ic_uv[0].shape), ic_uv[1] + j*perturbation*rng.rand(*ic_uv[1].shape)], ic_p])
+	if cache_dir is None:
+		operator_cache = None
+	else:
+		operator_cache = solvers3.Operator_cache(cache_dir)
+	profiler = solvers3.Solver_profiler(diagnostics)
+	Alg1 = solvers3.Alg1_method(Re, mesh)
+	init_setups = Alg1.ensemble_setup(ic_list, test_problem_name, solve_method=solve_method, velocity_solve_method=velocity_solve_method, warm_start=warm_start, operator_cache=operator_cache, profiler=profiler)
+	results = Alg1.ensemble_solver(test_problem_name, mesh.Tn, init_setups)
+	if profile_file is not None:
+		profiler.save(profile_file)
+	if test_problem_name == 'driven_cavity':
+		# no analytical solutions available
+		return [uvf_cmp for uvf_cmp, pf, gradp in results]
+	uv_exact_bnd, p_exact, gradp_exact = structure3.Exact_solutions(mesh, Re, mesh.Tn).Exact_solutions(test_problem_name)
+	Velocity_errors = []
+	for uvf_cmp, pf, gradp in results:
+		Error = solvers3.Error(uvf_cmp, uv_exact_bnd, pf, p_exact, gradp, gradp_exact, uvf_cmp.divergence(), mesh)
+		Velocity_errors.append(Error.velocity_error())
+	return Velocity_errors
+
 if __name__ == "__main__":
 	inputs = get_inputs()
 	if type(inputs[4]) == bool:
@@ -9,11 +9,25 @@ import matplotlib.pyplot as plt
 from scipy.sparse.linalg import LinearOperator
 import scipy.sparse
 import scipy.sparse.linalg as slg
+try:
+    from scipy.fft import dctn, idctn
+except ImportError:
+    # older Scipy versions only provide the fftpack interface
+    from scipy.fftpack import dctn, idctn
 from pyamg import smoothed_aggregation_solver
 from matplotlib import cm
 import time
 import sys
+import os
+import json
+import hashlib
 import copy
+import resource
+try:
+    # Python >= 3.4 (or the pytracemalloc backport for Python 2.7)
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
 import structure3
 
 __all__ = ['LinearSystem_solver', 'Gauge_method', 'Alg1', 'Error']
@@ -22,15 +36,78 @@ class LinearSystem_solver():
     '''this class contains the linear system solvers for both velocity and pressure
 	it returns the linear system in Scipy sparse matrix form and linear operator form'''
 
-    def __init__(self, Re, mesh, integration_method='Riemann'):
+    def __init__(self, Re, mesh, integration_method='Riemann', cache=None, diagnostics=True):
         self.mesh = mesh
         self.Re = Re
 	self.integration_method = integration_method
+        # diagnostics=False skips the residual recomputation and integral checks after every solve
+        self.diagnostics = diagnostics
+        # max norm residuals of the last solves (only recorded if diagnostics), keys: 'phi'
+        self.residuals = {}
+        # Operator_cache instance (or None) which stores the assembled matrices and factorisations on disk
+        self.cache = cache
+        # number of Krylov (or multigrid) iterations of the last solves, keys: 'u', 'v' and 'phi'
+        # direct and transform solves are recorded as 0 iterations
+        self.iterations = {}
+
+    # returns a callback for the iterative solvers which counts the iterations of the solve named key
+    def iteration_counter(self, key):
+        self.iterations[key] = 0
+        def count(xk):
+            self.iterations[key] += 1
+        return count
     
     # Linear systemas for velocities (in the form of sparse matrices)
     # It can be used for both intermediate velocity fields (u*) and Gauge variables (m)
     # It returns both the sparse matrix system A and its linear operator 
-    def Linsys_velocity_matrix(self, velocity):
+    # solve_method: "BICG" (Biconjugate gradient, default), "LU" (the sparse LU factorisation of A is also returned),
+    # "FD" (the fast diagonalisation of A from Linsys_velocity_eigen is also returned)
+    # or "MF" (matrix free BICG, [None, A_linop] is returned with A_linop from Linsys_velocity_operator)
+    def Linsys_velocity_matrix(self, velocity, solve_method="BICG"):
+        # matrix free: nothing is assembled, A is only available as a LinearOperator
+        if solve_method == "MF":
+            return [None, self.Linsys_velocity_operator(velocity)]
+        # the assembled matrix and its factorisations are read from the operator cache if possible
+        data = None
+        if self.cache is not None:
+            key = self.cache.key('velocity', velocity, solve_method, self.mesh.m, self.mesh.n, self.mesh.dt, self.mesh.dx, self.Re)
+            data = self.cache.load(key, self.diagnostics)
+        if data is None:
+            A = self.Linsys_velocity_assemble(velocity)
+        else:
+            A = self.cache.load_sparse(data, 'A')
+
+        A_linop = scipy.sparse.linalg.aslinearoperator(A)
+        if solve_method == "LU":
+            # A only depends on m, n, dt and Re, so it is factorised once here and every
+            # time step only needs the back substitutions
+            # MMD_AT_PLUS_A keeps the fill-in of the banded kron structure low, A is diagonally
+            # dominant so no pivoting is required (diag_pivot_thresh=0 keeps the ordering symmetric)
+            if data is None:
+                A_LU = slg.splu(A, permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0)
+            else:
+                A_LU = self.cache.load_factorisation(data, 'LU')
+            ALuv = [A, A_linop, A_LU]
+        elif solve_method == "FD":
+            if data is None:
+                A_FD = self.Linsys_velocity_eigen(velocity)
+            else:
+                A_FD = [data['FD%d' % i] for i in xrange(5)]
+            ALuv = [A, A_linop, A_FD]
+        else:
+            ALuv = [A, A_linop]
+
+        if self.cache is not None and data is None:
+            arrays = self.cache.sparse_arrays('A', A)
+            if solve_method == "LU":
+                arrays.update(self.cache.factorisation_arrays('LU', A_LU))
+            elif solve_method == "FD":
+                arrays.update(('FD%d' % i, V) for i, V in enumerate(A_FD))
+            self.cache.store(key, arrays)
+        return ALuv
+
+    # assembles the sparse (CSC) velocity matrix A of Linsys_velocity_matrix
+    def Linsys_velocity_assemble(self, velocity):
         m = self.mesh.m
         n = self.mesh.n
         dt = self.mesh.dt
@@ -66,8 +143,6 @@ class LinearSystem_solver():
             A2 = scipy.sparse.diags([md,sdl,sdu,sdll,sduu],[0,-(n-1),n-1,-2*(n-1),2*(n-1)])
             A = scipy.sparse.csc_matrix((A1+A2)*a)
             #print np.linalg.cond(np.matrix(A.todense())), "condition number velocity"
-            A_linop = scipy.sparse.linalg.aslinearoperator(A)
-            return [A, A_linop]
         
         elif velocity == "v":
             # construct A: Av = rhs
@@ -89,15 +164,120 @@ class LinearSystem_solver():
             A2 = scipy.sparse.diags([sd,sd],[-n,n])
             A = scipy.sparse.csc_matrix((A1+A2)*a)
 	    #print np.linalg.cond(np.matrix(A.todense())), "condition number velocity"
-            A_linop = scipy.sparse.linalg.aslinearoperator(A)
 
-            return [A,A_linop]
+        return A
+
+    # the velocity matrices are Kronecker sums of 1D operators: A = a*(kron(I,Bx) + kron(Ty,I))
+    # Bx acts along a row (x direction), Ty along a column (y direction) of the interior u (v) array
+    # the ghost node cubic interpolation modifies the first and last rows of the operator normal to the boundary
+    # returns [Ty, Bx, a] with Ty and Bx as dense arrays
+    def Linsys_velocity_1D_operators(self, velocity):
+        m = self.mesh.m
+        n = self.mesh.n
+        dt = self.mesh.dt
+        dx = self.mesh.dx
+        Re = self.Re
+        # for square domain only, lx = ly and dx = dy = dh
+        dh = dx
+        a = dt/(2*Re*dh**2)
+        b = (Re*dh**2)/dt + 2
+
+        if velocity == "u":
+            # Dirichlet in x, ghost nodes in y
+            Bx = np.diag(2*b*np.ones(n-1)) - np.diag(np.ones(n-2),-1) - np.diag(np.ones(n-2),1)
+            Ty = -np.diag(np.ones(m-1),-1) - np.diag(np.ones(m-1),1)
+            Ty[0,0:3] = [3, -2, 0.2]
+            Ty[-1,-3:] = [0.2, -2, 3]
+        elif velocity == "v":
+            # ghost nodes in x, Dirichlet in y
+            Bx = np.diag(2*b*np.ones(n)) - np.diag(np.ones(n-1),-1) - np.diag(np.ones(n-1),1)
+            Bx[0,0:3] = [2*b+3, -2, 0.2]
+            Bx[-1,-3:] = [0.2, -2, 2*b+3]
+            Ty = -np.diag(np.ones(m-2),-1) - np.diag(np.ones(m-2),1)
+        return [Ty, Bx, a]
+
+    # applies a 1D operator of Linsys_velocity_1D_operators along axis 0 of W without assembling it:
+    # the tridiagonal stencil (-1, d, -1) plus, if ghost is True, the ghost node weights 3, -2, 0.2
+    # in the first and last rows (transpose=True applies the transposed operator)
+    def Linsys_velocity_stencil(self, W, d, ghost, transpose=False):
+        out = d*W
+        out[1:] -= W[:-1]
+        out[:-1] -= W[1:]
+        if ghost:
+            if transpose:
+                out[0] += 3*W[0]
+                out[1] -= W[0]
+                out[2] += 0.2*W[0]
+                out[-1] += 3*W[-1]
+                out[-2] -= W[-1]
+                out[-3] += 0.2*W[-1]
+            else:
+                out[0] += 3*W[0] - W[1] + 0.2*W[2]
+                out[-1] += 3*W[-1] - W[-2] + 0.2*W[-3]
+        return out
+
+    # matrix free form of the velocity matrices: A vec(U) = a*(Ty U + U Bx^T) is applied with
+    # Linsys_velocity_stencil on the reshaped interior array U, only O(N) memory is needed
+    # rmatvec (the transpose, needed by bicg) swaps the ghost node rows for the ghost node columns
+    def Linsys_velocity_operator(self, velocity):
+        m = self.mesh.m
+        n = self.mesh.n
+        dt = self.mesh.dt
+        dx = self.mesh.dx
+        Re = self.Re
+        # for square domain only, lx = ly and dx = dy = dh
+        dh = dx
+        a = dt/(2*Re*dh**2)
+        b = (Re*dh**2)/dt + 2
+
+        if velocity == "u":
+            # Dirichlet in x, ghost nodes in y
+            row = m
+            col = n-1
+            ghost_y = True
+            ghost_x = False
+        elif velocity == "v":
+            # ghost nodes in x, Dirichlet in y
+            row = m-1
+            col = n
+            ghost_y = False
+            ghost_x = True
+        N = row*col
+
+        def apply(x, transpose):
+            U = np.reshape(x, (row, col))
+            AU = self.Linsys_velocity_stencil(U, 0, ghost_y, transpose) +\
+                 self.Linsys_velocity_stencil(U.T, 2*b, ghost_x, transpose).T
+            return a*AU.reshape(N)
+
+        return slg.LinearOperator(shape=(N,N), matvec=lambda x: apply(x, False),
+                                  rmatvec=lambda x: apply(x, True), dtype=float)
+
+    # fast diagonalisation of the velocity matrices (tensor product eigen decomposition)
+    # Ty = Vy My Vy^-1 and Bx = Vx Lx Vx^-1 are computed once per (m, n, dt, Re), a solve is then
+    # two small dense transforms, a pointwise division and two back transforms (no Krylov iterations)
+    # returns [Vy, Vy^-1, Vx, Vx^-T, D] where D = a*(My_i + Lx_j) are the eigenvalues of A
+    def Linsys_velocity_eigen(self, velocity):
+        Ty, Bx, a = self.Linsys_velocity_1D_operators(velocity)
+        # the 1D operators are non symmetric (ghost nodes) but have real eigenvalues
+        My, Vy = np.linalg.eig(Ty)
+        Lx, Vx = np.linalg.eig(Bx)
+        My = np.real_if_close(My)
+        Vy = np.real_if_close(Vy)
+        Lx = np.real_if_close(Lx)
+        Vx = np.real_if_close(Vx)
+        D = a*(My[:,np.newaxis] + Lx[np.newaxis,:])
+        return [Vy, np.linalg.inv(Vy), Vx, np.linalg.inv(Vx).T, D]
     
     # the linear system solver for velocity fields (using Biconjugate gradient method)
     # returns VelocityField instances (only interior points are calculated)
     # ALuv = [A, A_linop]: contains the lineary system in the sparse matrix and linear operator form
     # rhsuv = [rhsu, rhsv]: right hand side of u and v velocities (they need to be boundary corrected)
-    def Linsys_velocity_solver(self, ALuv, rhsuv, tol=1e-12):
+    # solve_method: "BICG", "LU" or "FD" (ALuv must then contain the factorisations from Linsys_velocity_matrix)
+    # x0: initial guess for BICG in the form of a VelocityField instance with interior points (e.g. u* of the previous step)
+    # out: optional VelocityField whose arraies (e.g. the interior views of a completed field) receive the solution,
+    # x0 may share them (it is copied before the solve)
+    def Linsys_velocity_solver(self, ALuv, rhsuv, tol=1e-12, solve_method="BICG", x0=None, out=None):
         m = self.mesh.m
         n = self.mesh.n
         dx = self.mesh.dx
@@ -124,8 +304,32 @@ class LinearSystem_solver():
             AL = ALuv[i]                
             A = AL[0]
             A_linop = AL[1]
-            u = scipy.sparse.linalg.bicg(A=A_linop, b=rhs, tol=tol)
-            u = u[0].reshape(row, col)
+            counter = self.iteration_counter("uv"[i])
+            if solve_method == "LU":
+                # back substitution only, the factorisation is computed in setup
+                u = AL[2].solve(rhs)
+            elif solve_method == "FD":
+                # A vec(U) = vec(a*(Ty U + U Bx^T)), solved in the eigen basis of Ty and Bx
+                Vy, Vyinv, Vx, VxinvT, D = AL[2]
+                u = Vy.dot(Vyinv.dot(rhs.reshape(row, col)).dot(VxinvT)/D).dot(Vx.T)
+            else:
+                if x0 is None:
+                    u = scipy.sparse.linalg.bicg(A=A_linop, b=rhs, tol=tol, callback=counter)[0]
+                else:
+                    # warm start through the defect equation A du = rhs - A u0, bicg
+                    # mishandles a nonzero x0 in older scipy releases
+                    u0 = np.array(x0.get_uv()[i], dtype=float).reshape(N)
+                    res = rhs - A_linop.matvec(u0)
+                    res_norm = np.linalg.norm(res)
+                    if res_norm == 0:
+                        u = u0
+                    else:
+                        du_tol = min(tol*np.linalg.norm(rhs)/res_norm, 0.5)
+                        u = u0 + scipy.sparse.linalg.bicg(A=A_linop, b=res, tol=du_tol, callback=counter)[0]
+            u = u.reshape(row, col)
+            if out is not None:
+                out.get_uv()[i][...] = u
+                u = out.get_uv()[i]
             uvl.append(u)
             AL = []
             rhs = 0          
@@ -135,10 +339,98 @@ class LinearSystem_solver():
 	# note that this is the same as the Gauge variable (m) in the Gauge method
         uvstar = structure3.VelocityField(uvl[0], uvl[1], self.mesh)
         return uvstar
+
+    # ensemble version of Linsys_velocity_solver for members sharing one mesh (and so one ALuv)
+    # rhsuv_list: right hand sides of the k members, they are stacked into N x k blocks
+    # "LU" does one multi column back substitution and "FD" transforms the whole k x row x col stack at once,
+    # the Krylov methods ("BICG", "MF") solve the columns one after the other with the shared operator
+    # x0_list: initial guesses of the members (or None)
+    # returns the list of VelocityField instances of the members
+    def Linsys_velocity_block_solver(self, ALuv, rhsuv_list, tol=1e-12, solve_method="BICG", x0_list=None):
+        m = self.mesh.m
+        n = self.mesh.n
+        k = len(rhsuv_list)
+        if solve_method != "LU" and solve_method != "FD":
+            if x0_list is None:
+                x0_list = [None]*k
+            uvstar_list = []
+            iterations = {'u': 0, 'v': 0}
+            for j in xrange(k):
+                uvstar_list.append(self.Linsys_velocity_solver(ALuv, rhsuv_list[j], tol=tol, solve_method=solve_method, x0=x0_list[j]))
+                for key in iterations:
+                    iterations[key] += self.iterations[key]
+            self.iterations.update(iterations)
+            return uvstar_list
+
+        uvl = []
+        for i in xrange(2):
+            ## for u
+            if i == 0:
+                N = m*(n-1)
+                row = m
+                col = n-1
+            ## for v
+            else:
+                N = (m-1)*n
+                row = m-1
+                col = n
+            AL = ALuv[i]
+            if solve_method == "LU":
+                # N x k block of right hand sides
+                R = np.column_stack([rhsuv.get_uv()[i].reshape(N) for rhsuv in rhsuv_list])
+                U = AL[2].solve(R)
+                U = [U[:,j].reshape(row, col) for j in xrange(k)]
+            elif solve_method == "FD":
+                Vy, Vyinv, Vx, VxinvT, D = AL[2]
+                # row x k x col stack of right hand sides, so that every transform is a single matrix product
+                R = np.array([rhsuv.get_uv()[i].reshape(row, col) for rhsuv in rhsuv_list]).transpose(1,0,2)
+                R = Vyinv.dot(R.reshape(row, k*col)).reshape(row*k, col).dot(VxinvT)
+                R = R.reshape(row, k, col)/D[:,np.newaxis,:]
+                U = Vy.dot(R.reshape(row, k*col)).reshape(row*k, col).dot(Vx.T)
+                U = U.reshape(row, k, col).transpose(1,0,2)
+            uvl.append(U)
+        uvstar_list = [structure3.VelocityField(uvl[0][j], uvl[1][j], self.mesh) for j in xrange(k)]
+        return uvstar_list
     
-    # the Pressure Poisson lineary system
-    # returns thePoisson pressure matrix A, preconditioner and its linear operaters (if applicable)
-    def Poisson_pressure_matrix(self, solve_method):
+    # matrix free form of Poisson_Neumann_matrix: -laplace of CentredPotential applied to the reshaped pressure
+    def Poisson_pressure_operator(self):
+        m = self.mesh.m
+        n = self.mesh.n
+
+        def matvec(x):
+            p = structure3.CentredPotential(np.reshape(x, (m,n)), self.mesh)
+            return -p.laplace().get_value().reshape(m*n)
+
+        return slg.LinearOperator(shape=(m*n,m*n), matvec=matvec, rmatvec=matvec, dtype=float)
+
+    # eigenvalues of the (positive definite part of the) Neumann Laplacian used in the Pressure Poisson problem
+    # its eigenvectors are the 2D type II discrete cosine transform basis, so no matrix is needed
+    def Poisson_pressure_eigenvalues(self):
+        m = self.mesh.m
+        n = self.mesh.n
+        dx = self.mesh.dx
+        # for square domain only, lx = ky and dx = dy = dh
+        dh = dx
+        lamx = (2 - 2*np.cos(np.pi*np.arange(n)/n))/(dh**2)
+        lamy = (2 - 2*np.cos(np.pi*np.arange(m)/m))/(dh**2)
+        L = lamy[:,np.newaxis] + lamx[np.newaxis,:]
+        # the zero mode (constant pressure) spans the null space, it is pinned to zero by the solver
+        L[0,0] = 1.0
+        return L
+
+    # solves the Neumann Laplacian system Ap = b (b is a m x n array) with the discrete cosine transform
+    # L: eigenvalues from Poisson_pressure_eigenvalues
+    # the zero mode is pinned, so the mean of b is dropped and p satisfies the zero integral constraint
+    # b can also be a k x m x n stack of right hand sides, which are then transformed together
+    def Poisson_pressure_DCT(self, b, L):
+        bhat = dctn(b, type=2, axes=(-2,-1), norm='ortho')
+        bhat[...,0,0] = 0
+        p = idctn(bhat/L, type=2, axes=(-2,-1), norm='ortho')
+        return p
+
+    # the Neumann Laplacian of the Pressure Poisson problem without the zero integral constraint
+    # it is symmetric positive semi-definite, its null space is the constant pressure
+    def Poisson_Neumann_matrix(self):
         m = self.mesh.m
         n = self.mesh.n
         dx = self.mesh.dx
@@ -157,33 +449,110 @@ class LinearSystem_solver():
         A2 = scipy.sparse.kron(B, scipy.sparse.eye(m,n))
         A = A1+A2
         A = scipy.sparse.csc_matrix(A)
-	# add the zero integral constraint
-	# integration matrix
-	C = self.mesh.integrate(integration_method=self.integration_method)
-	A = scipy.sparse.hstack([A,scipy.sparse.csc_matrix(np.matrix(C).T)])
-	# add one zero column to make sure A is square
-	C = np.append(C,0)
-	A = scipy.sparse.vstack([A,scipy.sparse.csc_matrix(C)])
-	A = scipy.sparse.csc_matrix(A)
-	#print np.linalg.cond(A), 'condition number of the Poisson pressure linear system solver
+        return A
+
+    # the Pressure Poisson lineary system
+    # returns thePoisson pressure matrix A, preconditioner and its linear operaters (if applicable)
+    # the factorisations (multigrid hierarchies) wrapped by the preconditioners come last
+    # permc_spec, drop_tol, fill_factor: options of the incomplete LU factorisation ("ILU"),
+    # None uses the Scipy defaults (see Solver_autotuner for tuning them)
+    def Poisson_pressure_matrix(self, solve_method, permc_spec='MMD_AT_PLUS_A', drop_tol=None, fill_factor=None):
+        m = self.mesh.m
+        n = self.mesh.n
+        # discrete cosine transform solve: nothing is assembled or factorised
+        if solve_method == "DCT":
+            return self.Poisson_pressure_eigenvalues()
+
+        # matrix free geometric multigrid
+        if solve_method == "GMG":
+            return Poisson_multigrid(self.Re, self.mesh, self.integration_method)
+
+        # matrix free conjugate gradients, preconditioned with one geometric multigrid V-cycle
+        if solve_method == "MF":
+            MG = Poisson_multigrid(self.Re, self.mesh, self.integration_method)
+            M = slg.LinearOperator(shape=(m*n,m*n), matvec=MG.precondition, dtype=float)
+            # MG is kept with the preconditioner so that its levels are accounted for (see Memory_report)
+            return [self.Poisson_pressure_operator(), M, MG]
+
+        # the assembled matrices and incomplete factorisations are read from the operator cache if possible
+        data = None
+        if self.cache is not None:
+            key = self.cache.key('pressure', solve_method, permc_spec, drop_tol, fill_factor,
+                                 m, n, self.mesh.dx, self.mesh.dy, self.integration_method)
+            data = self.cache.load(key, self.diagnostics)
+        if data is None:
+            A = self.Poisson_Neumann_matrix()
+            if solve_method == "ILU" or solve_method == "DIR":
+                A = self.Poisson_pressure_bordered(A)
+        else:
+            A = self.cache.load_sparse(data, 'A')
+        A_ILU = None
+
+        # smoothed aggregation multigrid: the hierarchy is built once here and reused every time step
+        # the zero integral constraint is handled by projecting out the null space in the solver,
+        # so A stays symmetric positive semi-definite instead of becoming a bordered saddle point system
+        if solve_method == "AMG":
+            # constant pressure is the (near) null space of A
+            A_AMG = smoothed_aggregation_solver(A.tocsr(), B=np.ones((m*n,1)))
+            precd_AL = [A, A_AMG]
+
+        # preconditioned conjugate gradients on the symmetric positive semi-definite Neumann Laplacian
+        # A itself is singular, so the incomplete factorisation is taken of a slightly shifted A
+        # the preconditioner is its symmetric form L D L^T (see Incomplete_LDLT), conjugate gradients needs a symmetric one
+        elif solve_method == "CG":
+            if data is None:
+                shift = 1e-8*scipy.sparse.diags(A.diagonal())
+                A_ILU = slg.spilu(scipy.sparse.csc_matrix(A+shift), permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0)
+                A_LDLT = Incomplete_LDLT(A_ILU.L, A_ILU.U, A_ILU.perm_r, A_ILU.perm_c)
+            else:
+                A_LDLT = Incomplete_LDLT(self.cache.load_sparse(data, 'ILU_L'), self.cache.load_sparse(data, 'ILU_U'), data['ILU_perm_r'], data['ILU_perm_c'])
+            M = slg.LinearOperator(shape=(m*n,m*n), matvec=A_LDLT.solve)
+            precd_AL = [A, M, A_LDLT]
 
 	# Biconjugate gradient method
-        if solve_method == "ILU":
+        elif solve_method == "ILU":
             A_linop = scipy.sparse.linalg.aslinearoperator(A)
 	    # MMD_AT_PLUS_A, MMD_ATA, COLAMD defines different types of preconditioners
 	    # for more detail, see Scipy.sparse.linalg.spilu documentations
-            A_ILU = slg.spilu(A,permc_spec='MMD_AT_PLUS_A')
-	    #A_ILU = slg.spilu(A,permc_spec='MMD_ATA')
-	    #A_ILU = slg.spilu(A,permc_spec='COLAMD')
+            if data is None:
+                A_ILU = slg.spilu(A, drop_tol=drop_tol, fill_factor=fill_factor, permc_spec=permc_spec)
+            else:
+                A_ILU = self.cache.load_factorisation(data, 'ILU')
             M = slg.LinearOperator(shape=(m*n+1,m*n+1),matvec=A_ILU.solve)
-            return [A_linop, M, A]
+            # the factorisation is kept with its operator so that it is accounted for (see Memory_report)
+            precd_AL = [A_linop, M, A, A_ILU]
         
 	# direct solve
 	elif solve_method == "DIR":
-            return A
+            precd_AL = A
+
+        if self.cache is not None and data is None:
+            arrays = self.cache.sparse_arrays('A', A)
+            if A_ILU is not None:
+                arrays.update(self.cache.factorisation_arrays('ILU', A_ILU))
+            self.cache.store(key, arrays)
+        return precd_AL
 
-    # Solves the Pressure Poisson problem using either Biconjugate gradient method (with ILU factorisation preconditioner) or direct solve
-    def Poisson_pressure_solver(self, rhs, solve_method, precd_AL, tol=1e-12):
+    # adds the zero integral constraint to the Neumann Laplacian A (bordered system of dimension m*n+1)
+    def Poisson_pressure_bordered(self, A):
+	# integration matrix
+	C = self.mesh.integrate(integration_method=self.integration_method)
+	A = scipy.sparse.hstack([A,scipy.sparse.csc_matrix(np.matrix(C).T)])
+	# add one zero column to make sure A is square
+	C = np.append(C,0)
+	A = scipy.sparse.vstack([A,scipy.sparse.csc_matrix(C)])
+	A = scipy.sparse.csc_matrix(A)
+	#print np.linalg.cond(A), 'condition number of the Poisson pressure linear system solver
+        return A
+
+    # Solves the Pressure Poisson problem using either Biconjugate gradient method (with ILU factorisation preconditioner), direct solve,
+    # the discrete cosine transform ("DCT", precd_AL are then the eigenvalues from Poisson_pressure_eigenvalues)
+    # incomplete LDL^T preconditioned conjugate gradients on the Neumann Laplacian ("CG", precd_AL = [A, preconditioner, Incomplete_LDLT])
+    # matrix free conjugate gradients ("MF", precd_AL = [A_linop, multigrid preconditioner, Poisson_multigrid])
+    # smoothed aggregation multigrid preconditioned conjugate gradients ("AMG", precd_AL = [A, multilevel solver])
+    # or matrix free geometric multigrid ("GMG", precd_AL is a Poisson_multigrid instance)
+    # x0: initial guess for the iterative methods (ILU, CG, MF, AMG and GMG) in the form of a CentredPotential instance or m x n array
+    def Poisson_pressure_solver(self, rhs, solve_method, precd_AL, tol=1e-12, x0=None):
         m = self.mesh.m
         n = self.mesh.n
         dt = self.mesh.dt
@@ -198,6 +567,13 @@ class LinearSystem_solver():
 	# add the zero integration constraint to the right hand side
 	rhs = np.hstack([rhs, np.zeros(1)])
         N = m*n
+        counter = self.iteration_counter('phi')
+        if x0 is not None:
+            try:
+                x0 = x0.get_value()
+            except AttributeError:
+                pass
+            x0 = np.array(x0, dtype=float).ravel()
 
 	# Biconjugate gradient method
         if solve_method == "ILU":
@@ -205,15 +581,21 @@ class LinearSystem_solver():
             A_linop = precd_AL[0]
             M = precd_AL[1]
             A = precd_AL[2]
-            p = scipy.sparse.linalg.bicgstab(A=A_linop, b=rhs, tol=tol, maxiter=N, M=M)[0]
-            Ap = A*np.matrix(np.ravel(p)).T
-            r = rhs - np.array(Ap.T)
-            print np.max(np.abs(r)), "residual"
-	    print p[-1], 'lambda constant'
+            if x0 is not None:
+                # the Lagrange multiplier starts from zero
+                x0 = np.hstack([x0, np.zeros(1)])
+            p = scipy.sparse.linalg.bicgstab(A=A_linop, b=rhs, x0=x0, tol=tol, maxiter=N, M=M, callback=counter)[0]
+            if self.diagnostics:
+                Ap = A*np.matrix(np.ravel(p)).T
+                r = rhs - np.array(Ap.T)
+                self.residuals['phi'] = np.max(np.abs(r))
+                print self.residuals['phi'], "residual"
+                print p[-1], 'lambda constant'
 	    p = p[:-1]
             p = p.reshape(m,n)
 	    p = structure3.CentredPotential(p, self.mesh)
-	    print self.mesh.integrate(p, self.integration_method), 'integral of phi'
+            if self.diagnostics:
+                print self.mesh.integrate(p, self.integration_method), 'integral of phi'
             # returns p (phi) variable in the form of CentredPotential object
             return p
         
@@ -221,18 +603,797 @@ class LinearSystem_solver():
         elif solve_method == "DIR":
             A = precd_AL
 	    p = scipy.sparse.linalg.spsolve(A=A, b=rhs)
-            Ap = A*np.matrix(np.ravel(p)).T
-            r = rhs - np.array(Ap.T)
-            print np.max(np.abs(r)), "residual"
-	    print p[-1], 'lambda constant'
+            if self.diagnostics:
+                Ap = A*np.matrix(np.ravel(p)).T
+                r = rhs - np.array(Ap.T)
+                self.residuals['phi'] = np.max(np.abs(r))
+                print self.residuals['phi'], "residual"
+                print p[-1], 'lambda constant'
 	    p = p[:-1]
             p = p.reshape(m,n)
-	    print np.sum(p), 'integral of phi'
+            if self.diagnostics:
+                print np.sum(p), 'integral of phi'
 	    p = structure3.CentredPotential(p, self.mesh)
             # returns p (phi) variable in the form of CentredPotential object
             return p
 
+	# discrete cosine transform solve
+        elif solve_method == "DCT":
+            L = precd_AL
+            b = rhs[:-1].reshape(m,n)
+            # the Lagrange multiplier of the zero integral constraint removes the mean of the rhs
+            C = self.mesh.integrate(integration_method=self.integration_method)
+            lam = np.sum(b)/np.sum(C)
+            p = self.Poisson_pressure_DCT(b, L)
+            if self.diagnostics:
+                print lam, 'lambda constant'
+            p = structure3.CentredPotential(p, self.mesh)
+            if self.diagnostics:
+                print self.mesh.integrate(p, self.integration_method), 'integral of phi'
+            # returns p (phi) variable in the form of CentredPotential object
+            return p
+
+	# conjugate gradient solve (assembled or matrix free)
+        elif solve_method == "CG" or solve_method == "MF":
+            A = precd_AL[0]
+            M = precd_AL[1]
+            b = rhs[:-1]
+            # project the rhs onto the range of A (the multiplier of the zero integral constraint)
+            C = self.mesh.integrate(integration_method=self.integration_method)
+            lam = np.sum(b)/np.sum(C)
+            b = b - lam*C
+            p = scipy.sparse.linalg.cg(A=A, b=b, x0=x0, tol=tol, maxiter=N, M=M, callback=counter)[0]
+            # remove the null space component so that p has zero integral
+            p = p - np.dot(C, p)/np.sum(C)
+            if self.diagnostics:
+                r = b - A*p
+                self.residuals['phi'] = np.max(np.abs(r))
+                print self.residuals['phi'], "residual"
+                print lam, 'lambda constant'
+            p = p.reshape(m,n)
+            p = structure3.CentredPotential(p, self.mesh)
+            if self.diagnostics:
+                print self.mesh.integrate(p, self.integration_method), 'integral of phi'
+            # returns p (phi) variable in the form of CentredPotential object
+            return p
+
+	# algebraic multigrid solve
+        elif solve_method == "AMG":
+            A = precd_AL[0]
+            A_AMG = precd_AL[1]
+            b = rhs[:-1]
+            # project the rhs onto the range of A (the multiplier of the zero integral constraint)
+            C = self.mesh.integrate(integration_method=self.integration_method)
+            lam = np.sum(b)/np.sum(C)
+            b = b - lam*C
+            residuals = []
+            if x0 is None:
+                p = A_AMG.solve(b, tol=tol, maxiter=N, accel='cg', residuals=residuals)
+            else:
+                # warm start through the defect equation, pyamg measures the tolerance
+                # against the preconditioned residual of x0 which is too loose here
+                res = b - A*x0
+                res_norm = np.linalg.norm(res)
+                if res_norm == 0:
+                    p = x0
+                    residuals = [0.0]
+                else:
+                    dp_tol = min(tol*np.linalg.norm(b)/res_norm, 0.5)
+                    p = x0 + A_AMG.solve(res, tol=dp_tol, maxiter=N, accel='cg', residuals=residuals)
+            # remove the null space component so that p has zero integral
+            p = p - np.dot(C, p)/np.sum(C)
+            self.iterations['phi'] = len(residuals)-1
+            if self.diagnostics:
+                r = b - A*p
+                self.residuals['phi'] = np.max(np.abs(r))
+                print self.residuals['phi'], "residual"
+                print self.iterations['phi'], 'AMG iterations'
+                print lam, 'lambda constant'
+            p = p.reshape(m,n)
+            p = structure3.CentredPotential(p, self.mesh)
+            if self.diagnostics:
+                print self.mesh.integrate(p, self.integration_method), 'integral of phi'
+            # returns p (phi) variable in the form of CentredPotential object
+            return p
+
+	# geometric multigrid solve
+        elif solve_method == "GMG":
+            MG = precd_AL
+            b = rhs[:-1].reshape(m,n)
+            C = self.mesh.integrate(integration_method=self.integration_method)
+            lam = np.sum(b)/np.sum(C)
+            p = MG.solve(b, tol=tol, x0=x0)
+            self.iterations['phi'] = MG.iterations
+            # the multigrid residual is computed by the V-cycles anyway
+            self.residuals['phi'] = MG.residual
+            if self.diagnostics:
+                print MG.residual, "residual"
+                print MG.iterations, 'GMG iterations'
+                print lam, 'lambda constant'
+            p = structure3.CentredPotential(p, self.mesh)
+            if self.diagnostics:
+                print self.mesh.integrate(p, self.integration_method), 'integral of phi'
+            # returns p (phi) variable in the form of CentredPotential object
+            return p
+
+    # ensemble version of Poisson_pressure_solver for members sharing one mesh (and so one precd_AL)
+    # rhs_list: right hand sides of the k members in the form of CentredPotential instances
+    # "DIR" solves the (m*n+1) x k block in one call and "DCT" transforms the whole k x m x n stack at once,
+    # the iterative methods solve the members one after the other with the shared preconditioner
+    # x0_list: initial guesses of the members (or None)
+    # returns the list of CentredPotential instances of the members
+    def Poisson_pressure_block_solver(self, rhs_list, solve_method, precd_AL, tol=1e-12, x0_list=None):
+        m = self.mesh.m
+        n = self.mesh.n
+        k = len(rhs_list)
+        if solve_method == "DIR" or solve_method == "DCT":
+            # direct solves, no iterations (as in Poisson_pressure_solver)
+            self.iterations['phi'] = 0
+        if solve_method == "DIR":
+            A = precd_AL
+            # add the zero integration constraint to the right hand sides
+            R = np.vstack([np.column_stack([(-rhs.get_value()).reshape(m*n) for rhs in rhs_list]), np.zeros((1,k))])
+            P = scipy.sparse.linalg.spsolve(A=A, b=R).reshape(m*n+1, k)
+            return [structure3.CentredPotential(P[:-1,j].reshape(m,n), self.mesh) for j in xrange(k)]
+        elif solve_method == "DCT":
+            L = precd_AL
+            R = np.array([-rhs.get_value() for rhs in rhs_list])
+            P = self.Poisson_pressure_DCT(R, L)
+            return [structure3.CentredPotential(P[j], self.mesh) for j in xrange(k)]
+
+        if x0_list is None:
+            x0_list = [None]*k
+        p_list = []
+        iterations = 0
+        for j in xrange(k):
+            p_list.append(self.Poisson_pressure_solver(rhs_list[j], solve_method, precd_AL, tol=tol, x0=x0_list[j]))
+            iterations += self.iterations.get('phi', 0)
+        self.iterations['phi'] = iterations
+        return p_list
+
+class Operator_cache():
+    '''This class stores assembled sparse matrices and (incomplete) LU factorisations in a cache directory
+       Every entry is a .npz file named after the SHA-1 hash of the parameters which define it
+       (e.g. the solve method, m, n, dt and Re), so repeated runs of the same problem skip the assembly and factorisation.
+       The least recently used entries are removed once the directory grows beyond max_bytes.'''
+
+    def __init__(self, cache_dir='operator_cache', max_bytes=2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    # content address of the entry defined by params
+    def key(self, *params):
+        return hashlib.sha1(repr(params).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    # returns the arrays of the entry as a dictionary or None if it is not in the cache
+    # diagnostics: print the hits (LinearSystem_solver passes its diagnostics setting)
+    def load(self, key, diagnostics=True):
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        # the modification time records the last use for the eviction
+        os.utime(path, None)
+        with np.load(path) as f:
+            data = dict(f)
+        if diagnostics:
+            print path, 'loaded from the operator cache'
+        return data
+
+    def store(self, key, arrays):
+        path = self.path(key)
+        # write to a temporary file first, so that an interrupted run never leaves a broken entry
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.rename(tmp_path, path)
+        self.evict(keep=path)
+
+    # removes the least recently used entries until the cache is at most max_bytes large
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.npz') and path != keep:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+        total = sum(entry[1] for entry in entries)
+        if keep is not None and os.path.exists(keep):
+            total += os.path.getsize(keep)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    # CSC matrix A as the arrays name_data, name_indices, name_indptr and name_shape
+    def sparse_arrays(self, name, A):
+        A = scipy.sparse.csc_matrix(A)
+        return {name + '_data': A.data, name + '_indices': A.indices,
+                name + '_indptr': A.indptr, name + '_shape': np.array(A.shape)}
+
+    def load_sparse(self, data, name):
+        return scipy.sparse.csc_matrix((data[name + '_data'], data[name + '_indices'], data[name + '_indptr']),
+                                       shape=tuple(data[name + '_shape']))
+
+    # the triangular factors and permutations of a SuperLU object (from splu or spilu)
+    def factorisation_arrays(self, name, F):
+        arrays = self.sparse_arrays(name + '_L', F.L)
+        arrays.update(self.sparse_arrays(name + '_U', F.U))
+        arrays[name + '_perm_r'] = F.perm_r
+        arrays[name + '_perm_c'] = F.perm_c
+        return arrays
+
+    def load_factorisation(self, data, name):
+        return Cached_factorisation(self.load_sparse(data, name + '_L'), self.load_sparse(data, name + '_U'),
+                                    data[name + '_perm_r'], data[name + '_perm_c'])
+
+class Cached_factorisation():
+    '''This class rebuilds the solve of a SuperLU object from its factors Pr A Pc = L U
+       The triangular factors are handed to SuperLU again with the natural ordering and without pivoting,
+       which creates no fill-in and is much cheaper than the original factorisation.'''
+
+    def __init__(self, L, U, perm_r, perm_c):
+        options = dict(SymmetricMode=True)
+        self.L = slg.splu(L, permc_spec='NATURAL', diag_pivot_thresh=0, options=options)
+        self.U = slg.splu(U, permc_spec='NATURAL', diag_pivot_thresh=0, options=options)
+        self.perm_r = perm_r
+        self.perm_c = perm_c
+
+    # solves A x = b, b can be a vector or a N x k block
+    def solve(self, b):
+        z = np.empty(np.shape(b))
+        z[self.perm_r] = b
+        y = self.U.solve(self.L.solve(z))
+        return y[self.perm_c]
+
+class Incomplete_LDLT():
+    '''This class builds the symmetric preconditioner M = Pr^T L D L^T Pr (D = diag(U)) from an incomplete factorisation
+       Pr A Pc = L U of a symmetric positive definite A (without pivoting, so Pr = Pc).
+       The solve U^{-1} L^{-1} of the incomplete factors is not symmetric once entries are dropped,
+       whereas conjugate gradients needs a symmetric positive definite preconditioner.
+       A factorisation with Pr != Pc (e.g. another permc_spec or pivoting) gives no symmetric M, ValueError is raised.'''
+
+    def __init__(self, L, U, perm_r, perm_c):
+        if not np.array_equal(perm_r, perm_c):
+            raise ValueError('the incomplete LDL^T preconditioner needs the same row and column permutations')
+        self.L = slg.splu(scipy.sparse.csc_matrix(L), permc_spec='NATURAL', diag_pivot_thresh=0, options=dict(SymmetricMode=True))
+        self.D = U.diagonal()
+        self.perm_r = perm_r
+
+    # returns M^{-1} b for a vector b
+    def solve(self, b):
+        z = np.empty(np.shape(b))
+        z[self.perm_r] = b
+        y = self.L.solve(z)/self.D
+        y = self.L.solve(y, trans='T')
+        return y[self.perm_r]
+
+class Poisson_multigrid():
+    '''This class constructs a matrix free geometric multigrid solver for the Pressure Poisson problem
+       The Neumann Laplacian is applied directly on the ghost padded layout of CentredPotential.complete().
+       The uniform pressure grid is coarsened by a factor of two as long as its size is even,
+       the coarsest grid is solved with the discrete cosine transform'''
+
+    def __init__(self, Re, mesh, integration_method='Riemann', npre=2, npost=2, min_size=4):
+        self.Re = Re
+        self.mesh = mesh
+        self.integration_method = integration_method
+        # number of pre and post smoothing sweeps (red-black Gauss Seidel)
+        self.npre = npre
+        self.npost = npost
+        # levels[0] is the finest grid
+        # only the grid size and spacing of the coarse meshes are used (by CentredPotential)
+        self.levels = [mesh]
+        m = mesh.m
+        n = mesh.n
+        while m % 2 == 0 and n % 2 == 0 and min(m, n)//2 >= min_size:
+            m = m//2
+            n = n//2
+            cmesh = copy.copy(self.levels[-1])
+            cmesh.m = m
+            cmesh.n = n
+            cmesh.gds = [m, n]
+            cmesh.dx = 2*cmesh.dx
+            cmesh.dy = 2*cmesh.dy
+            self.levels.append(cmesh)
+        self.invdiag = []
+        self.red = []
+        for lmesh in self.levels:
+            m = lmesh.m
+            n = lmesh.n
+            # a ghost node equals its neighbour (Neumann condition), so cells on the boundary
+            # have one (or two in the corners) fewer contributions to the diagonal
+            diag = 4*np.ones((m,n))
+            diag[0,:] -= 1
+            diag[-1,:] -= 1
+            diag[:,0] -= 1
+            diag[:,-1] -= 1
+            self.invdiag.append((lmesh.dx**2)/diag)
+            i, j = np.indices((m,n))
+            self.red.append((i+j) % 2 == 0)
+        # the coarsest grid is solved directly
+        self.coarse_solver = LinearSystem_solver(Re, self.levels[-1], integration_method)
+        self.L_coarse = self.coarse_solver.Poisson_pressure_eigenvalues()
+        self.iterations = 0
+        self.residual = 0
+
+    # residual f - Ap where A = -laplace is the positive Neumann Laplacian
+    def residual_field(self, k, p, f):
+        return f + structure3.CentredPotential(p, self.levels[k]).laplace().get_value()
+
+    # red-black Gauss Seidel sweeps, the ghost nodes are refreshed (by CentredPotential.complete) after each colour
+    # reverse=True sweeps black before red, so that a V-cycle with reversed post smoothing is symmetric
+    def smooth(self, k, p, f, nsweep, reverse=False):
+        red = self.red[k]
+        colours = [red, ~red]
+        if reverse:
+            colours = colours[::-1]
+        for i in xrange(nsweep):
+            for c in colours:
+                r = self.residual_field(k, p, f)
+                p[c] += r[c]*self.invdiag[k][c]
+        return p
+
+    # restriction: average of the 4 fine cells inside each coarse cell
+    def restrict(self, r):
+        return 0.25*(r[0::2,0::2] + r[1::2,0::2] + r[0::2,1::2] + r[1::2,1::2])
+
+    # prolongation: bilinear interpolation between cell centres (weights 9/16, 3/16, 3/16, 1/16)
+    # the Neumann ghost nodes of the coarse correction are used along the boundary
+    def prolong(self, k, ec):
+        mc = self.levels[k+1].m
+        nc = self.levels[k+1].n
+        ecmp = structure3.CentredPotential(ec, self.levels[k+1]).complete()
+        e = np.zeros((2*mc,2*nc))
+        for a in xrange(2):
+            for b in xrange(2):
+                # neighbouring coarse cells in y (a) and x (b) direction in the padded layout
+                ry = slice(2*a, mc+2*a)
+                rx = slice(2*b, nc+2*b)
+                e[a::2,b::2] = (9.0/16)*ec + (3.0/16)*ecmp[ry,1:nc+1] +\
+                               (3.0/16)*ecmp[1:mc+1,rx] + (1.0/16)*ecmp[ry,rx]
+        return e
+
+    def vcycle(self, k, p, f):
+        if k == len(self.levels)-1:
+            return self.coarse_solver.Poisson_pressure_DCT(f, self.L_coarse)
+        p = self.smooth(k, p, f, self.npre)
+        fc = self.restrict(self.residual_field(k, p, f))
+        ec = self.vcycle(k+1, np.zeros(fc.shape), fc)
+        p += self.prolong(k, ec)
+        p = self.smooth(k, p, f, self.npost, reverse=True)
+        return p
+
+    # one V-cycle from a zero initial guess, used as the preconditioner of the matrix free conjugate gradients
+    def precondition(self, r):
+        r = np.reshape(r, (self.mesh.m, self.mesh.n))
+        C = self.mesh.integrate(integration_method=self.integration_method).reshape(r.shape)
+        f = r - (np.sum(r)/np.sum(C))*C
+        p = self.vcycle(0, np.zeros(f.shape), f)
+        p = p - np.sum(C*p)/np.sum(C)
+        return p.reshape(self.mesh.m*self.mesh.n)
+
+    # solves Ap = b up to the relative tolerance tol with V-cycles
+    # b is projected onto the range of A and p is returned with zero integral
+    def solve(self, b, tol=1e-12, maxiter=100, x0=None):
+        C = self.mesh.integrate(integration_method=self.integration_method).reshape(b.shape)
+        f = b - (np.sum(b)/np.sum(C))*C
+        if x0 is None:
+            p = np.zeros(f.shape)
+        else:
+            p = np.array(x0, dtype=float).reshape(f.shape)
+        bnorm = np.linalg.norm(f)
+        if bnorm == 0:
+            bnorm = 1.0
+        self.iterations = 0
+        r = self.residual_field(0, p, f)
+        while np.linalg.norm(r) > tol*bnorm and self.iterations < maxiter:
+            p = self.vcycle(0, p, f)
+            r = self.residual_field(0, p, f)
+            self.iterations += 1
+        self.residual = np.max(np.abs(r))
+        # remove the null space component so that p has zero integral
+        p = p - np.sum(C*p)/np.sum(C)
+        return p
+
+class Solver_autotuner():
+    '''This class selects the pressure and velocity solve methods for solve_method='auto' (velocity_solve_method='auto')
+       Every available method (and the incomplete LU with different orderings, drop tolerances and fill factors)
+       is set up and timed on a few random right hand sides for the current (m, n, dt, Re).
+       The fastest method whose solution agrees with a direct solve is chosen, where the cost is the set up time
+       plus Tn times the solve time. The choices are stored in the JSON file table_file, so every problem size
+       is only benchmarked once. table_file defaults to solver_tuning.json in the directory of the operator cache
+       (cache, an Operator_cache instance); without either the table is only kept in memory for the running process.'''
+
+    pressure_methods = ['ILU', 'DIR', 'CG', 'DCT', 'AMG', 'GMG', 'MF']
+    # (permc_spec, drop_tol, fill_factor) candidates of the incomplete LU preconditioner
+    ilu_options = [(permc_spec, drop_tol, fill_factor) for permc_spec in ['MMD_AT_PLUS_A', 'MMD_ATA', 'COLAMD']
+                   for (drop_tol, fill_factor) in [(1e-4, 10), (1e-3, 10), (1e-5, 20)]]
+    velocity_methods = ['BICG', 'LU', 'FD', 'MF']
+    # table of the runs without a table file
+    memory_table = {}
+
+    def __init__(self, Re, mesh, integration_method='Riemann', table_file=None, nsolve=3, rtol=1e-8, cache=None):
+        self.Re = Re
+        self.mesh = mesh
+        self.integration_method = integration_method
+        if table_file is None and cache is not None:
+            table_file = os.path.join(cache.cache_dir, 'solver_tuning.json')
+        self.table_file = table_file
+        # number of timed solves of every method
+        self.nsolve = nsolve
+        # accepted error of a method relative to the direct solve
+        self.rtol = rtol
+        # without the residual checks and their output, which would be timed with the solves
+        self.linsys_solver = LinearSystem_solver(Re, mesh, integration_method, diagnostics=False)
+
+    # key of the current problem in the table
+    def key(self):
+        return '%dx%d dt=%.6g Re=%.6g %s' % (self.mesh.m, self.mesh.n, self.mesh.dt, self.Re, self.integration_method)
+
+    def load_table(self):
+        if self.table_file is None:
+            return dict(Solver_autotuner.memory_table)
+        if not os.path.exists(self.table_file):
+            return {}
+        with open(self.table_file, 'r') as f:
+            return json.load(f)
+
+    def save_table(self, table):
+        if self.table_file is None:
+            Solver_autotuner.memory_table.update(table)
+            return
+        with open(self.table_file, 'w') as f:
+            json.dump(table, f, indent=2, sort_keys=True)
+
+    # returns [solve_method, pressure_options, velocity_solve_method], methods other than 'auto' are kept
+    # pressure_options are the keyword arguments of Poisson_pressure_matrix
+    def select(self, solve_method, velocity_solve_method):
+        if solve_method != 'auto' and velocity_solve_method != 'auto':
+            return [solve_method, {}, velocity_solve_method]
+        table = self.load_table()
+        entry = table.get(self.key(), {})
+        if 'pressure' not in entry and solve_method == 'auto':
+            entry['pressure'] = self.tune_pressure()
+        if 'velocity' not in entry and velocity_solve_method == 'auto':
+            entry['velocity'] = self.tune_velocity()
+        table[self.key()] = entry
+        self.save_table(table)
+        pressure_options = {}
+        if solve_method == 'auto':
+            solve_method = entry['pressure']['solve_method']
+            pressure_options = entry['pressure']['options']
+        if velocity_solve_method == 'auto':
+            velocity_solve_method = entry['velocity']['solve_method']
+        print solve_method, pressure_options, velocity_solve_method, 'selected solve methods'
+        return [solve_method, pressure_options, velocity_solve_method]
+
+    # total cost of a method: set up time + Tn * (average) solve time
+    def cost(self, setup_time, solve_time):
+        return setup_time + max(self.mesh.Tn, 1)*solve_time/self.nsolve
+
+    def tune_pressure(self):
+        m = self.mesh.m
+        n = self.mesh.n
+        C = self.mesh.integrate(integration_method=self.integration_method).reshape(m,n)
+        rhs = [structure3.CentredPotential(np.random.rand(m,n), self.mesh) for i in xrange(self.nsolve)]
+        L = self.linsys_solver.Poisson_pressure_eigenvalues()
+        candidates = [(method, {}) for method in self.pressure_methods if method != 'ILU']
+        candidates += [('ILU', {'permc_spec': permc_spec, 'drop_tol': drop_tol, 'fill_factor': fill_factor})
+                       for (permc_spec, drop_tol, fill_factor) in self.ilu_options]
+        best = None
+        for method, options in candidates:
+            try:
+                start = time.time()
+                precd_AL = self.linsys_solver.Poisson_pressure_matrix(method, **options)
+                setup_time = time.time() - start
+                start = time.time()
+                p = [self.linsys_solver.Poisson_pressure_solver(b, method, precd_AL) for b in rhs]
+                solve_time = time.time() - start
+            except (RuntimeError, ValueError, np.linalg.LinAlgError):
+                # e.g. a singular incomplete factorisation
+                continue
+            # the discrete cosine transform solve is exact, solutions are compared up to a constant
+            error = 0
+            for pi, b in zip(p, rhs):
+                d = pi.get_value() - self.linsys_solver.Poisson_pressure_DCT(-b.get_value(), L)
+                d = d - np.sum(C*d)/np.sum(C)
+                error = max(error, np.max(np.abs(d))/np.max(np.abs(pi.get_value())))
+            cost = self.cost(setup_time, solve_time)
+            print method, options, cost, error, 'pressure solve cost and error'
+            if error < self.rtol and (best is None or cost < best[0]):
+                best = [cost, method, options]
+        if best is None:
+            print 'no pressure solve method passed the tuning, ILU is used'
+            return {'solve_method': 'ILU', 'options': {}, 'cost': None}
+        return {'solve_method': best[1], 'options': best[2], 'cost': best[0]}
+
+    def tune_velocity(self):
+        m = self.mesh.m
+        n = self.mesh.n
+        rhs = [structure3.VelocityField(np.random.rand(m,n-1), np.random.rand(m-1,n), self.mesh) for i in xrange(self.nsolve)]
+        ALuv = [self.linsys_solver.Linsys_velocity_matrix(velocity, "LU") for velocity in ["u", "v"]]
+        reference = [self.linsys_solver.Linsys_velocity_solver(ALuv, b, solve_method="LU") for b in rhs]
+        best = None
+        for method in self.velocity_methods:
+            try:
+                start = time.time()
+                ALuv = [self.linsys_solver.Linsys_velocity_matrix(velocity, method) for velocity in ["u", "v"]]
+                setup_time = time.time() - start
+                start = time.time()
+                uv = [self.linsys_solver.Linsys_velocity_solver(ALuv, b, solve_method=method) for b in rhs]
+                solve_time = time.time() - start
+            except (RuntimeError, ValueError, np.linalg.LinAlgError):
+                continue
+            error = 0
+            for uvi, uvr in zip(uv, reference):
+                for i in xrange(2):
+                    error = max(error, np.max(np.abs(uvi.get_uv()[i] - uvr.get_uv()[i]))/np.max(np.abs(uvr.get_uv()[i])))
+            cost = self.cost(setup_time, solve_time)
+            print method, cost, error, 'velocity solve cost and error'
+            if error < self.rtol and (best is None or cost < best[0]):
+                best = [cost, method]
+        if best is None:
+            print 'no velocity solve method passed the tuning, BICG is used'
+            return {'solve_method': 'BICG', 'cost': None}
+        return {'solve_method': best[1], 'cost': best[0]}
+
+class Memory_report():
+    '''This class accounts for the memory of the solvers
+       object_bytes counts the bytes of the numpy arrays held by an object (sparse matrices, factorisations,
+       multigrid hierarchies, velocity fields ... and lists or dictionaries of them), arrays shared between objects
+       are only counted once. setup_bytes applies it to the initial set up parameters of the projection methods.
+       usage returns the current and peak memory: the traced allocations if tracemalloc is available (Python >= 3.4
+       or the pytracemalloc backport), otherwise a sample of the resident set size of the process (label is then 'rss').
+       reset_peak starts a new peak: the traces are cleared (so the peak is that of the allocations made since), or
+       without tracemalloc the peak is the largest resident set size sampled by usage since.'''
+
+    def __init__(self):
+        self.tracing = tracemalloc is not None
+        # 'memory' for traced allocations, 'rss' for resident set size samples
+        self.label = 'memory' if self.tracing else 'rss'
+        self.rss_peak = None
+
+    def start(self):
+        if self.tracing and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # returns [current, peak] memory in bytes since the last reset_peak
+    # (both are None if neither tracemalloc nor the resident set size is available)
+    def usage(self):
+        if self.tracing:
+            return list(tracemalloc.get_traced_memory())
+        current = self.rss()
+        if current is not None:
+            self.rss_peak = max(self.rss_peak or 0, current)
+        return [current, self.rss_peak]
+
+    # starts a new peak measurement (e.g. at the beginning of every time step)
+    # clear_traces also resets the traced peak, tracemalloc.reset_peak is only available in Python >= 3.9
+    def reset_peak(self):
+        if self.tracing:
+            tracemalloc.clear_traces()
+        self.rss_peak = None
+
+    # current resident set size of the process in bytes
+    def rss(self):
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1])*resource.getpagesize()
+        except IOError:
+            # no /proc file system, ru_maxrss is the peak of the whole process and not a sample
+            return None
+
+    # bytes of the numpy arrays held by obj (recursively), objects in seen are skipped
+    def object_bytes(self, obj, seen=None):
+        if seen is None:
+            seen = set()
+        if obj is None or id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        if isinstance(obj, np.ndarray):
+            if obj.base is not None:
+                # a view, the memory belongs to the base array
+                return self.object_bytes(obj.base, seen)
+            return obj.nbytes
+        if obj.__class__.__name__ == 'SuperLU':
+            # L and U factors (values and row indices) and the two permutations
+            return obj.nnz*(obj.L.dtype.itemsize + 4) + 2*obj.shape[0]*4
+        if isinstance(obj, (list, tuple)):
+            return sum(self.object_bytes(item, seen) for item in obj)
+        if isinstance(obj, dict):
+            return sum(self.object_bytes(item, seen) for item in obj.values())
+        if isinstance(obj, (structure3.mesh, Solver_profiler)):
+            # the mesh is shared by all objects, it is reported on its own
+            return 0
+        if hasattr(obj, '__dict__'):
+            items = obj.__dict__.values()
+        elif hasattr(obj, '__slots__'):
+            # VelocityField and CentredPotential have no __dict__
+            items = [getattr(obj, name, None) for name in obj.__slots__]
+        else:
+            return 0
+        return sum(self.object_bytes(item, seen) for item in items)
+
+    # bytes held by the initial set up parameters of Gauge_method, Alg1_method, Alg2_method or Alg3_method
+    # the pressure system and the u and v velocity systems come first in all of them, the rest are the initial fields
+    def setup_bytes(self, initial_setup_parameters, mesh=None):
+        seen = set()
+        report = {'pressure system': self.object_bytes(initial_setup_parameters[0], seen),
+                  'u velocity system': self.object_bytes(initial_setup_parameters[1], seen),
+                  'v velocity system': self.object_bytes(initial_setup_parameters[2], seen),
+                  'initial fields': self.object_bytes(initial_setup_parameters[3:], seen)}
+        if mesh is not None:
+            report['mesh'] = sum(self.object_bytes(item) for item in mesh.__dict__.values())
+        return report
+
+class Solver_profiler():
+    '''This class times the stages (forcing, convection, diffusion, boundary correction, velocity solve,
+       ghost completion, divergence, Poisson solve, update ...) of every time step of the iterative solvers
+       phase(name) ends the running stage and starts the next one, so every stage is a single line in the loops.
+       The iteration counts and residuals of the solves are recorded with the timings and can be saved as JSON or CSV.
+       diagnostics=False turns off the expensive checks of LinearSystem_solver (e.g. the residual recomputation)
+       and the per step output (solver iterations, integral of p, ...), which the profile records instead.
+       memory=True also records the memory allocated by every stage ('memory <stage>', or 'rss <stage>' if it is the change
+       of the resident set size samples) and the peak memory of every step ('peak memory', or 'peak rss' if it is the largest
+       resident set size sampled between the stages, see Memory_report).'''
+
+    def __init__(self, diagnostics=True, memory=False):
+        self.diagnostics = diagnostics
+        self.memory = memory
+        # bytes held by the set up objects (from Memory_report.setup_bytes), saved with the profile
+        self.setup_memory = {}
+        if memory:
+            self.memory_report = Memory_report()
+            self.memory_report.start()
+        # one dictionary per time step
+        self.steps = []
+        self.current = None
+        self.current_phase = None
+        self.phase_start = 0
+        self.step_start = 0
+
+    def start_step(self, t):
+        self.current = {'step': t}
+        self.current_phase = None
+        self.step_start = time.time()
+        if self.memory:
+            self.memory_report.reset_peak()
+            self.phase_memory = self.memory_report.usage()[0]
+
+    def phase(self, name):
+        now = time.time()
+        if self.current_phase is not None:
+            self.current[self.current_phase] = self.current.get(self.current_phase, 0) + now - self.phase_start
+        if self.memory:
+            # memory allocated (and not yet released) during the stage
+            current = self.memory_report.usage()[0]
+            if self.current_phase is not None and current is not None:
+                key = self.memory_report.label + ' ' + self.current_phase
+                self.current[key] = self.current.get(key, 0) + current - self.phase_memory
+            self.phase_memory = current
+        self.current_phase = name
+        self.phase_start = now
+
+    # iterations, residuals: dictionaries of LinearSystem_solver (keys 'u', 'v', 'phi')
+    def end_step(self, iterations=None, residuals=None):
+        self.phase(None)
+        self.current['total'] = time.time() - self.step_start
+        if self.memory:
+            self.current['peak ' + self.memory_report.label] = self.memory_report.usage()[1]
+        for key, value in (iterations or {}).items():
+            self.current['iterations ' + key] = value
+        for key, value in (residuals or {}).items():
+            self.current['residual ' + key] = float(value)
+        self.steps.append(self.current)
+        self.current = None
+
+    # sum of every timer (and iteration count) over all steps
+    def totals(self):
+        totals = {}
+        for step in self.steps:
+            for key, value in step.items():
+                if key.startswith('peak'):
+                    # None if the memory cannot be sampled
+                    if value is not None:
+                        totals[key] = max(totals.get(key) or 0, value)
+                    else:
+                        totals.setdefault(key, None)
+                elif key != 'step' and not key.startswith('residual'):
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    # saves the profile as CSV (one row per step) if filename ends with .csv, as JSON otherwise
+    def save(self, filename):
+        if filename.endswith('.csv'):
+            keys = ['step'] + sorted(set(key for step in self.steps for key in step if key != 'step'))
+            with open(filename, 'w') as f:
+                f.write(','.join(keys) + '\n')
+                for step in self.steps:
+                    f.write(','.join(str(step.get(key, '')) for key in keys) + '\n')
+        else:
+            with open(filename, 'w') as f:
+                json.dump({'steps': self.steps, 'totals': self.totals(), 'setup memory': self.setup_memory}, f, indent=2, sort_keys=True)
+
 # below constructs the 4 different Projection method solvers (Gauge, Alg 1, Alg 2, Alg 3)
+class Time_levels():
+    '''This class holds a field (numpy array, VelocityField or CentredPotential) at the time levels n-1, n and n+1
+       of the iterative solvers in three persistent buffers (copies of the initial fields, so the set up is not modified).
+       rotate() swaps the references at the end of a step: level n becomes n-1, level n+1 becomes n and the buffer
+       of level n-1 is reused for the next level n+1. The loops write the new level into self.new instead of copying,
+       a new level passed to rotate() is written into the buffer in place.'''
+    def __init__(self, old, current):
+        self.old = old.copy()
+        self.current = current.copy()
+        self.new = current.copy()
+
+    # new: the field at level n+1 if it was not written into the buffer self.new
+    def rotate(self, new=None):
+        if new is not None:
+            # in place operations, so the buffer is kept (numpy array, VelocityField or CentredPotential)
+            self.new *= 0
+            self.new += new
+        self.old, self.current, self.new = self.current, self.new, self.old
+
+class Carried_terms():
+    '''This class carries the terms evaluated at a time level forward to the following steps of one run of an
+       iterative solver, e.g. the convection of u^n at step n is the convection of u^{n-1} at step n+1.
+       Every run creates a new instance, so nothing is carried over a restart. aliases maps a time level to
+       the level holding the same field (the set up starts with u^{-1} = u^0). Only the last two levels are kept.'''
+    def __init__(self, aliases=None):
+        self.aliases = aliases or {}
+        self.terms = {}
+
+    # returns the term name at level, evaluate() is only called if the term was not carried forward
+    def term(self, name, level, evaluate):
+        level = self.aliases.get(level, level)
+        if (name, level) not in self.terms:
+            self.store(name, level, evaluate())
+        return self.terms[(name, level)]
+
+    def store(self, name, level, value):
+        self.terms[(name, level)] = value
+        for key in [key for key in self.terms if key[0] == name and key[1] < level - 1]:
+            del self.terms[key]
+
+class Boundary_injection():
+    '''This class adds the boundary terms of the velocity linear systems (Linsys_velocity_matrix) to the right hand side.
+       Only the first and last rows and columns of the interior u and v arrays are changed, in place, so no full size
+       arrays are allocated. The boundary values passed in include the ghost corrections (e.g. the gradient of phi)
+       of the method. It is shared by the correct_boundary functions of the 4 solvers.'''
+    def __init__(self, Re, mesh):
+        lam = mesh.dt/(2.0*Re)
+        self.wx = lam/(mesh.dx**2)
+        self.wy = lam/(mesh.dy**2)
+
+    # rhs: VelocityField with interior u (m x n-1) and v (m-1 x n)
+    # ubnd = [uN, uS, uW, uE] (lengths n-1, n-1, m, m), vbnd = [vN, vS, vW, vE] (lengths n, n, m-1, m-1)
+    # u uses ghost nodes on the North and South boundaries and v on the West and East ones (hence the 16/5)
+    def inject(self, rhs, ubnd, vbnd):
+        u, v = rhs.get_uv()
+        uN, uS, uW, uE = ubnd
+        vN, vS, vW, vE = vbnd
+        self.inject_edges(u, (16.0/5)*uN*self.wy, (16.0/5)*uS*self.wy, uW*self.wx, uE*self.wx)
+        self.inject_edges(v, vN*self.wy, vS*self.wy, (16.0/5)*vW*self.wx, (16.0/5)*vE*self.wx)
+        return rhs
+
+    # adds the North, South, West and East terms to the edges of a
+    # the corners receive the sum of their two terms, the terms may be scalars (e.g. the walls of the driven cavity)
+    def inject_edges(self, a, N, S, W, E):
+        N, S = [np.full(a.shape[1], term) for term in (N, S)]
+        W, E = [np.full(a.shape[0], term) for term in (W, E)]
+        N[0] += W[0]
+        N[-1] += E[0]
+        S[0] += W[-1]
+        S[-1] += E[-1]
+        a[0,:] += N
+        a[-1,:] += S
+        a[1:-1,0] += W[1:-1]
+        a[1:-1,-1] += E[1:-1]
+
 class Gauge_method():
     '''This class constructs the Gauge method solver'''
 
@@ -253,19 +1414,25 @@ class Gauge_method():
         self.dx = mesh.dx
         self.dy = mesh.dy
         self.mesh = mesh
+        self.boundary_injection = Boundary_injection(Re, mesh)
     
     # initial set up
-    def setup(self, InCond_uv_init, Boundary_uv_type, solve_method='ILU', integration_method='Riemann'):
+    def setup(self, InCond_uv_init, Boundary_uv_type, solve_method='ILU', integration_method='Riemann', velocity_solve_method='BICG', warm_start=False, operator_cache=None, profiler=None):
         ## InCond_uv: specifies the velocity initial condition 
-        linsys_solver = LinearSystem_solver(self.Re, self.mesh, integration_method)
-	phi_mat = linsys_solver.Poisson_pressure_matrix(solve_method)
-        m1_mat = linsys_solver.Linsys_velocity_matrix("u")
-        m2_mat = linsys_solver.Linsys_velocity_matrix("v")
+        # the cache hits are only printed with the diagnostics of the profiler
+        linsys_solver = LinearSystem_solver(self.Re, self.mesh, integration_method, cache=operator_cache, diagnostics=profiler is None or profiler.diagnostics)
+        # 'auto' methods are replaced by the (cached) choice of Solver_autotuner
+        solve_method, pressure_options, velocity_solve_method = Solver_autotuner(self.Re, self.mesh, integration_method, cache=operator_cache).select(solve_method, velocity_solve_method)
+	phi_mat = linsys_solver.Poisson_pressure_matrix(solve_method, **pressure_options)
+        m1_mat = linsys_solver.Linsys_velocity_matrix("u", velocity_solve_method)
+        m2_mat = linsys_solver.Linsys_velocity_matrix("v", velocity_solve_method)
         
         InCond_uvcmp = structure3.VelocityComplete(self.mesh, InCond_uv_init, 0).complete(Boundary_uv_type)
         uv_cmp = copy.copy(InCond_uvcmp)        
         mn_cmp = copy.copy(uv_cmp)
-	initial_setup_parameters = [phi_mat, m1_mat, m2_mat, InCond_uvcmp, uv_cmp, mn_cmp, integration_method, solve_method]
+        if profiler is None:
+            profiler = Solver_profiler()
+	initial_setup_parameters = [phi_mat, m1_mat, m2_mat, InCond_uvcmp, uv_cmp, mn_cmp, integration_method, solve_method, velocity_solve_method, warm_start, profiler]
         return initial_setup_parameters
         
     def iterative_solver(self, Boundary_uv_type, Tn, initial_setup_parameters):
@@ -287,67 +1454,127 @@ class Gauge_method():
         mn_cmp = initial_setup_parameters[5]
 	integration_method = initial_setup_parameters[6]
 	solve_method = initial_setup_parameters[7] 
+	velocity_solve_method = initial_setup_parameters[8]
+	# warm_start: use the previous step (extrapolation) as the initial guesses of the iterative solvers
+	warm_start = initial_setup_parameters[9]
+        # profiler: Solver_profiler instance which times the stages of every step
+        profiler = initial_setup_parameters[10]
+        # phi (with ghost nodes), the velocity and the Gauge variable at the time levels n-1, n and n+1
+        # m* is solved into the interior of m_levels.new and completed there in place
+        phi_levels = Time_levels(structure3.CentredPotential(np.zeros((m,n)), self.mesh).complete(), np.zeros((m+2,n+2)))
+        # terms carried forward between the steps of this run, the set up starts with u^{-1} = u^0
+        if uvold_cmp.get_uv()[0] is uv_cmp.get_uv()[0]:
+            carried = Carried_terms({-1: 0})
+        else:
+            carried = Carried_terms()
+        uv_levels = Time_levels(uvold_cmp, uv_cmp)
+        m_levels = Time_levels(mn_cmp, mn_cmp)
+        # phiold_cmp: phi variable at time n-1, phin_cmp: phi variable at time n
+        phiold_cmp, phin_cmp = phi_levels.old, phi_levels.current
+        uvold_cmp, uv_cmp = uv_levels.old, uv_levels.current
+        mn_cmp = m_levels.current
         # int: interior points only
         mn_int = structure3.VelocityField(mn_cmp.get_int_uv()[0], mn_cmp.get_int_uv()[1], self.mesh)
-        # phiold: phi variable at time n-1
-        phiold = np.zeros((m,n))
-        phiold_cmp = structure3.CentredPotential(phiold, self.mesh).complete()
-        # phin_cmp: phi variable at time n
-        phin_cmp = np.copy(phiold_cmp)
         
+        # iterations of the velocity and phi solves at every step
+        self.solver_iterations = []
         print Tn, "number of iterations"
         # main iterative solver
 	test_problem_name = Boundary_uv_type
         for t in xrange(Tn):
-	    forcing_term = structure3.Forcing_term(self.mesh, test_problem_name, t+0.5).select_forcing_term()
-            convc_uv = uv_cmp.non_linear_convection()
-            preconvc_uv = uvold_cmp.non_linear_convection()
+            profiler.start_step(t)
+            profiler.phase('forcing')
+	    forcing_term = self.mesh.forcing_term(test_problem_name, t+0.5)
+            profiler.phase('convection')
+            if Boundary_uv_type == 'periodic_forcing_1' or Boundary_uv_type == 'periodic_forcing_2':
+                # Stokes problem, no convection
+                convc_uv = None
+                preconvc_uv = None
+            else:
+                # the convection of u^{n-1} was evaluated as the convection of u^n at the previous step
+                convc_uv = carried.term('convection', t, uv_cmp.non_linear_convection)
+                preconvc_uv = carried.term('convection', t-1, uvold_cmp.non_linear_convection)
+            profiler.phase('diffusion')
             diff_mn = mn_cmp.diffusion()
-
-	    if Boundary_uv_type == 'periodic_forcing_1':
-	        # Stokes problem
-	        rhs_mstar = mn_int + dt*((1.0/(2*Re))*diff_mn + forcing_term)  
-	    elif Boundary_uv_type == 'periodic_forcing_2':
-	        # Stokes problem
-	        rhs_mstar = mn_int + dt*((1.0/(2*Re))*diff_mn + forcing_term)	
-	    else:
-	        # full Navier Stokes problem
-                rhs_mstar = mn_int + dt*(-1.5*convc_uv + 0.5*preconvc_uv + (1.0/(2*Re))*diff_mn + forcing_term) 
+            profiler.phase('rhs')
+
+	    # the right hand side is evaluated in a single fused pass (lazy expression, see structure3.lazy_fields)
+	    with structure3.lazy_fields():
+	        if Boundary_uv_type == 'periodic_forcing_1' or Boundary_uv_type == 'periodic_forcing_2':
+	            # Stokes problem
+	            rhs_mstar = mn_int + dt*((1.0/(2*Re))*diff_mn + forcing_term)
+	        else:
+	            # full Navier Stokes problem
+	            rhs_mstar = mn_int + dt*(-1.5*convc_uv + 0.5*preconvc_uv + (1.0/(2*Re))*diff_mn + forcing_term)
+	    rhs_mstar = rhs_mstar.evaluate()
               
+            profiler.phase('boundary correction')
             # calculate the approximation to phi at time n+1
             gradphiuv = self.gradphi_app(phiold_cmp, phin_cmp)
             # boundary correction step
             rhs_mstarcd = self.correct_boundary(rhs_mstar, t+1, Boundary_uv_type, gradphiuv)
+            profiler.phase('velocity solve')
             # solving for the Gauge variable m
-            Linsys_solve = LinearSystem_solver(Re, self.mesh)
-            mstar = Linsys_solve.Linsys_velocity_solver([m1_mat,m2_mat],  rhs_mstarcd)
-            mstarcmp1, uvbnd_value = structure3.VelocityComplete(self.mesh, [mstar.get_uv()[0],  mstar.get_uv()[1]], t+1).complete(Boundary_uv_type, return_bnd=True)
+            Linsys_solve = LinearSystem_solver(Re, self.mesh, diagnostics=profiler.diagnostics)
+            if warm_start:
+                # m* of the previous step and phi^{n+1} appro 2*phi^n - phi^{n-1}
+                mstar0 = mn_int
+                phi0 = 2*phin_cmp[1:m+1,1:n+1] - phiold_cmp[1:m+1,1:n+1]
+            else:
+                mstar0 = None
+                phi0 = None
+            mstar = structure3.VelocityField(m_levels.new.get_int_uv()[0], m_levels.new.get_int_uv()[1], self.mesh)
+            Linsys_solve.Linsys_velocity_solver([m1_mat,m2_mat],  rhs_mstarcd, solve_method=velocity_solve_method, x0=mstar0, out=mstar)
+            profiler.phase('ghost completion')
+            mstarcmp1, uvbnd_value = structure3.VelocityComplete(self.mesh, [mstar.get_uv()[0],  mstar.get_uv()[1]], t+1).complete(Boundary_uv_type, return_bnd=True, out=m_levels.new)
+            profiler.phase('divergence')
             div_mstar = mstarcmp1.divergence()
+            # m^{n+1} (complete_mstar) differs from mstarcmp1 only at ghost nodes, which the divergence does not use
+            carried.store('divergence m', t+1, div_mstar)
+            profiler.phase('Poisson solve')
             # solving for the phi variable
-            phi = Linsys_solve.Poisson_pressure_solver(div_mstar, solve_method, phi_mat)
-            print solve_method
+            phi = Linsys_solve.Poisson_pressure_solver(div_mstar, solve_method, phi_mat, x0=phi0)
+            profiler.phase('update')
+            if profiler.diagnostics:
+                print solve_method
+            self.solver_iterations.append(dict(Linsys_solve.iterations))
+            if profiler.diagnostics:
+                print Linsys_solve.iterations, 'solver iterations'
             if t == 0:
                 #div_mn = np.zeros((m,n))
                 div_mn = div_mstar
             else:
-                div_mn = mn_cmp.divergence()
+                div_mn = carried.term('divergence m', t, mn_cmp.divergence)
 
-            phiacd = phi - phin_cmp[1:m+1,1:n+1]
             # pressure correction step
-            p = phiacd/dt - 1.0/(2*Re)*(div_mstar+div_mn)
-	    print self.mesh.integrate(p, integration_method), 'integral of p'
+            # p = (phi - phi^n)/dt - (div_mstar+div_mn)/(2*Re), in place on a copy of phi (phi is completed below)
+            p = phi.copy()
+            p -= phin_cmp[1:m+1,1:n+1]
+            p /= dt
+            p.axpy(-1.0/(2*Re), div_mstar+div_mn)
+            if profiler.diagnostics:
+                print self.mesh.integrate(p, integration_method), 'integral of p'
 	    gradp = p.gradient()
-            phiold_cmp = np.copy(phin_cmp)
-            phin_cmp = np.copy(phi.complete())
-            # velocity update step
+            phi.complete(out=phi_levels.new)
+            phi_levels.rotate()
+            phiold_cmp, phin_cmp = phi_levels.old, phi_levels.current
+            # velocity update step (evaluated into the interior of the next velocity level)
             gradphi = phi.gradient()
-            uvn_int = mstar - gradphi
-            uvold_cmp = copy.copy(uv_cmp)
-            uv_cmp = structure3.VelocityComplete(self.mesh, [uvn_int.get_uv()[0],  uvn_int.get_uv()[1]], t+1).complete(Boundary_uv_type)
-            # complete mstar
-            mn_cmp = self.complete_mstar(mstar, uvbnd_value, phin_cmp)
+            uvn_int = structure3.VelocityField(uv_levels.new.get_int_uv()[0], uv_levels.new.get_int_uv()[1], self.mesh)
+            with structure3.lazy_fields():
+                update = mstar - gradphi
+            update.evaluate(out=uvn_int)
+            structure3.VelocityComplete(self.mesh, [uvn_int.get_uv()[0],  uvn_int.get_uv()[1]], t+1).complete(Boundary_uv_type, out=uv_levels.new)
+            uv_levels.rotate()
+            uvold_cmp, uv_cmp = uv_levels.old, uv_levels.current
+            # complete mstar (only the ghost nodes of m* completed above change)
+            self.complete_mstar(mstar, uvbnd_value, phin_cmp, out=m_levels.new)
+            m_levels.rotate()
+            mn_cmp = m_levels.current
             mn_int = structure3.VelocityField(mn_cmp.get_int_uv()[0], mn_cmp.get_int_uv()[1], self.mesh)            
-            print "iteration "+str(t)
+            profiler.end_step(Linsys_solve.iterations, Linsys_solve.residuals)
+            if profiler.diagnostics:
+                print "iteration "+str(t)
         return uv_cmp, p, gradp
 
     ## this function calculates graident of phi at time n+1
@@ -360,9 +1587,7 @@ class Gauge_method():
         dy = self.dy
         dt = self.dt
         
-        phiapp_cmp = 2*phin_cmp - phiold_cmp
-        gradphiu = (phiapp_cmp[:,1:n+2] - phiapp_cmp[:,0:n+1])/dx
-        gradphiv = (phiapp_cmp[1:m+2,:] - phiapp_cmp[0:m+1,:])/dy
+        gradphiu, gradphiv = structure3.extrapolated_gradient(phiold_cmp, phin_cmp, dx, dy)
         # obtain gradphiu North and South boundary by cubic interpolation
         gradphiuN = 5.0/16*(gradphiu[0,:] +3*gradphiu[1,:] - gradphiu[2,:]+0.2*gradphiu[3,:])
         gradphiuS = 5.0/16*(gradphiu[-1,:] +3*gradphiu[-2,:] - gradphiu[-3,:]+0.2*gradphiu[-4,:])
@@ -442,21 +1667,9 @@ class Gauge_method():
         # North and South boundary
         uNbc = uN + gradphiuN
         uSbc = uS + gradphiuS
-
-        resu1 = np.zeros((m,n-1))
-        resu2 = np.zeros((m,n-1))
-        resu1[0,:] = (16.0/5)*(uNbc)*(lam/(dy**2))
-        resu1[-1,:] = (16.0/5)*(uSbc)*(lam/(dy**2))            
-            
         # West and East boundary
         uWbc = uW
         uEbc = uE
-        resu2[:,0] = (uWbc)*(lam/(dx**2))
-        resu2[:,-1] = (uEbc)*(lam/(dx**2))
-        resu = resu1+resu2
-        
-        resv1 = np.zeros((m-1,n))
-        resv2 = np.zeros((m-1,n))
         
         gradphivN = gradphiv[0,1:n+1]
         gradphivS = gradphiv[-1,1:n+1]
@@ -466,22 +1679,19 @@ class Gauge_method():
         # North and South boundary
         vNbc = vN
         vSbc = vS
-        resv2[0,:] = vNbc*(lam/(dy**2))
-        resv2[-1,:] = vSbc*(lam/(dy**2))
-
         # West and East boundary
         vWbc = vW + gradphivW
         vEbc = vE + gradphivE
-        resv1[:,0] = (16.0/5)*vWbc*(lam/(dx**2))
-        resv1[:,-1] = (16.0/5)*vEbc*(lam/(dx**2))
         
-        resv = resv1+resv2
-        rhs_mstarcd = rhs_mstar + [resu, resv]
+        # the boundary terms are added to rhs_mstar in place
+        rhs_mstarcd = self.boundary_injection.inject(rhs_mstar, [uNbc, uSbc, uWbc, uEbc], [vNbc, vSbc, vWbc, vEbc])
         
         return rhs_mstarcd
 
     # completing the Gauge variable at time n+1 
-    def complete_mstar(self, mstar_int, uvbnd_value, phiacd_cmp):
+    # out: optional VelocityField (m+2 x n+1, m+1 x n+2) which receives the result, e.g. m* completed in place by
+    # VelocityComplete, its interior is not copied again if mstar_int are its interior views
+    def complete_mstar(self, mstar_int, uvbnd_value, phiacd_cmp, out=None):
         # complete m* using phi^(n+1)
         n = self.n
         m = self.m
@@ -491,17 +1701,19 @@ class Gauge_method():
         uN, uS, uW, uE = uvbnd_value[0]
         vN, vS, vW, vE = uvbnd_value[1]
         
-        m1star_cmp = np.zeros((m+2,n+1))
-        m2star_cmp = np.zeros((m+1,n+2))
-        m1star_cmp[1:m+1,1:n] = mstar_int.get_uv()[0]
-        m2star_cmp[1:m,1:n+1] = mstar_int.get_uv()[1]        
+        if out is None:
+            out = structure3.VelocityField(np.zeros((m+2,n+1)), np.zeros((m+1,n+2)), self.mesh)
+        m1star_cmp, m2star_cmp = out.get_uv()
+        out.set_int_uv(mstar_int.get_uv())
         m1star_cmp[1:m+1,0] = uW
         m1star_cmp[1:m+1,-1] = uE
         m2star_cmp[0,1:n+1] = vN
         m2star_cmp[-1,1:n+1] = vS        
         
-        gdphi_cmpu = (phiacd_cmp[:,1:n+2] - phiacd_cmp[:,0:n+1])/dx
+        # the gradient of phi is only needed next to the boundaries (the 4 first and last rows or columns)
+        gdphi_cmpu = (phiacd_cmp[:4,1:n+2] - phiacd_cmp[:4,0:n+1])/dx
         gdphi_cmpuN = 5.0/16*(gdphi_cmpu[0,:] +3*gdphi_cmpu[1,:] - gdphi_cmpu[2,:]+0.2*gdphi_cmpu[3,:])
+        gdphi_cmpu = (phiacd_cmp[-4:,1:n+2] - phiacd_cmp[-4:,0:n+1])/dx
         gdphi_cmpuS = 5.0/16*(gdphi_cmpu[-1,:] +3*gdphi_cmpu[-2,:] - gdphi_cmpu[-3,:]+0.2*gdphi_cmpu[-4,:])
 
         # use phi^{n+1} just computed
@@ -511,15 +1723,16 @@ class Gauge_method():
         m1star_cmp[0,:] = (16.0/5)*m1starN - 3*m1star_cmp[1,:] + m1star_cmp[2,:] - 0.2*m1star_cmp[3,:]
         m1star_cmp[-1,:] = (16.0/5)*m1starS - 3*m1star_cmp[-2,:] + m1star_cmp[-3,:] - 0.2*m1star_cmp[-4,:]
 
-        gdphi_cmpv = (phiacd_cmp[1:m+2,:] - phiacd_cmp[0:m+1,:])/dy
+        gdphi_cmpv = (phiacd_cmp[1:m+2,:4] - phiacd_cmp[0:m+1,:4])/dy
         gdphi_cmpvW = 5.0/16*(gdphi_cmpv[:,0] +3*gdphi_cmpv[:,1] - gdphi_cmpv[:,2]+0.2*gdphi_cmpv[:,3])
+        gdphi_cmpv = (phiacd_cmp[1:m+2,-4:] - phiacd_cmp[0:m+1,-4:])/dy
         gdphi_cmpvE = 5.0/16*(gdphi_cmpv[:,-1] +3*gdphi_cmpv[:,-2] - gdphi_cmpv[:,-3]+0.2*gdphi_cmpv[:,-4])
         m2starW = vW + gdphi_cmpvW
         m2starE = vE + gdphi_cmpvE
         m2star_cmp[:,0] = (16.0/5)*m2starW - 3*m2star_cmp[:,1] + m2star_cmp[:,2] - 0.2*m2star_cmp[:,3]
         m2star_cmp[:,-1] = (16.0/5)*m2starE - 3*m2star_cmp[:,-2] + m2star_cmp[:,-3] - 0.2*m2star_cmp[:,-4]
 
-        return structure3.VelocityField(m1star_cmp, m2star_cmp, self.mesh)
+        return out
         
 class Alg1_method():
     '''This class constructs the Alg 1 method solver
@@ -542,19 +1755,25 @@ class Alg1_method():
         self.dx = mesh.dx
         self.dy = mesh.dy
         self.mesh = mesh
+        self.boundary_injection = Boundary_injection(Re, mesh)
     
     # initial set up
-    def setup(self, InCond, Boundary_uv_type, solve_method='ILU', integration_method='Riemann'):
+    def setup(self, InCond, Boundary_uv_type, solve_method='ILU', integration_method='Riemann', velocity_solve_method='BICG', warm_start=False, operator_cache=None, profiler=None):
         ## InCond_uv: specifies the velocity initial condition 
-        linsys_solver = LinearSystem_solver(self.Re, self.mesh, integration_method)
-        phi_mat = linsys_solver.Poisson_pressure_matrix(solve_method)
-        u_mat = linsys_solver.Linsys_velocity_matrix("u")
-        v_mat = linsys_solver.Linsys_velocity_matrix("v")
+        # the cache hits are only printed with the diagnostics of the profiler
+        linsys_solver = LinearSystem_solver(self.Re, self.mesh, integration_method, cache=operator_cache, diagnostics=profiler is None or profiler.diagnostics)
+        # 'auto' methods are replaced by the (cached) choice of Solver_autotuner
+        solve_method, pressure_options, velocity_solve_method = Solver_autotuner(self.Re, self.mesh, integration_method, cache=operator_cache).select(solve_method, velocity_solve_method)
+        phi_mat = linsys_solver.Poisson_pressure_matrix(solve_method, **pressure_options)
+        u_mat = linsys_solver.Linsys_velocity_matrix("u", velocity_solve_method)
+        v_mat = linsys_solver.Linsys_velocity_matrix("v", velocity_solve_method)
         
         InCond_uvcmp = structure3.VelocityComplete(self.mesh, InCond[0], 0).complete(Boundary_uv_type)
         uvn_cmp = copy.copy(InCond_uvcmp)
 	InCond_p = structure3.CentredPotential(InCond[1], self.mesh)
-        initial_setup_parameters = [phi_mat, u_mat, v_mat, InCond_uvcmp, uvn_cmp, InCond_p, integration_method, solve_method]
+        if profiler is None:
+            profiler = Solver_profiler()
+        initial_setup_parameters = [phi_mat, u_mat, v_mat, InCond_uvcmp, uvn_cmp, InCond_p, integration_method, solve_method, velocity_solve_method, warm_start, profiler]
         return initial_setup_parameters
         
     def iterative_solver(self, Boundary_uv_type, Tn, initial_setup_parameters):
@@ -575,55 +1794,229 @@ class Alg1_method():
 	pold = initial_setup_parameters[5]
 	integration_method = initial_setup_parameters[6]
 	solve_method = initial_setup_parameters[7]
-        pn = copy.copy(pold)
-
+	velocity_solve_method = initial_setup_parameters[8]
+	# warm_start: use the previous step (extrapolation) as the initial guesses of the iterative solvers
+	warm_start = initial_setup_parameters[9]
+        # profiler: Solver_profiler instance which times the stages of every step
+        profiler = initial_setup_parameters[10]
+        # p and the velocity at the time levels n-1, n and n+1
+        p_levels = Time_levels(pold, pold)
+        # terms carried forward between the steps of this run, the set up starts with u^{-1} = u^0
+        if uvold_cmp.get_uv()[0] is uvn_cmp.get_uv()[0]:
+            carried = Carried_terms({-1: 0})
+        else:
+            carried = Carried_terms()
+        uv_levels = Time_levels(uvold_cmp, uvn_cmp)
+        pold, pn = p_levels.old, p_levels.current
+        uvold_cmp, uvn_cmp = uv_levels.old, uv_levels.current
+        # u* is solved into the interior of uvstar_cmp and completed there in place
+        uvstar_cmp = uvn_cmp.copy()
+        # u* and phi of the previous step (initial guesses if warm_start)
+        uvstar = None
+        phi = None
+
+        # iterations of the velocity and phi solves at every step
+        self.solver_iterations = []
         print Tn, "number of iterations"
         # main iterative solver
 	test_problem_name = Boundary_uv_type
         for t in xrange(Tn):
-	    forcing_term = structure3.Forcing_term(self.mesh,test_problem_name,t+0.5).select_forcing_term()
-            convc_uv = uvn_cmp.non_linear_convection()
-            preconvc_uv = uvold_cmp.non_linear_convection()
+            profiler.start_step(t)
+            profiler.phase('forcing')
+	    forcing_term = self.mesh.forcing_term(test_problem_name, t+0.5)
+            profiler.phase('convection')
+            if Boundary_uv_type == 'periodic_forcing_1' or Boundary_uv_type == 'periodic_forcing_2':
+                # Stokes problem, no convection
+                convc_uv = None
+                preconvc_uv = None
+            else:
+                # the convection of u^{n-1} was evaluated as the convection of u^n at the previous step
+                convc_uv = carried.term('convection', t, uvn_cmp.non_linear_convection)
+                preconvc_uv = carried.term('convection', t-1, uvold_cmp.non_linear_convection)
+            profiler.phase('diffusion')
             diff_uvn = uvn_cmp.diffusion()
+            profiler.phase('rhs')
 	    gradp_uvn = pn.gradient()
 	    uvn_int = structure3.VelocityField(uvn_cmp.get_int_uv()[0], uvn_cmp.get_int_uv()[1], self.mesh)
-	    if Boundary_uv_type == 'periodic_forcing_1':
-	        # Stokes problem
-	        rhs_uvstar = uvn_int + dt*(- gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term)
-	    elif Boundary_uv_type == 'periodic_forcing_2':
-	        # Stokes problem
-	        rhs_uvstar = uvn_int + dt*(- gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term)	
-	    else:
-	        # full Navier Stokes problem
-                rhs_uvstar = uvn_int + dt*(-1.5*convc_uv + 0.5*preconvc_uv - gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term) 
-
+	    # the right hand side is evaluated in a single fused pass (lazy expression, see structure3.lazy_fields)
+	    with structure3.lazy_fields():
+	        if Boundary_uv_type == 'periodic_forcing_1' or Boundary_uv_type == 'periodic_forcing_2':
+	            # Stokes problem
+	            rhs_uvstar = uvn_int + dt*(- gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term)
+	        else:
+	            # full Navier Stokes problem
+	            rhs_uvstar = uvn_int + dt*(-1.5*convc_uv + 0.5*preconvc_uv - gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term)
+	    rhs_uvstar = rhs_uvstar.evaluate()
+
+            profiler.phase('boundary correction')
 	    # boundary correction step
             rhs_uvstarcd = self.correct_boundary(rhs_uvstar, t+1, Boundary_uv_type)
 
+            profiler.phase('velocity solve')
             # solving for the intermediate velocity variable uv* 
-            Linsys_solve = LinearSystem_solver(Re, self.mesh)
-            uvstar = Linsys_solve.Linsys_velocity_solver([u_mat,v_mat],  rhs_uvstarcd)
-            uvstarcmp, uvbnd_value = structure3.VelocityComplete(self.mesh, [uvstar.get_uv()[0],  uvstar.get_uv()[1]], t+1).complete(Boundary_uv_type, return_bnd=True)
+            Linsys_solve = LinearSystem_solver(Re, self.mesh, diagnostics=profiler.diagnostics)
+            if warm_start:
+                uvstar0 = uvstar
+                phi0 = phi
+            else:
+                uvstar0 = None
+                phi0 = None
+            uvstar = structure3.VelocityField(uvstar_cmp.get_int_uv()[0], uvstar_cmp.get_int_uv()[1], self.mesh)
+            Linsys_solve.Linsys_velocity_solver([u_mat,v_mat],  rhs_uvstarcd, solve_method=velocity_solve_method, x0=uvstar0, out=uvstar)
+            profiler.phase('ghost completion')
+            uvstarcmp, uvbnd_value = structure3.VelocityComplete(self.mesh, [uvstar.get_uv()[0],  uvstar.get_uv()[1]], t+1).complete(Boundary_uv_type, return_bnd=True, out=uvstar_cmp)
+            profiler.phase('divergence')
             div_uvstar = uvstarcmp.divergence()
 
+            profiler.phase('Poisson solve')
             # solving for the phi variable
-	    phi = Linsys_solve.Poisson_pressure_solver(div_uvstar/dt, solve_method, phi_mat)
+	    phi = Linsys_solve.Poisson_pressure_solver(div_uvstar/dt, solve_method, phi_mat, x0=phi0)
+            profiler.phase('update')
+            self.solver_iterations.append(dict(Linsys_solve.iterations))
+            if profiler.diagnostics:
+                print Linsys_solve.iterations, 'solver iterations'
             # pressure correction step
 	    # note this formula makes the perssure variable first order accurate in time
-            p = pn + phi 
-	    print self.mesh.integrate(p, integration_method), 'integral of p'
+            p = p_levels.new
+            np.add(pn.get_value(), phi.get_value(), out=p.get_value())
+            if profiler.diagnostics:
+                print self.mesh.integrate(p, integration_method), 'integral of p'
 	    gradp = p.gradient()
-            pold = copy.copy(pn)
-            pn = copy.copy(p)
+            p_levels.rotate()
+            pold, pn = p_levels.old, p_levels.current
 
             # velocity update step
+            # evaluated into the interior of the next velocity level
             gradphi = phi.gradient()
-            uvn_int = uvstar - dt*gradphi
-            uvold_cmp = copy.copy(uvn_cmp)
-            uvn_cmp = structure3.VelocityComplete(self.mesh, [uvn_int.get_uv()[0],  uvn_int.get_uv()[1]], t+1).complete(Boundary_uv_type)
-            print "iteration "+str(t)
+            uvn_int = structure3.VelocityField(uv_levels.new.get_int_uv()[0], uv_levels.new.get_int_uv()[1], self.mesh)
+            with structure3.lazy_fields():
+                update = uvstar - dt*gradphi
+            update.evaluate(out=uvn_int)
+            structure3.VelocityComplete(self.mesh, [uvn_int.get_uv()[0],  uvn_int.get_uv()[1]], t+1).complete(Boundary_uv_type, out=uv_levels.new)
+            uv_levels.rotate()
+            uvold_cmp, uvn_cmp = uv_levels.old, uv_levels.current
+            profiler.end_step(Linsys_solve.iterations, Linsys_solve.residuals)
+            if profiler.diagnostics:
+                print "iteration "+str(t)
         return uvn_cmp, p, gradp
 
+    # ensemble set up: InCond_list holds the initial conditions [uv, p] of k members on the same mesh
+    # the matrices and factorisations (and the profiler) are built once and shared by all members
+    # returns the list of the initial_setup_parameters of the members (see setup)
+    def ensemble_setup(self, InCond_list, Boundary_uv_type, solve_method='ILU', integration_method='Riemann', velocity_solve_method='BICG', warm_start=False, operator_cache=None, profiler=None):
+        setup = self.setup(InCond_list[0], Boundary_uv_type, solve_method, integration_method, velocity_solve_method, warm_start, operator_cache, profiler)
+        setups = [setup]
+        for InCond in InCond_list[1:]:
+            InCond_uvcmp = structure3.VelocityComplete(self.mesh, InCond[0], 0).complete(Boundary_uv_type)
+            InCond_p = structure3.CentredPotential(InCond[1], self.mesh)
+            setups.append(setup[:3] + [InCond_uvcmp, copy.copy(InCond_uvcmp), InCond_p] + setup[6:])
+        return setups
+
+    # runs the members of an ensemble (from ensemble_setup) in lockstep: every step does one block velocity solve
+    # and one block Poisson solve for all members (see Linsys_velocity_block_solver and Poisson_pressure_block_solver)
+    # returns the list of [uvn_cmp, p, gradp] of the members
+    def ensemble_solver(self, Boundary_uv_type, Tn, initial_setup_list):
+        n = self.n
+        m = self.m
+        dt = self.dt
+        Re = self.Re
+        k = len(initial_setup_list)
+        phi_mat, u_mat, v_mat = initial_setup_list[0][:3]
+	solve_method = initial_setup_list[0][7]
+	velocity_solve_method = initial_setup_list[0][8]
+	warm_start = initial_setup_list[0][9]
+        profiler = initial_setup_list[0][10]
+        # p and the velocity of every member at the time levels n-1, n and n+1
+        p_levels = []
+        uv_levels = []
+        carried = []
+        uvstar_cmp = []
+        for initial_setup_parameters in initial_setup_list:
+            uvold_cmp, uvn_cmp, pold = initial_setup_parameters[3:6]
+            p_levels.append(Time_levels(pold, pold))
+            if uvold_cmp.get_uv()[0] is uvn_cmp.get_uv()[0]:
+                carried.append(Carried_terms({-1: 0}))
+            else:
+                carried.append(Carried_terms())
+            uv_levels.append(Time_levels(uvold_cmp, uvn_cmp))
+            uvstar_cmp.append(uv_levels[-1].current.copy())
+        # u* and phi of the previous step (initial guesses if warm_start)
+        uvstar = [None]*k
+        phi = [None]*k
+        gradp = [None]*k
+
+        self.solver_iterations = []
+	test_problem_name = Boundary_uv_type
+        for t in xrange(Tn):
+            profiler.start_step(t)
+            profiler.phase('forcing')
+	    forcing_term = self.mesh.forcing_term(test_problem_name, t+0.5)
+            rhs_uvstarcd = []
+            for j in xrange(k):
+                uvold_cmp, uvn_cmp = uv_levels[j].old, uv_levels[j].current
+                profiler.phase('convection')
+                if Boundary_uv_type == 'periodic_forcing_1' or Boundary_uv_type == 'periodic_forcing_2':
+                    # Stokes problem, no convection
+                    convc_uv = None
+                    preconvc_uv = None
+                else:
+                    convc_uv = carried[j].term('convection', t, uvn_cmp.non_linear_convection)
+                    preconvc_uv = carried[j].term('convection', t-1, uvold_cmp.non_linear_convection)
+                profiler.phase('diffusion')
+                diff_uvn = uvn_cmp.diffusion()
+                profiler.phase('rhs')
+                gradp_uvn = p_levels[j].current.gradient()
+                uvn_int = structure3.VelocityField(uvn_cmp.get_int_uv()[0], uvn_cmp.get_int_uv()[1], self.mesh)
+                with structure3.lazy_fields():
+                    if Boundary_uv_type == 'periodic_forcing_1' or Boundary_uv_type == 'periodic_forcing_2':
+                        # Stokes problem
+                        rhs_uvstar = uvn_int + dt*(- gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term)
+                    else:
+                        # full Navier Stokes problem
+                        rhs_uvstar = uvn_int + dt*(-1.5*convc_uv + 0.5*preconvc_uv - gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term)
+                rhs_uvstar = rhs_uvstar.evaluate()
+                profiler.phase('boundary correction')
+                rhs_uvstarcd.append(self.correct_boundary(rhs_uvstar, t+1, Boundary_uv_type))
+
+            profiler.phase('velocity solve')
+            # one block solve of the intermediate velocities uv* of all members
+            Linsys_solve = LinearSystem_solver(Re, self.mesh, diagnostics=profiler.diagnostics)
+            if warm_start:
+                uvstar0 = uvstar
+                phi0 = phi
+            else:
+                uvstar0 = None
+                phi0 = None
+            uvstar = Linsys_solve.Linsys_velocity_block_solver([u_mat,v_mat], rhs_uvstarcd, solve_method=velocity_solve_method, x0_list=uvstar0)
+            div_uvstar = []
+            for j in xrange(k):
+                profiler.phase('ghost completion')
+                uvstarcmp = structure3.VelocityComplete(self.mesh, uvstar[j].get_uv(), t+1).complete(Boundary_uv_type, out=uvstar_cmp[j])
+                profiler.phase('divergence')
+                div_uvstar.append(uvstarcmp.divergence()/dt)
+
+            profiler.phase('Poisson solve')
+            # one block solve of phi of all members
+            phi = Linsys_solve.Poisson_pressure_block_solver(div_uvstar, solve_method, phi_mat, x0_list=phi0)
+            profiler.phase('update')
+            self.solver_iterations.append(dict(Linsys_solve.iterations))
+            for j in xrange(k):
+                # pressure correction step
+                p = p_levels[j].new
+                np.add(p_levels[j].current.get_value(), phi[j].get_value(), out=p.get_value())
+                gradp[j] = p.gradient()
+                p_levels[j].rotate()
+                # velocity update step, evaluated into the interior of the next velocity level
+                gradphi = phi[j].gradient()
+                uvn_int = structure3.VelocityField(uv_levels[j].new.get_int_uv()[0], uv_levels[j].new.get_int_uv()[1], self.mesh)
+                with structure3.lazy_fields():
+                    update = uvstar[j] - dt*gradphi
+                update.evaluate(out=uvn_int)
+                structure3.VelocityComplete(self.mesh, uvn_int.get_uv(), t+1).complete(Boundary_uv_type, out=uv_levels[j].new)
+                uv_levels[j].rotate()
+            profiler.end_step(Linsys_solve.iterations, Linsys_solve.residuals)
+        return [[uv_levels[j].current, p_levels[j].current, gradp[j]] for j in xrange(k)]
+
     # boundary correction 
     def correct_boundary(self, rhs_uvstar, t, Boundary_type):
         # rhsuv is a VelocityField object with dimension interior u and v [(m*(n-1), (m-1)*n)]
@@ -680,30 +2073,8 @@ class Alg1_method():
             vW = VC.bnd_forcing_2('v')['W'][1:m]
             vE = VC.bnd_forcing_2('v')['E'][1:m]
         
-        # North and South boundary
-        resu1 = np.zeros((m,n-1))
-        resu2 = np.zeros((m,n-1))
-        resu1[0,:] = (16.0/5)*uN*(lam/(dy**2))
-        resu1[-1,:] = (16.0/5)*uS*(lam/(dy**2))            
-            
-        # West and East boundary
-        resu2[:,0] = uW*(lam/(dx**2))
-        resu2[:,-1] = uE*(lam/(dx**2))
-        resu = resu1+resu2
-        
-        resv1 = np.zeros((m-1,n))
-        resv2 = np.zeros((m-1,n))
-
-        # North and South boundary
-        resv2[0,:] = vN*(lam/(dy**2))
-        resv2[-1,:] = vS*(lam/(dy**2))
-
-        # West and East boundary
-        resv1[:,0] = (16.0/5)*vW*(lam/(dx**2))
-        resv1[:,-1] = (16.0/5)*vE*(lam/(dx**2))
-        
-        resv = resv1+resv2
-        rhs_uvstarcd = rhs_uvstar + [resu, resv]
+        # the boundary terms are added to rhs_uvstar in place
+        rhs_uvstarcd = self.boundary_injection.inject(rhs_uvstar, [uN, uS, uW, uE], [vN, vS, vW, vE])
         
         return rhs_uvstarcd
 
@@ -727,19 +2098,25 @@ class Alg2_method():
         self.dx = mesh.dx
         self.dy = mesh.dy
         self.mesh = mesh
+        self.boundary_injection = Boundary_injection(Re, mesh)
     
     # initial set up
-    def setup(self, InCond, Boundary_uv_type, solve_method='ILU', integration_method='Riemann'):
+    def setup(self, InCond, Boundary_uv_type, solve_method='ILU', integration_method='Riemann', velocity_solve_method='BICG', warm_start=False, operator_cache=None, profiler=None):
         ## InCond_uv: specifies the velocity initial condition 
-        linsys_solver = LinearSystem_solver(self.Re, self.mesh, integration_method)
-        phi_mat = linsys_solver.Poisson_pressure_matrix(solve_method)
-        u_mat = linsys_solver.Linsys_velocity_matrix("u")
-        v_mat = linsys_solver.Linsys_velocity_matrix("v")
+        # the cache hits are only printed with the diagnostics of the profiler
+        linsys_solver = LinearSystem_solver(self.Re, self.mesh, integration_method, cache=operator_cache, diagnostics=profiler is None or profiler.diagnostics)
+        # 'auto' methods are replaced by the (cached) choice of Solver_autotuner
+        solve_method, pressure_options, velocity_solve_method = Solver_autotuner(self.Re, self.mesh, integration_method, cache=operator_cache).select(solve_method, velocity_solve_method)
+        phi_mat = linsys_solver.Poisson_pressure_matrix(solve_method, **pressure_options)
+        u_mat = linsys_solver.Linsys_velocity_matrix("u", velocity_solve_method)
+        v_mat = linsys_solver.Linsys_velocity_matrix("v", velocity_solve_method)
         
         InCond_uvcmp = structure3.VelocityComplete(self.mesh, InCond[0], 0).complete(Boundary_uv_type)
         uvn_cmp = copy.copy(InCond_uvcmp)
 	InCond_p = structure3.CentredPotential(InCond[1], self.mesh)
-        initial_setup_parameters = [phi_mat, u_mat, v_mat, InCond_uvcmp, uvn_cmp, InCond_p, integration_method, solve_method]
+        if profiler is None:
+            profiler = Solver_profiler()
+        initial_setup_parameters = [phi_mat, u_mat, v_mat, InCond_uvcmp, uvn_cmp, InCond_p, integration_method, solve_method, velocity_solve_method, warm_start, profiler]
         return initial_setup_parameters
         
     def iterative_solver(self, Boundary_uv_type, Tn, initial_setup_parameters):
@@ -760,50 +2137,109 @@ class Alg2_method():
 	pold = initial_setup_parameters[5]
 	integration_method = initial_setup_parameters[6]
 	solve_method = initial_setup_parameters[7]
-        pn = copy.copy(pold)
-
+	velocity_solve_method = initial_setup_parameters[8]
+	# warm_start: use the previous step (extrapolation) as the initial guesses of the iterative solvers
+	warm_start = initial_setup_parameters[9]
+        # profiler: Solver_profiler instance which times the stages of every step
+        profiler = initial_setup_parameters[10]
+        # p and the velocity at the time levels n-1, n and n+1
+        p_levels = Time_levels(pold, pold)
+        # terms carried forward between the steps of this run, the set up starts with u^{-1} = u^0
+        if uvold_cmp.get_uv()[0] is uvn_cmp.get_uv()[0]:
+            carried = Carried_terms({-1: 0})
+        else:
+            carried = Carried_terms()
+        uv_levels = Time_levels(uvold_cmp, uvn_cmp)
+        pold, pn = p_levels.old, p_levels.current
+        uvold_cmp, uvn_cmp = uv_levels.old, uv_levels.current
+        # u* is solved into the interior of uvstar_cmp and completed there in place
+        uvstar_cmp = uvn_cmp.copy()
+        # u* and phi of the previous step (initial guesses if warm_start)
+        uvstar = None
+        phi = None
+
+        # iterations of the velocity and phi solves at every step
+        self.solver_iterations = []
         print Tn, "number of iterations"
         # main iterative solver
 	test_problem_name = Boundary_uv_type
         for t in xrange(Tn):
-	    forcing_term = structure3.Forcing_term(self.mesh,test_problem_name,t+0.5).select_forcing_term()
-            convc_uv = uvn_cmp.non_linear_convection()
-            preconvc_uv = uvold_cmp.non_linear_convection()
+            profiler.start_step(t)
+            profiler.phase('forcing')
+	    forcing_term = self.mesh.forcing_term(test_problem_name, t+0.5)
+            profiler.phase('convection')
+            if Boundary_uv_type == 'periodic_forcing_1' or Boundary_uv_type == 'periodic_forcing_2':
+                # Stokes problem, no convection
+                convc_uv = None
+                preconvc_uv = None
+            else:
+                # the convection of u^{n-1} was evaluated as the convection of u^n at the previous step
+                convc_uv = carried.term('convection', t, uvn_cmp.non_linear_convection)
+                preconvc_uv = carried.term('convection', t-1, uvold_cmp.non_linear_convection)
+            profiler.phase('diffusion')
             diff_uvn = uvn_cmp.diffusion()
+            profiler.phase('rhs')
 	    gradp_uvn = pn.gradient()
 	    uvn_int = structure3.VelocityField(uvn_cmp.get_int_uv()[0], uvn_cmp.get_int_uv()[1], self.mesh)
-	    if Boundary_uv_type == 'periodic_forcing_1':
-	        # Stokes problem
-	        rhs_uvstar = uvn_int + dt*(- gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term)  
-	    elif Boundary_uv_type == 'periodic_forcing_2':
-	        # Stokes problem
-	        rhs_uvstar = uvn_int + dt*(- gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term)  
-	    else:
-	        # full Navier Stokes problem
-                rhs_uvstar = uvn_int + dt*(-1.5*convc_uv + 0.5*preconvc_uv - gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term) 
-
+	    # the right hand side is evaluated in a single fused pass (lazy expression, see structure3.lazy_fields)
+	    with structure3.lazy_fields():
+	        if Boundary_uv_type == 'periodic_forcing_1' or Boundary_uv_type == 'periodic_forcing_2':
+	            # Stokes problem
+	            rhs_uvstar = uvn_int + dt*(- gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term)
+	        else:
+	            # full Navier Stokes problem
+	            rhs_uvstar = uvn_int + dt*(-1.5*convc_uv + 0.5*preconvc_uv - gradp_uvn + (1.0/(2*Re))*diff_uvn + forcing_term)
+	    rhs_uvstar = rhs_uvstar.evaluate()
+
+            profiler.phase('boundary correction')
 	    # boundary correction step
             rhs_uvstarcd = self.correct_boundary(rhs_uvstar, t+1, Boundary_uv_type)
+            profiler.phase('velocity solve')
             # solving for the intermediate velocity variable uv* 
-            Linsys_solve = LinearSystem_solver(Re, self.mesh)
-            uvstar = Linsys_solve.Linsys_velocity_solver([u_mat,v_mat],  rhs_uvstarcd)
-            uvstarcmp, uvbnd_value = structure3.VelocityComplete(self.mesh, [uvstar.get_uv()[0],  uvstar.get_uv()[1]], t+1).complete(Boundary_uv_type, return_bnd=True)
+            Linsys_solve = LinearSystem_solver(Re, self.mesh, diagnostics=profiler.diagnostics)
+            if warm_start:
+                uvstar0 = uvstar
+                phi0 = phi
+            else:
+                uvstar0 = None
+                phi0 = None
+            uvstar = structure3.VelocityField(uvstar_cmp.get_int_uv()[0], uvstar_cmp.get_int_uv()[1], self.mesh)
+            Linsys_solve.Linsys_velocity_solver([u_mat,v_mat],  rhs_uvstarcd, solve_method=velocity_solve_method, x0=uvstar0, out=uvstar)
+            profiler.phase('ghost completion')
+            uvstarcmp, uvbnd_value = structure3.VelocityComplete(self.mesh, [uvstar.get_uv()[0],  uvstar.get_uv()[1]], t+1).complete(Boundary_uv_type, return_bnd=True, out=uvstar_cmp)
+            profiler.phase('divergence')
             div_uvstar = uvstarcmp.divergence()
 
+            profiler.phase('Poisson solve')
             # solving for the phi variable
-	    phi = Linsys_solve.Poisson_pressure_solver(div_uvstar/dt, solve_method, phi_mat)
+	    phi = Linsys_solve.Poisson_pressure_solver(div_uvstar/dt, solve_method, phi_mat, x0=phi0)
+            profiler.phase('update')
+            self.solver_iterations.append(dict(Linsys_solve.iterations))
+            if profiler.diagnostics:
+                print Linsys_solve.iterations, 'solver iterations'
             # pressure correction step
-            p = pn + phi - div_uvstar/(2*Re)
-	    print self.mesh.integrate(p, integration_method), 'integral of p'
+            # p = pn + phi - div_uvstar/(2*Re)
+            p = p_levels.new
+            np.add(pn.get_value(), phi.get_value(), out=p.get_value())
+            p.axpy(-1.0/(2*Re), div_uvstar)
+            if profiler.diagnostics:
+                print self.mesh.integrate(p, integration_method), 'integral of p'
 	    gradp = p.gradient()
-            pold = copy.copy(pn)
-            pn = copy.copy(p)
+            p_levels.rotate()
+            pold, pn = p_levels.old, p_levels.current
             # velocity update stemp
+            # evaluated into the interior of the next velocity level
             gradphi = phi.gradient()
-            uvn_int = uvstar - dt*gradphi
-            uvold_cmp = copy.copy(uvn_cmp)
-            uvn_cmp = structure3.VelocityComplete(self.mesh, [uvn_int.get_uv()[0],  uvn_int.get_uv()[1]], t+1).complete(Boundary_uv_type)
-            print "iteration "+str(t)
+            uvn_int = structure3.VelocityField(uv_levels.new.get_int_uv()[0], uv_levels.new.get_int_uv()[1], self.mesh)
+            with structure3.lazy_fields():
+                update = uvstar - dt*gradphi
+            update.evaluate(out=uvn_int)
+            structure3.VelocityComplete(self.mesh, [uvn_int.get_uv()[0],  uvn_int.get_uv()[1]], t+1).complete(Boundary_uv_type, out=uv_levels.new)
+            uv_levels.rotate()
+            uvold_cmp, uvn_cmp = uv_levels.old, uv_levels.current
+            profiler.end_step(Linsys_solve.iterations, Linsys_solve.residuals)
+            if profiler.diagnostics:
+                print "iteration "+str(t)
         return uvn_cmp, p, gradp
 
     # boundary correction 
@@ -862,30 +2298,8 @@ class Alg2_method():
             vW = VC.bnd_forcing_2('v')['W'][1:m]
             vE = VC.bnd_forcing_2('v')['E'][1:m]
         
-        # North and South boundary
-        resu1 = np.zeros((m,n-1))
-        resu2 = np.zeros((m,n-1))
-        resu1[0,:] = (16.0/5)*uN*(lam/(dy**2))
-        resu1[-1,:] = (16.0/5)*uS*(lam/(dy**2))            
-            
-        # West and East boundary
-        resu2[:,0] = uW*(lam/(dx**2))
-        resu2[:,-1] = uE*(lam/(dx**2))
-        resu = resu1+resu2
-        
-        resv1 = np.zeros((m-1,n))
-        resv2 = np.zeros((m-1,n))
-
-        # North and South boundary
-        resv2[0,:] = vN*(lam/(dy**2))
-        resv2[-1,:] = vS*(lam/(dy**2))
-
-        # West and East boundary
-        resv1[:,0] = (16.0/5)*vW*(lam/(dx**2))
-        resv1[:,-1] = (16.0/5)*vE*(lam/(dx**2))
-        
-        resv = resv1+resv2
-        rhs_uvstarcd = rhs_uvstar + [resu, resv]
+        # the boundary terms are added to rhs_uvstar in place
+        rhs_uvstarcd = self.boundary_injection.inject(rhs_uvstar, [uN, uS, uW, uE], [vN, vS, vW, vE])
         
         return rhs_uvstarcd
 
@@ -909,18 +2323,24 @@ class Alg3_method():
         self.dx = mesh.dx
         self.dy = mesh.dy
         self.mesh = mesh
+        self.boundary_injection = Boundary_injection(Re, mesh)
     
     # initial set up
-    def setup(self, InCond_uv_init, Boundary_uv_type, solve_method='ILU', integration_method='Riemann'):
+    def setup(self, InCond_uv_init, Boundary_uv_type, solve_method='ILU', integration_method='Riemann', velocity_solve_method='BICG', warm_start=False, operator_cache=None, profiler=None):
         ## InCond_uv: specifies the velocity initial condition 
-        linsys_solver = LinearSystem_solver(self.Re, self.mesh)
-	phi_mat = linsys_solver.Poisson_pressure_matrix(solve_method)
-        u_mat = linsys_solver.Linsys_velocity_matrix("u")
-        v_mat = linsys_solver.Linsys_velocity_matrix("v")
+        # the cache hits are only printed with the diagnostics of the profiler
+        linsys_solver = LinearSystem_solver(self.Re, self.mesh, cache=operator_cache, diagnostics=profiler is None or profiler.diagnostics)
+        # 'auto' methods are replaced by the (cached) choice of Solver_autotuner
+        solve_method, pressure_options, velocity_solve_method = Solver_autotuner(self.Re, self.mesh, integration_method, cache=operator_cache).select(solve_method, velocity_solve_method)
+	phi_mat = linsys_solver.Poisson_pressure_matrix(solve_method, **pressure_options)
+        u_mat = linsys_solver.Linsys_velocity_matrix("u", velocity_solve_method)
+        v_mat = linsys_solver.Linsys_velocity_matrix("v", velocity_solve_method)
         
         InCond_uvcmp = structure3.VelocityComplete(self.mesh, InCond_uv_init, 0).complete(Boundary_uv_type)
         uv_cmp = copy.copy(InCond_uvcmp)        
-        initial_setup_parameters = [phi_mat, u_mat, v_mat, InCond_uvcmp, uv_cmp, integration_method, solve_method]
+        if profiler is None:
+            profiler = Solver_profiler()
+        initial_setup_parameters = [phi_mat, u_mat, v_mat, InCond_uvcmp, uv_cmp, integration_method, solve_method, velocity_solve_method, warm_start, profiler]
         return initial_setup_parameters
         
     def iterative_solver(self, Boundary_uv_type, Tn, initial_setup_parameters):
@@ -940,57 +2360,111 @@ class Alg3_method():
         uvn_cmp = initial_setup_parameters[4]
 	integration_method = initial_setup_parameters[5] 
 	solve_method = initial_setup_parameters[6] 
+	velocity_solve_method = initial_setup_parameters[7]
+	# warm_start: use the previous step (extrapolation) as the initial guesses of the iterative solvers
+	warm_start = initial_setup_parameters[8]
+        # profiler: Solver_profiler instance which times the stages of every step
+        profiler = initial_setup_parameters[9]
         # int: interior points only
         uvn_int = structure3.VelocityField(uvn_cmp.get_int_uv()[0], uvn_cmp.get_int_uv()[1], self.mesh)
-        # phiold: phi variable at time n-1
-        phiold = np.zeros((m,n))
-        phiold_cmp = structure3.CentredPotential(phiold, self.mesh).complete()
-        # phin_cmp: phi variable at time n
-        phin_cmp = np.copy(phiold_cmp)
-        
+        # phi (with ghost nodes) and the velocity at the time levels n-1, n and n+1
+        phi_levels = Time_levels(structure3.CentredPotential(np.zeros((m,n)), self.mesh).complete(), np.zeros((m+2,n+2)))
+        # terms carried forward between the steps of this run, the set up starts with u^{-1} = u^0
+        if uvold_cmp.get_uv()[0] is uvn_cmp.get_uv()[0]:
+            carried = Carried_terms({-1: 0})
+        else:
+            carried = Carried_terms()
+        uv_levels = Time_levels(uvold_cmp, uvn_cmp)
+        # phiold_cmp: phi variable at time n-1, phin_cmp: phi variable at time n
+        phiold_cmp, phin_cmp = phi_levels.old, phi_levels.current
+        uvold_cmp, uvn_cmp = uv_levels.old, uv_levels.current
+        # u* is solved into the interior of uvstar_cmp and completed there in place
+        uvstar_cmp = uvn_cmp.copy()
+        # u* of the previous step (initial guess if warm_start)
+        uvstar = None
+        
+        # iterations of the velocity and phi solves at every step
+        self.solver_iterations = []
         print Tn, "number of iterations"
         # main iterative solver
 	test_problem_name = Boundary_uv_type
         for t in xrange(Tn):
-	    forcing_term = structure3.Forcing_term(self.mesh,test_problem_name,t+0.5).select_forcing_term()
-            convc_uv = uvn_cmp.non_linear_convection()
-            preconvc_uv = uvold_cmp.non_linear_convection()
+            profiler.start_step(t)
+            profiler.phase('forcing')
+	    forcing_term = self.mesh.forcing_term(test_problem_name, t+0.5)
+            profiler.phase('convection')
+            if Boundary_uv_type == 'periodic_forcing_1' or Boundary_uv_type == 'periodic_forcing_2':
+                # Stokes problem, no convection
+                convc_uv = None
+                preconvc_uv = None
+            else:
+                # the convection of u^{n-1} was evaluated as the convection of u^n at the previous step
+                convc_uv = carried.term('convection', t, uvn_cmp.non_linear_convection)
+                preconvc_uv = carried.term('convection', t-1, uvold_cmp.non_linear_convection)
+            profiler.phase('diffusion')
             diff_uvn = uvn_cmp.diffusion()
-	    if Boundary_uv_type == 'periodic_forcing_1':
-	        # Stokes problem
-	        rhs_uvstar = uvn_int + dt*((1.0/(2*Re))*diff_uvn + forcing_term)
-	    elif Boundary_uv_type == 'periodic_forcing_2':
-	        # Stokes problem
-	        rhs_uvstar = uvn_int + dt*((1.0/(2*Re))*diff_uvn + forcing_term)
-	    else:
-	        # full Navier Stokes problem
-                rhs_uvstar = uvn_int + dt*(-1.5*convc_uv + 0.5*preconvc_uv + (1.0/(2*Re))*diff_uvn + forcing_term) 
+            profiler.phase('rhs')
+	    # the right hand side is evaluated in a single fused pass (lazy expression, see structure3.lazy_fields)
+	    with structure3.lazy_fields():
+	        if Boundary_uv_type == 'periodic_forcing_1' or Boundary_uv_type == 'periodic_forcing_2':
+	            # Stokes problem
+	            rhs_uvstar = uvn_int + dt*((1.0/(2*Re))*diff_uvn + forcing_term)
+	        else:
+	            # full Navier Stokes problem
+	            rhs_uvstar = uvn_int + dt*(-1.5*convc_uv + 0.5*preconvc_uv + (1.0/(2*Re))*diff_uvn + forcing_term)
+	    rhs_uvstar = rhs_uvstar.evaluate()
            
+            profiler.phase('boundary correction')
             # calculate the approximation to phi at time n+1
             gradphiuv = self.gradphi_app(phiold_cmp, phin_cmp)
             # boundary correction step
             rhs_uvstarcd = self.correct_boundary(rhs_uvstar, t+1, Boundary_uv_type, gradphiuv)
+            profiler.phase('velocity solve')
             # solving for the intermediate velocity variable uv*
-            Linsys_solve = LinearSystem_solver(Re, self.mesh)
-            uvstar = Linsys_solve.Linsys_velocity_solver([u_mat,v_mat], rhs_uvstarcd)
-            uvstarcmp = structure3.VelocityComplete(self.mesh, [uvstar.get_uv()[0],  uvstar.get_uv()[1]], t+1).complete(Boundary_uv_type)
+            Linsys_solve = LinearSystem_solver(Re, self.mesh, diagnostics=profiler.diagnostics)
+            if warm_start:
+                # u* of the previous step and phi^{n+1} appro 2*phi^n - phi^{n-1}
+                uvstar0 = uvstar
+                phi0 = 2*phin_cmp[1:m+1,1:n+1] - phiold_cmp[1:m+1,1:n+1]
+            else:
+                uvstar0 = None
+                phi0 = None
+            uvstar = structure3.VelocityField(uvstar_cmp.get_int_uv()[0], uvstar_cmp.get_int_uv()[1], self.mesh)
+            Linsys_solve.Linsys_velocity_solver([u_mat,v_mat], rhs_uvstarcd, solve_method=velocity_solve_method, x0=uvstar0, out=uvstar)
+            profiler.phase('ghost completion')
+            uvstarcmp = structure3.VelocityComplete(self.mesh, [uvstar.get_uv()[0],  uvstar.get_uv()[1]], t+1).complete(Boundary_uv_type, out=uvstar_cmp)
+            profiler.phase('divergence')
             div_uvstar = uvstarcmp.divergence()
 
+            profiler.phase('Poisson solve')
             # solving for the phi variable
-            phi = Linsys_solve.Poisson_pressure_solver(div_uvstar/dt, solve_method, phi_mat)
+            phi = Linsys_solve.Poisson_pressure_solver(div_uvstar/dt, solve_method, phi_mat, x0=phi0)
+            profiler.phase('update')
+            self.solver_iterations.append(dict(Linsys_solve.iterations))
+            if profiler.diagnostics:
+                print Linsys_solve.iterations, 'solver iterations'
             # pressure correction step
             p = phi - div_uvstar/(2*Re)
-	    print self.mesh.integrate(p, integration_method), 'integral of p'
+            if profiler.diagnostics:
+                print self.mesh.integrate(p, integration_method), 'integral of p'
 
 	    gradp = p.gradient()
-            phiold_cmp = np.copy(phin_cmp)
-            phin_cmp = np.copy(phi.complete())
+            phi.complete(out=phi_levels.new)
+            phi_levels.rotate()
+            phiold_cmp, phin_cmp = phi_levels.old, phi_levels.current
             # velocity update stemp
+            # evaluated into the interior of the next velocity level
             gradphi = phi.gradient()
-            uvn_int = uvstar - dt*gradphi
-            uvold_cmp = copy.copy(uvn_cmp)
-            uvn_cmp = structure3.VelocityComplete(self.mesh, [uvn_int.get_uv()[0],  uvn_int.get_uv()[1]], t+1).complete(Boundary_uv_type)
-            print "iteration "+str(t)
+            uvn_int = structure3.VelocityField(uv_levels.new.get_int_uv()[0], uv_levels.new.get_int_uv()[1], self.mesh)
+            with structure3.lazy_fields():
+                update = uvstar - dt*gradphi
+            update.evaluate(out=uvn_int)
+            structure3.VelocityComplete(self.mesh, [uvn_int.get_uv()[0],  uvn_int.get_uv()[1]], t+1).complete(Boundary_uv_type, out=uv_levels.new)
+            uv_levels.rotate()
+            uvold_cmp, uvn_cmp = uv_levels.old, uv_levels.current
+            profiler.end_step(Linsys_solve.iterations, Linsys_solve.residuals)
+            if profiler.diagnostics:
+                print "iteration "+str(t)
             #break
         return uvn_cmp, p, gradp
 
@@ -1004,9 +2478,7 @@ class Alg3_method():
         dy = self.dy
         dt = self.dt
         
-        phiapp_cmp = 2*phin_cmp - phiold_cmp
-        gradphiu = (phiapp_cmp[:,1:n+2] - phiapp_cmp[:,0:n+1])/dx
-        gradphiv = (phiapp_cmp[1:m+2,:] - phiapp_cmp[0:m+1,:])/dy
+        gradphiu, gradphiv = structure3.extrapolated_gradient(phiold_cmp, phin_cmp, dx, dy)
         # obtain gradphiu North and South boundary by cubic interpolation
         gradphiuN = 5.0/16*(gradphiu[0,:] +3*gradphiu[1,:] - gradphiu[2,:]+0.2*gradphiu[3,:])
         gradphiuS = 5.0/16*(gradphiu[-1,:] +3*gradphiu[-2,:] - gradphiu[-3,:]+0.2*gradphiu[-4,:])
@@ -1087,21 +2559,9 @@ class Alg3_method():
         # North and South boundary
         uNbc = uN + dt*gradphiuN
         uSbc = uS + dt*gradphiuS
-
-        resu1 = np.zeros((m,n-1))
-        resu2 = np.zeros((m,n-1))
-        resu1[0,:] = (16.0/5)*(uNbc)*(lam/(dy**2))
-        resu1[-1,:] = (16.0/5)*(uSbc)*(lam/(dy**2))            
-            
         # West and East boundary
         uWbc = uW
         uEbc = uE
-        resu2[:,0] = (uWbc)*(lam/(dx**2))
-        resu2[:,-1] = (uEbc)*(lam/(dx**2))
-        resu = resu1+resu2
-        
-        resv1 = np.zeros((m-1,n))
-        resv2 = np.zeros((m-1,n))
         
         gradphivN = gradphiv[0,1:n+1]
         gradphivS = gradphiv[-1,1:n+1]
@@ -1111,17 +2571,12 @@ class Alg3_method():
         # North and South boundary
         vNbc = vN
         vSbc = vS
-        resv2[0,:] = vNbc*(lam/(dy**2))
-        resv2[-1,:] = vSbc*(lam/(dy**2))
-
         # West and East boundary
         vWbc = vW + dt*gradphivW
         vEbc = vE + dt*gradphivE
-        resv1[:,0] = (16.0/5)*vWbc*(lam/(dx**2))
-        resv1[:,-1] = (16.0/5)*vEbc*(lam/(dx**2))
         
-        resv = resv1+resv2
-        rhs_uvstarcd = rhs_uvstar + [resu, resv]
+        # the boundary terms are added to rhs_uvstar in place
+        rhs_uvstarcd = self.boundary_injection.inject(rhs_uvstar, [uNbc, uSbc, uWbc, uEbc], [vNbc, vSbc, vWbc, vEbc])
         
         return rhs_uvstarcd
 
@@ -7,6 +7,17 @@ the spatial geometry and the structure of velocity and potential fields.
 from __future__ import division
 import numpy as np
 import time
+import contextlib
+try:
+    import numexpr
+except ImportError:
+    # the lazy field expressions are evaluated by blocked NumPy loops
+    numexpr = None
+try:
+    import numba
+except ImportError:
+    # the stencils run as NumPy slice arithmetic
+    numba = None
 
 # 2D Navier Stokes solver
 # mesh contains the meshgrid for velocity and pressure
@@ -15,9 +26,134 @@ import time
 # time_domain = [t0, tend]
 
 __all__ = ['mesh', 'VelocityField', 'VelocityComplete', 
-	'InitialCondition', 'CentredPotential', 'Exact_solutions']
+	'InitialCondition', 'CentredPotential', 'Exact_solutions',
+	'LazyVelocityField', 'lazy_fields', 'Boundary_values', 'Separable_forcing', 'register_forcing', 'set_kernel_backend', 'kernel_backend',
+	'extrapolated_gradient', 'same_view', 'check_kernel_backends']
+
+# kernel backend of the stencils (divergence, diffusion, non linear convection, gradient and the extrapolated
+# gradient of phi used by the solvers): 'numba' runs compiled parallel loops, 'numpy' runs slice arithmetic
+# the loops apply the operations in the same order as the NumPy expressions
+_kernel_backend = ['numba' if numba is not None else 'numpy']
+
+def set_kernel_backend(backend):
+    if backend not in ('numba', 'numpy'):
+        raise TypeError('unknown kernel backend '+str(backend))
+    if backend == 'numba' and numba is None:
+        raise ImportError('the numba kernel backend needs numba')
+    _kernel_backend[0] = backend
+
+def kernel_backend():
+    return _kernel_backend[0]
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _divergence_kernel(u, v, dx, dy, div):
+        m, n = div.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                div[i,j] = (u[i+1,j+1] - u[i+1,j])/dx + (v[i+1,j+1] - v[i,j+1])/dy
+
+    @numba.njit(parallel=True, cache=True)
+    def _diffusion_kernel(u, v, dx, dy, diffu, diffv):
+        m, n = diffu.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                diffu[i,j] = (u[i+1,j+2] - 2*u[i+1,j+1] + u[i+1,j])/(dx**2) + (u[i+2,j+1] - 2*u[i+1,j+1] + u[i,j+1])/(dy**2)
+        m, n = diffv.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                diffv[i,j] = (v[i+1,j+2] - 2*v[i+1,j+1] + v[i+1,j])/(dx**2) + (v[i+2,j+1] - 2*v[i+1,j+1] + v[i,j+1])/(dy**2)
+
+    @numba.njit(parallel=True, cache=True)
+    def _convection_kernel(u, v, dx, dy, convcu, convcv):
+        m, n = convcu.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                # 4 point average of v
+                va = 0.5*(0.5*(v[i+1,j+2] + v[i+1,j+1]) + 0.5*(v[i,j+2] + v[i,j+1]))
+                convcu[i,j] = u[i+1,j+1]*(u[i+1,j+2] - u[i+1,j])/(2*dx) + va*(u[i+2,j+1] - u[i,j+1])/(2*dy)
+        m, n = convcv.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                # 4 point average of u
+                ua = 0.5*(0.5*(u[i+2,j+1] + u[i+2,j]) + 0.5*(u[i+1,j+1] + u[i+1,j]))
+                convcv[i,j] = ua*(v[i+1,j+2] - v[i+1,j])/(2*dx) + v[i+1,j+1]*(v[i+2,j+1] - v[i,j+1])/(2*dy)
+
+    @numba.njit(parallel=True, cache=True)
+    def _gradient_kernel(p, dx, dy, px, py):
+        m, n = px.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                px[i,j] = (p[i,j+1] - p[i,j])/dx
+        m, n = py.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                py[i,j] = (p[i+1,j] - p[i,j])/dy
+
+    @numba.njit(parallel=True, cache=True)
+    def _extrapolated_gradient_kernel(phiold, phin, dx, dy, gradphiu, gradphiv):
+        m, n = gradphiu.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                gradphiu[i,j] = ((2*phin[i,j+1] - phiold[i,j+1]) - (2*phin[i,j] - phiold[i,j]))/dx
+        m, n = gradphiv.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                gradphiv[i,j] = ((2*phin[i+1,j] - phiold[i+1,j]) - (2*phin[i,j] - phiold[i,j]))/dy
+
+# gradient of phi^{n+1} appro 2*phi^n - phi^{n-1} on the complete grid (ghost nodes included)
+# phiold_cmp, phin_cmp: phi at time n-1 and n with ghost nodes, returns [gradphiu, gradphiv]
+def extrapolated_gradient(phiold_cmp, phin_cmp, dx, dy):
+    m = phin_cmp.shape[0] - 2
+    n = phin_cmp.shape[1] - 2
+    if _kernel_backend[0] == 'numba':
+        gradphiu = np.empty((m+2,n+1))
+        gradphiv = np.empty((m+1,n+2))
+        _extrapolated_gradient_kernel(phiold_cmp, phin_cmp, dx, dy, gradphiu, gradphiv)
+        return [gradphiu, gradphiv]
+    phiapp_cmp = 2*phin_cmp - phiold_cmp
+    gradphiu = (phiapp_cmp[:,1:n+2] - phiapp_cmp[:,0:n+1])/dx
+    gradphiv = (phiapp_cmp[1:m+2,:] - phiapp_cmp[0:m+1,:])/dy
+    return [gradphiu, gradphiv]
+
+# True if the numpy arrays a and b are the same view of the same memory (e.g. the interior of a completed field)
+# the completions use it to skip copying an interior which was written in place
+def same_view(a, b):
+    if not isinstance(a, np.ndarray) or not isinstance(b, np.ndarray):
+        return False
+    return a.__array_interface__['data'][0] == b.__array_interface__['data'][0] and a.shape == b.shape and a.strides == b.strides
+
+# cross-check of the numba kernels against the NumPy kernels on random fields
+# returns the largest difference (relative to the largest NumPy value) of every operator
+def check_kernel_backends(gridsize=[32, 48], seed=0):
+    if numba is None:
+        raise ImportError('the numba kernel backend needs numba')
+    m, n = gridsize
+    grid = mesh(gridsize, [[0, 1], [0, 2]], [0, 1], 0.1, 1.0)
+    random = np.random.RandomState(seed)
+    uv = VelocityField(random.rand(m+2,n+1), random.rand(m+1,n+2), grid)
+    p = CentredPotential(random.rand(m,n), grid)
+    phiold_cmp = random.rand(m+2,n+2)
+    phin_cmp = random.rand(m+2,n+2)
+    operators = {'divergence': lambda: [uv.divergence().get_value()],
+                 'diffusion': lambda: uv.diffusion().get_uv(),
+                 'non_linear_convection': lambda: uv.non_linear_convection().get_uv(),
+                 'gradient': lambda: p.gradient().get_uv(),
+                 'extrapolated_gradient': lambda: extrapolated_gradient(phiold_cmp, phin_cmp, grid.dx, grid.dy)}
+    previous = _kernel_backend[0]
+    differences = {}
+    try:
+        for name, operator in operators.items():
+            _kernel_backend[0] = 'numpy'
+            reference = operator()
+            _kernel_backend[0] = 'numba'
+            result = operator()
+            differences[name] = max(np.max(np.abs(r - a))/np.max(np.abs(a)) for r, a in zip(result, reference))
+    finally:
+        _kernel_backend[0] = previous
+    return differences
  
-class mesh:
+class mesh(object):
     '''This class constructurs the structure of meshgrids for velocity and pressure'''
     def __init__(self, gridsize, spatial_domain, time_domain, CFL, Re):
         # m: row, n: column
@@ -27,15 +163,15 @@ class mesh:
         self.sdomain = spatial_domain
         self.tdomain = time_domain
         self.CFL = CFL
-        # dt: delta t
+        # dx, dy: delta x and delta y
+        self.dx = abs(float(self.sdomain[0][1] - self.sdomain[0][0]))/self.n
+        self.dy = abs(float(self.sdomain[1][1] - self.sdomain[1][0]))/self.m
+        # dt: delta t (dt1 needs dx and dy)
 #        self.dt1 = abs(((self.sdomain[0][1] - self.sdomain[0][0])/self.gds[0])*CFL)
 	self.dt1 = CFL/(1.0/self.dx + 1.0/self.dy)
         # tn: number of iterations
         self.Tn = int(round(self.tdomain[1]/self.dt1))
 	self.dt = abs(float(self.tdomain[1] - self.tdomain[0]))/self.Tn
-        # dx, dy: delta x and delta y
-        self.dx = abs(float(self.sdomain[0][1] - self.sdomain[0][0]))/self.n
-        self.dy = abs(float(self.sdomain[1][1] - self.sdomain[1][0]))/self.m
         # xu, yu: horizontal velocity grids
         # xv, yvv: vertical velocity grids
         self.xu = np.linspace(start=self.sdomain[0][0], stop=self.sdomain[0][1],num=self.n+1)
@@ -44,65 +180,145 @@ class mesh:
         self.yv = np.linspace(start=self.sdomain[1][0], stop=self.sdomain[1][1],num=self.m+1)
 	self.Re = Re
 
-    # functions ubndmg, vbndmg, uintmg, vintmg and pintmg returns the meshgrids for velocities and pressure
+    # geometry of the mesh (meshgrids, integration weights), computed on first use and shared by all callers
+    # the key includes the grid size and spacing as the multigrid levels are shallow copies of the mesh with other m, n, dx, dy
+    def cached(self, name, compute):
+        try:
+            arrays = self._geometry
+        except AttributeError:
+            arrays = self._geometry = {}
+        key = (name, self.m, self.n, self.dx, self.dy)
+        if key not in arrays:
+            arrays[key] = compute()
+        return arrays[key]
+
+    # the x and y grids of the nodes with the 1D coordinates x (columns) and y (rows)
+    # they are read only views of x and y broadcast to the grid shape, so no full size arrays are allocated
+    # and np.sin(X)*np.cos(Y) gives the same values as with np.meshgrid
+    def broadcast_grid(self, x, y):
+        shape = (y.size, x.size)
+        return [np.broadcast_to(x[np.newaxis,:], shape), np.broadcast_to(y[:,np.newaxis], shape)]
+
+    # meshgrids [X, Y] for velocities and pressure (read only, shared)
     # bnd: grid including boundary points; int: grid only containing interior points
+    @property
+    def ubnd(self):
+        return self.cached('ubnd', lambda: self.broadcast_grid(self.xu, self.yu))
+
+    @property
+    def vbnd(self):
+        return self.cached('vbnd', lambda: self.broadcast_grid(self.xv, self.yv))
+
+    @property
+    def uint(self):
+        return self.cached('uint', lambda: self.broadcast_grid(self.xu[1:-1], self.yu))
+
+    @property
+    def vint(self):
+        return self.cached('vint', lambda: self.broadcast_grid(self.xv, self.yv[1:-1]))
+
+    @property
+    def pint(self):
+        return self.cached('pint', lambda: self.broadcast_grid(self.xv, self.yu))
+
+    # functions ubndmg, vbndmg, uintmg, vintmg and pintmg returns the x or y meshgrid for velocities and pressure
     def ubndmg(self, x):
         # mg means mesh grid
         # Xu and Yu include boundary locations
-        Xu, Yu = np.meshgrid(self.xu,self.yu)
-        # u is a list of x and y grids
+        Xu, Yu = self.ubnd
         if x == "x":
             return Xu
         else:
             return Yu
 
     def vbndmg(self, x):
-        Xv, Yv = np.meshgrid(self.xv,self.yv)
+        Xv, Yv = self.vbnd
         if x == "x":
             return Xv
         else:
             return Yv
 
     def uintmg(self, x):
-        xuint = self.xu[1:-1]
-        Xuint, Yuint = np.meshgrid(xuint, self.yu)
+        Xuint, Yuint = self.uint
         if x == "x":
             return Xuint
         else:
             return Yuint
 
     def vintmg(self, x):
-        yvint = self.yv[1:-1]
-        Xvint, Yvint = np.meshgrid(self.xv, yvint)
+        Xvint, Yvint = self.vint
         if x == "x":
             return Xvint
         else:
             return Yvint
 
     def pintmg(self, x):
-        XPint, YPint = np.meshgrid(self.xv, self.yu)
+        XPint, YPint = self.pint
         if x == "x":
             return XPint
         else:
             return YPint
 
-    # this function integrates a CentredPotential object
-    # this is mainly used in solving the Poisson pressure linear system
-    def integrate(self, p_int=None, integration_method='Riemann'):
+    # scratch arrays of the stencil operations (e.g. VelocityField.diffusion), allocated once per mesh and shape
+    # their contents are only valid within one operation, results are never returned in them
+    def workspace(self, name, shape):
+        try:
+            arrays = self._workspace
+        except AttributeError:
+            arrays = self._workspace = {}
+        key = (name, shape)
+        if key not in arrays:
+            arrays[key] = np.empty(shape)
+        return arrays[key]
+
+    # boundary value provider of the flow problem Boundary_type (one per mesh, see Boundary_values)
+    def boundary_values(self, Boundary_type):
+        try:
+            providers = self._boundary_values
+        except AttributeError:
+            providers = self._boundary_values = {}
+        if Boundary_type not in providers:
+            providers[Boundary_type] = Boundary_values(self, Boundary_type)
+        return providers[Boundary_type]
+
+    # forcing term [Fu, Fv] (interior u and v nodes) of the flow problem at the time level t
+    # 0 if no forcing is registered for the problem (see register_forcing and Separable_forcing)
+    def forcing_term(self, test_problem_name, t):
+        if test_problem_name not in forcing_terms:
+            return 0
+        try:
+            providers = self._forcing_terms
+        except AttributeError:
+            providers = self._forcing_terms = {}
+        if test_problem_name not in providers:
+            providers[test_problem_name] = Separable_forcing(self, *forcing_terms[test_problem_name])
+        return providers[test_problem_name].values(t)
+
+    # integration weights (1D array of length m*n) of the integration method, cached and read only
+    def integration_weights(self, integration_method='Riemann'):
         n = self.n
 	m = self.m
 	dh = self.dx
 
 	if integration_method == 'Riemann':
 	    # use Riemann sum to approximate the integral
-	    h = dh**2
-	    C1 = np.ones(n*m)
-	    C = h*C1
+	    def weights():
+	        h = dh**2
+	        C1 = np.ones(n*m)
+	        C = h*C1
+	        C.setflags(write=False)
+	        return C
 	# other methods such as Simpson's rule could be explored
 	else:
 	    raise TypeError('only Riemann sum is implemented')
+	return self.cached(('integration weights', integration_method), weights)
 
-	if p_int == None:
+    # this function integrates a CentredPotential object
+    # this is mainly used in solving the Poisson pressure linear system
+    def integrate(self, p_int=None, integration_method='Riemann'):
+	C = self.integration_weights(integration_method)
+
+	if p_int is None:
 	    # return the integration matrix as a 1 D array
 	    return C
 	else:
@@ -114,7 +330,12 @@ class mesh:
 
 # This class constructs the structure of velocity fields (u, v)     
 # It defines the basic operations and properties of velocity fields
-class VelocityField:
+class VelocityField(object):
+    # the velocity fields are created at every stage of every time step, __slots__ avoids a __dict__ per instance
+    __slots__ = ('ucmp', 'vcmp', 'mesh')
+    # numpy arraies defer to the reflected operators (ndarray + VelocityField is a VelocityField)
+    __array_ufunc__ = None
+
     def __init__(self, ucmp, vcmp, mesh):
         
         # the class assumes u and v are in the complete form: interior + boundary + ghost nodes
@@ -125,11 +346,19 @@ class VelocityField:
     # returns the complete points (interior + boundary + ghost nodes) for u and v in the form of numpy arraies 
     def get_uv(self):
         return [self.ucmp, self.vcmp]
+    # returns a VelocityField instance with copies of the u and v arraies (the mesh is shared)
+    def copy(self):
+        return VelocityField(np.copy(self.ucmp), np.copy(self.vcmp), self.mesh)
     # returns the interior points of u and v in the form of numpy arries
     def get_int_uv(self):
         n = self.mesh.n
         m = self.mesh.m
         return [self.ucmp[1:m+1,1:n], self.vcmp[1:m,1:n+1]]
+    # copies uv_int = [u_int, v_int] into the interior points, nothing is copied if they are the interior (views) already
+    def set_int_uv(self, uv_int):
+        for a, a_int in zip(self.get_int_uv(), uv_int):
+            if not same_view(a, a_int):
+                a[...] = a_int
     # returns the interior and boundary points of u and v in the form of numpy arries
     def get_bnd_uv(self):
         n = self.mesh.n
@@ -139,11 +368,16 @@ class VelocityField:
         return [u_bnd, v_bnd]
     
     # defines the basic operations for velocity fields
+    # in the lazy mode (see lazy_fields) the operators return LazyVelocityField expressions
     def __neg__(self):
         # negation
+        if _lazy_mode[0]:
+            return -LazyVelocityField.leaf(self, self.mesh)
         return VelocityField(-self.ucmp, -self.vcmp, self.mesh)
         
     def __add__(self, other):
+        if _lazy_mode[0]:
+            return LazyVelocityField.leaf(self, self.mesh) + other
         ## addition between two VelocityField instances
         try:
             ou, ov = other.get_uv()
@@ -162,23 +396,37 @@ class VelocityField:
         return VelocityField(nu, nv, self.mesh)
 
     def __radd__(self, other):
-        ## right addition between two VelocityField instances
-        #print other, "other radd"
-        return self.__rsub__(-other)
+        ## right addition, the addition is commutative
+        return self.__add__(other)
 
     def __sub__(self, other):
+        if _lazy_mode[0]:
+            return LazyVelocityField.leaf(self, self.mesh) - other
         return self.__add__(-other)
         
     def __rsub__(self, other):
-        return -self.__sub__(other)
+        if _lazy_mode[0]:
+            return other - LazyVelocityField.leaf(self, self.mesh)
+        ## right subtraction with numpy arraies, list of numpy arraies or integer (other - self)
+        try:
+            nu = other[0] - self.ucmp
+            nv = other[1] - self.vcmp
+        except TypeError:
+            nu = other - self.ucmp
+            nv = other - self.vcmp
+        return VelocityField(nu, nv, self.mesh)
 
     def __mul__(self, other):
         # multiplication only defined between VelocityField instances and integers
+        if _lazy_mode[0]:
+            return LazyVelocityField.leaf(self, self.mesh)*other
         nu = self.ucmp*other
         nv = self.vcmp*other
         return VelocityField(nu, nv, self.mesh) 
         
     def __rmul__(self, other):
+        if _lazy_mode[0]:
+            return LazyVelocityField.leaf(self, self.mesh)*other
         nu = self.ucmp*other
         nv = self.vcmp*other
         return VelocityField(nu, nv, self.mesh)
@@ -187,8 +435,57 @@ class VelocityField:
         # division only defined between VelocityField instances and integers
         return self.__mul__(1.0/other)
 
+    ## in place operations: the arrays of self are overwritten (no new arrays are allocated)
+    # note: the interior fields returned by get_int_uv are views of the complete arrays
+    def __iadd__(self, other):
+        ## same operands as __add__
+        try:
+            ou, ov = other.get_uv()
+        except AttributeError:
+            try:
+                ou, ov = other[0], other[1]
+            except TypeError:
+                ou, ov = other, other
+        self.ucmp += ou
+        self.vcmp += ov
+        return self
+
+    def __isub__(self, other):
+        try:
+            ou, ov = other.get_uv()
+        except AttributeError:
+            try:
+                ou, ov = other[0], other[1]
+            except TypeError:
+                ou, ov = other, other
+        self.ucmp -= ou
+        self.vcmp -= ov
+        return self
+
+    def __imul__(self, other):
+        # multiplication only defined between VelocityField instances and integers
+        self.ucmp *= other
+        self.vcmp *= other
+        return self
+
+    def axpy(self, a, other):
+        # self += a*other in place, other is a VelocityField instance or a list of numpy arraies
+        # a*other is written into a workspace array of the mesh, so no temporary is allocated
+        try:
+            ou, ov = other.get_uv()
+        except AttributeError:
+            ou, ov = other[0], other[1]
+        for x, y in ((self.ucmp, ou), (self.vcmp, ov)):
+            w = self.mesh.workspace('axpy', np.shape(y))
+            np.multiply(a, y, out=w)
+            np.add(x, w, out=x)
+        return self
+
     ## below defines the divergence, difussion and non linear convection operations
-    def divergence(self):
+    # the temporaries of the stencils are written into the workspace arrays of the mesh (ufunc out=), so only the
+    # results are allocated. out: optional CentredPotential (VelocityField) whose arrays receive the result
+    # the order of the floating point operations is the same as in the plain slice expressions (identical results)
+    def divergence(self, out=None):
         # calculate the divergence of (u,v) at interior points
         # uv_cmp must be completed with boundary and ghose points. Dimension: m+2 x n+1, m+1 x n+2  
         m = self.mesh.m
@@ -198,13 +495,27 @@ class VelocityField:
         dx = self.mesh.dx
         dy = self.mesh.dy
                
-        div = (ubnd[:,1:n+1] - ubnd[:,0:n])/dx +\
-              (vbnd[1:m+1,:] - vbnd[0:m,:])/dy
+        # div = (ubnd[:,1:n+1] - ubnd[:,0:n])/dx + (vbnd[1:m+1,:] - vbnd[0:m,:])/dy
+        if out is None:
+            div = np.empty((m,n))
+        else:
+            div = out.get_value()
+        if _kernel_backend[0] == 'numba':
+            _divergence_kernel(self.ucmp, self.vcmp, dx, dy, div)
+        else:
+            w = self.mesh.workspace('div', (m,n))
+            np.subtract(ubnd[:,1:n+1], ubnd[:,0:n], out=div)
+            np.divide(div, dx, out=div)
+            np.subtract(vbnd[1:m+1,:], vbnd[0:m,:], out=w)
+            np.divide(w, dy, out=w)
+            np.add(div, w, out=div)
+        if out is not None:
+            return out
         divPotentialField = CentredPotential(div, self.mesh)
         
         return divPotentialField
         
-    def diffusion(self):
+    def diffusion(self, out=None):
         # calculate the diffusive terms of u (v) at interior points
         # uv_cmp must be completed with boundary and ghose points. Dimension: m+2 x n+1, m+1 x n+2
         n = self.mesh.n
@@ -215,14 +526,46 @@ class VelocityField:
         u = self.ucmp
         v = self.vcmp
         
-        diffu = (u[1:m+1,2:n+1] -2*u[1:m+1,1:n] + u[1:m+1,0:n-1])/(dx**2) +\
-                (u[2:m+2,1:n] - 2*u[1:m+1,1:n] + u[0:m,1:n])/(dy**2)
-        diffv = (v[1:m,2:n+2] - 2*v[1:m,1:n+1] + v[1:m,0:n])/(dx**2) +\
-                (v[2:m+1,1:n+1] - 2*v[1:m,1:n+1] + v[0:m-1,1:n+1])/(dy**2)
+        if out is None:
+            diffu = np.empty((m,n-1))
+            diffv = np.empty((m-1,n))
+        else:
+            diffu, diffv = out.get_uv()
+        if _kernel_backend[0] == 'numba':
+            _diffusion_kernel(u, v, dx, dy, diffu, diffv)
+            if out is not None:
+                return out
+            return VelocityField(diffu, diffv, self.mesh)
+        # diffu = (u[1:m+1,2:n+1] -2*u[1:m+1,1:n] + u[1:m+1,0:n-1])/(dx**2) +
+        #         (u[2:m+2,1:n] - 2*u[1:m+1,1:n] + u[0:m,1:n])/(dy**2)
+        w1 = self.mesh.workspace('diff1', (m,n-1))
+        w2 = self.mesh.workspace('diff2', (m,n-1))
+        np.multiply(2, u[1:m+1,1:n], out=w1)
+        np.subtract(u[1:m+1,2:n+1], w1, out=diffu)
+        np.add(diffu, u[1:m+1,0:n-1], out=diffu)
+        np.divide(diffu, dx**2, out=diffu)
+        np.subtract(u[2:m+2,1:n], w1, out=w2)
+        np.add(w2, u[0:m,1:n], out=w2)
+        np.divide(w2, dy**2, out=w2)
+        np.add(diffu, w2, out=diffu)
+        # diffv = (v[1:m,2:n+2] - 2*v[1:m,1:n+1] + v[1:m,0:n])/(dx**2) +
+        #         (v[2:m+1,1:n+1] - 2*v[1:m,1:n+1] + v[0:m-1,1:n+1])/(dy**2)
+        w1 = self.mesh.workspace('diff1', (m-1,n))
+        w2 = self.mesh.workspace('diff2', (m-1,n))
+        np.multiply(2, v[1:m,1:n+1], out=w1)
+        np.subtract(v[1:m,2:n+2], w1, out=diffv)
+        np.add(diffv, v[1:m,0:n], out=diffv)
+        np.divide(diffv, dx**2, out=diffv)
+        np.subtract(v[2:m+1,1:n+1], w1, out=w2)
+        np.add(w2, v[0:m-1,1:n+1], out=w2)
+        np.divide(w2, dy**2, out=w2)
+        np.add(diffv, w2, out=diffv)
         
+        if out is not None:
+            return out
         return VelocityField(diffu, diffv, self.mesh)
     
-    def non_linear_convection(self):
+    def non_linear_convection(self, out=None):
         # calculate the convective terms of u (v) at interior points
         # use 4 point average to calculate u and v values at pressure nodes
         # uv_cmp must be completed with boundary and ghost points m+2 x n+1, m+1 x n+2
@@ -233,19 +576,262 @@ class VelocityField:
 
         u = self.ucmp
         v = self.vcmp
+        if _kernel_backend[0] == 'numba':
+            if out is None:
+                out = VelocityField(np.empty((m,n-1)), np.empty((m-1,n)), self.mesh)
+            _convection_kernel(u, v, dx, dy, out.get_uv()[0], out.get_uv()[1])
+            return out
 
         # average U and V (4 point average)
-        uah = 0.5*(u[:,1:n+1] + u[:,0:n])
-        ua = 0.5*(uah[2:m+1,:] + uah[1:m,:])
-        vah = 0.5*(v[:,2:n+1] + v[:,1:n])
-        va = 0.5*(vah[1:m+1,:] + vah[0:m,:])
+        # uah = 0.5*(u[:,1:n+1] + u[:,0:n]), ua = 0.5*(uah[2:m+1,:] + uah[1:m,:])
+        uah = self.mesh.workspace('uah', (m+2,n))
+        ua = self.mesh.workspace('ua', (m-1,n))
+        np.add(u[:,1:n+1], u[:,0:n], out=uah)
+        np.multiply(0.5, uah, out=uah)
+        np.add(uah[2:m+1,:], uah[1:m,:], out=ua)
+        np.multiply(0.5, ua, out=ua)
+        # vah = 0.5*(v[:,2:n+1] + v[:,1:n]), va = 0.5*(vah[1:m+1,:] + vah[0:m,:])
+        vah = self.mesh.workspace('vah', (m+1,n-1))
+        va = self.mesh.workspace('va', (m,n-1))
+        np.add(v[:,2:n+1], v[:,1:n], out=vah)
+        np.multiply(0.5, vah, out=vah)
+        np.add(vah[1:m+1,:], vah[0:m,:], out=va)
+        np.multiply(0.5, va, out=va)
         
-        convcu = u[1:m+1,1:n]*(u[1:m+1,2:n+1] - u[1:m+1,0:n-1])/(2*dx) +\
-                 va[:]*(u[2:m+2,1:n] - u[0:m,1:n])/(2*dy)
-        convcv = ua[:]*(v[1:m,2:n+2] - v[1:m,0:n])/(2*dx) +\
-                 v[1:m,1:n+1]*(v[2:m+1,1:n+1] - v[0:m-1,1:n+1])/(2*dy)
+        if out is None:
+            convcu = np.empty((m,n-1))
+            convcv = np.empty((m-1,n))
+        else:
+            convcu, convcv = out.get_uv()
+        # convcu = u[1:m+1,1:n]*(u[1:m+1,2:n+1] - u[1:m+1,0:n-1])/(2*dx) + va*(u[2:m+2,1:n] - u[0:m,1:n])/(2*dy)
+        w = self.mesh.workspace('convc', (m,n-1))
+        np.subtract(u[1:m+1,2:n+1], u[1:m+1,0:n-1], out=convcu)
+        np.multiply(u[1:m+1,1:n], convcu, out=convcu)
+        np.divide(convcu, 2*dx, out=convcu)
+        np.subtract(u[2:m+2,1:n], u[0:m,1:n], out=w)
+        np.multiply(va, w, out=w)
+        np.divide(w, 2*dy, out=w)
+        np.add(convcu, w, out=convcu)
+        # convcv = ua*(v[1:m,2:n+2] - v[1:m,0:n])/(2*dx) + v[1:m,1:n+1]*(v[2:m+1,1:n+1] - v[0:m-1,1:n+1])/(2*dy)
+        w = self.mesh.workspace('convc', (m-1,n))
+        np.subtract(v[1:m,2:n+2], v[1:m,0:n], out=convcv)
+        np.multiply(ua, convcv, out=convcv)
+        np.divide(convcv, 2*dx, out=convcv)
+        np.subtract(v[2:m+1,1:n+1], v[0:m-1,1:n+1], out=w)
+        np.multiply(v[1:m,1:n+1], w, out=w)
+        np.divide(w, 2*dy, out=w)
+        np.add(convcv, w, out=convcv)
+        if out is not None:
+            return out
         return VelocityField(convcu, convcv, self.mesh)
 
+# lazy expression mode: inside "with lazy_fields():" the arithmetic operators of VelocityField instances build
+# LazyVelocityField expression graphs, and evaluate() computes the whole expression in one pass over the arrays
+_lazy_mode = [False]
+
+@contextlib.contextmanager
+def lazy_fields(enabled=True):
+    previous = _lazy_mode[0]
+    _lazy_mode[0] = enabled
+    try:
+        yield
+    finally:
+        _lazy_mode[0] = previous
+
+class LazyVelocityField(object):
+    '''This class is the expression graph of the arithmetic of VelocityField objects (addition, subtraction,
+       negation, multiplication and division by numbers). The nodes are an operation and its operands, the leaves
+       are the u and v arrays of VelocityField objects (or lists of numpy arraies) and numbers.
+       evaluate() computes u and v in a single pass, with numexpr if it is installed and otherwise in blocks of rows
+       small enough to stay in the cache. The operations are applied in the same order as the eager operators.'''
+    __slots__ = ('op', 'operands', 'mesh')
+    # numpy arraies defer to the reflected operators (ndarray - expression is an expression)
+    __array_ufunc__ = None
+    # number of array elements in a block of the NumPy evaluation
+    block_size = 2**14
+
+    def __init__(self, op, operands, mesh):
+        self.op = op
+        self.operands = operands
+        self.mesh = mesh
+
+    # leaf of the graph, other: the operands accepted by VelocityField.__add__
+    @staticmethod
+    def leaf(other, mesh):
+        if isinstance(other, LazyVelocityField):
+            return other
+        try:
+            uv = other.get_uv()
+        except AttributeError:
+            try:
+                uv = [other[0], other[1]]
+            except TypeError:
+                return LazyVelocityField('number', [other], mesh)
+        return LazyVelocityField('arrays', uv, mesh)
+
+    def __neg__(self):
+        return LazyVelocityField('neg', [self], self.mesh)
+
+    def __add__(self, other):
+        return LazyVelocityField('add', [self, self.leaf(other, self.mesh)], self.mesh)
+
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        return LazyVelocityField('sub', [self, self.leaf(other, self.mesh)], self.mesh)
+
+    def __rsub__(self, other):
+        return LazyVelocityField('sub', [self.leaf(other, self.mesh), self], self.mesh)
+
+    def __mul__(self, other):
+        return LazyVelocityField('mul', [self, self.leaf(other, self.mesh)], self.mesh)
+
+    def __rmul__(self, other):
+        return self.__mul__(other)
+
+    def __truediv__(self, other):
+        return self.__mul__(1.0/other)
+
+    # the arrays of the leaves of component i (0: u, 1: v)
+    def arrays(self, i):
+        if self.op == 'arrays':
+            return [self.operands[i]]
+        if self.op == 'number':
+            return []
+        return [a for operand in self.operands for a in operand.arrays(i)]
+
+    # values of component i on the rows of the block (a slice)
+    def block(self, i, rows):
+        if self.op == 'arrays':
+            return self.operands[i][rows]
+        if self.op == 'number':
+            return self.operands[0]
+        if self.op == 'neg':
+            return -self.operands[0].block(i, rows)
+        a = self.operands[0].block(i, rows)
+        b = self.operands[1].block(i, rows)
+        if self.op == 'add':
+            return a + b
+        if self.op == 'sub':
+            return a - b
+        return a*b
+
+    # numexpr string of component i, the leaves are added to names
+    def expression(self, i, names):
+        if self.op in ('arrays', 'number'):
+            name = 'x%d' % len(names)
+            names[name] = self.operands[i if self.op == 'arrays' else 0]
+            return name
+        if self.op == 'neg':
+            return '(-%s)' % self.operands[0].expression(i, names)
+        symbol = {'add': '+', 'sub': '-', 'mul': '*'}[self.op]
+        return '(%s %s %s)' % (self.operands[0].expression(i, names), symbol, self.operands[1].expression(i, names))
+
+    # computes the expression, returns a VelocityField object
+    # out: optional VelocityField object whose arrays receive the result
+    def evaluate(self, out=None):
+        uv = []
+        for i in xrange(2):
+            shape = self.arrays(i)[0].shape
+            if out is None:
+                result = np.empty(shape)
+            else:
+                result = out.get_uv()[i]
+            if numexpr is not None:
+                names = {}
+                numexpr.evaluate(self.expression(i, names), local_dict=names, out=result)
+            else:
+                step = max(1, self.block_size//max(1, shape[-1]))
+                for j in xrange(0, shape[0], step):
+                    result[j:j+step] = self.block(i, slice(j, j+step))
+            uv.append(result)
+        if out is not None:
+            return out
+        return VelocityField(uv[0], uv[1], self.mesh)
+
+    # a lazy expression can be used in place of a VelocityField object
+    def get_uv(self):
+        return self.evaluate().get_uv()
+
+class Boundary_values:
+    '''This class provides the boundary values of u and v of a flow problem at the time levels t (t th iteration)
+       The spatial factors (cos(xu), sin(yu), ...) are evaluated once per mesh (see mesh.boundary_values), only the
+       time factors (exp(-2t), sin(t), the phase shift t) are applied at a time level, and the values of the last
+       time levels are memoized. values(t) returns [ubnd_value, vbnd_value], dictionaries of the South, East, West
+       and North boundary points (shared, read only)'''
+    # number of memoized time levels
+    levels = 4
+
+    def __init__(self, mesh, Boundary_type):
+        self.mesh = mesh
+        self.Boundary_type = Boundary_type
+        self.memo = {}
+        xu, yu = mesh.xu, mesh.yu
+        xv, yv = mesh.xv, mesh.yv
+        xl, xr = mesh.sdomain[0]
+        yl, yr = mesh.sdomain[1]
+        if Boundary_type == "driven_cavity":
+            # using the lid driven condition
+            # currently the East boundary of V velocity is set to be constant 1 (this is flexible)
+            self.constant = [{'S': 0, 'E': 0, 'W': 0, 'N': 0}, {'S': 0, 'E': 1, 'W': 0, 'N': 0}]
+        elif Boundary_type == "Taylor":
+            # spatial factors, multiplied by exp(-2t)
+            self.factors = [{'N': -np.cos(xu)*np.sin(yl), 'S': -np.cos(xu)*np.sin(yr),
+                             'W': -np.cos(xl)*np.sin(yu), 'E': -np.cos(xr)*np.sin(yu)},
+                            {'N': np.sin(xv)*np.cos(yl), 'S': np.sin(xv)*np.cos(yr),
+                             'W': np.sin(xl)*np.cos(yv), 'E': np.sin(xr)*np.cos(yv)}]
+        elif Boundary_type == "periodic_forcing_1":
+            # pairs of spatial factors, multiplied by pi*sin(t) (u) and -pi*sin(t) (v)
+            self.factors = [{'N': [np.sin(2*np.pi*yl), np.sin(np.pi*xu)**2], 'S': [np.sin(2*np.pi*yr), np.sin(np.pi*xu)**2],
+                             'W': [np.sin(2*np.pi*yu), np.sin(np.pi*xl)**2], 'E': [np.sin(2*np.pi*yu), np.sin(np.pi*xr)**2]},
+                            {'N': [np.sin(2*np.pi*xv), np.sin(np.pi*yl)**2], 'S': [np.sin(2*np.pi*xv), np.sin(np.pi*yr)**2],
+                             'W': [np.sin(2*np.pi*xl), np.sin(np.pi*yv)**2], 'E': [np.sin(2*np.pi*xr), np.sin(np.pi*yv)**2]}]
+        elif Boundary_type == "periodic_forcing_2":
+            # sines and cosines of the grids, shifted by t with the trigonometric addition formulas
+            self.factors = dict((name, [np.sin(x), np.cos(x)]) for name, x in [('xu', xu), ('yu', yu), ('xv', xv), ('yv', yv)])
+        else:
+            raise TypeError('unknown boundary type '+str(Boundary_type))
+
+    def values(self, t):
+        if t not in self.memo:
+            if len(self.memo) >= self.levels:
+                del self.memo[min(self.memo)]
+            tn = self.mesh.dt*t + self.mesh.tdomain[0]
+            if self.Boundary_type == "driven_cavity":
+                self.memo[t] = self.constant
+            elif self.Boundary_type == "Taylor":
+                self.memo[t] = self.Taylor(tn)
+            elif self.Boundary_type == "periodic_forcing_1":
+                self.memo[t] = self.forcing_1(tn)
+            else:
+                self.memo[t] = self.forcing_2(tn)
+        return self.memo[t]
+
+    # unforced Taylor flow full Navier Stokes problem
+    def Taylor(self, tn):
+        decay = np.exp(-2*tn)
+        return [dict((side, f*decay) for side, f in factors.items()) for factors in self.factors]
+
+    # first type of forced flow linearised Navier Stokes problem
+    def forcing_1(self, tn):
+        amplitude = [np.pi*np.sin(tn), -np.pi*np.sin(tn)]
+        return [dict((side, amplitude[i]*f[0]*f[1]) for side, f in self.factors[i].items()) for i in xrange(2)]
+
+    # second type of forced flow linearised Navier Stokes problem
+    def forcing_2(self, tn):
+        xl, xr = self.mesh.sdomain[0]
+        yl, yr = self.mesh.sdomain[1]
+        st, ct = np.sin(tn), np.cos(tn)
+        # sin(x + t) and cos(x + t) of the grids
+        sin_t = dict((name, s*ct + c*st) for name, (s, c) in self.factors.items())
+        cos_t = dict((name, c*ct - s*st) for name, (s, c) in self.factors.items())
+        ubnd_value = {'N': sin_t['xu']*np.sin(yl + tn), 'S': sin_t['xu']*np.sin(yr + tn),
+                      'W': np.sin(xl + tn)*sin_t['yu'], 'E': np.sin(xr + tn)*sin_t['yu']}
+        vbnd_value = {'N': cos_t['xv']*np.cos(yl + tn), 'S': cos_t['xv']*np.cos(yr + tn),
+                      'W': np.cos(xl + tn)*cos_t['yv'], 'E': np.cos(xr + tn)*cos_t['yv']}
+        return [ubnd_value, vbnd_value]
+
 class VelocityComplete:
     '''This class complete the velocity fields (i.e adding boundary and ghost points)
        mesh is the mesh class, uv_int=[u_int, v_int] is a list of interior u and v in the form of numpy arries
@@ -271,133 +857,42 @@ class VelocityComplete:
         self.mesh = mesh
 
     # returns the boundary points for the Driven cavity flow problem
+    # (all 4 sides (South, East, West and North) of u or v, from the boundary value provider of the mesh)
     def bnd_driven_cavity(self, u):
-        if u == "u":
-            # returns the boundary value for u nodes: all 4 sides (South, East, West and North) included
-            # using the lid driven condition            
-            ubnd_value = {'S': 0, 'E': 0, 'W': 0, 'N': 0}
-            return ubnd_value
-        elif u == "v":
-            # returns the v boundary points along all 4 sides
-	    # currently the East boundary of V velocity is set to be constant 1 (this is flexible)
-            vbnd_value = {'S': 0, 'E': 1, 'W': 0, 'N': 0}
-            return vbnd_value
+        return self.mesh.boundary_values("driven_cavity").values(self.t)[0 if u == "u" else 1]
             
     # returns the boundary points for unforced Taylor flow full Navier Stokes problem
     def bnd_Taylor(self, u):
-        tn = self.dt*self.t + self.t0
-        if u == "u":
-            uN = -np.cos(self.xu)*np.sin(self.sdomain[1][0])*np.exp(-2*tn)
-            uS = -np.cos(self.xu)*np.sin(self.sdomain[1][1])*np.exp(-2*tn)
-            uW = -np.cos(self.sdomain[0][0])*np.sin(self.yu)*np.exp(-2*tn)
-            uE = -np.cos(self.sdomain[0][1])*np.sin(self.yu)*np.exp(-2*tn)
-            ubnd_value = {'S': uS, 'E': uE, 'W': uW, 'N': uN}            
-            return ubnd_value
-            
-        elif u == "v":
-            vN = np.sin(self.xv)*np.cos(self.sdomain[1][0])*np.exp(-2*tn)
-            vS = np.sin(self.xv)*np.cos(self.sdomain[1][1])*np.exp(-2*tn)
-            vW = np.sin(self.sdomain[0][0])*np.cos(self.yv)*np.exp(-2*tn)
-            vE = np.sin(self.sdomain[0][1])*np.cos(self.yv)*np.exp(-2*tn)
-            vbnd_value = {'S': vS, 'E': vE, 'W': vW, 'N': vN}
-            return vbnd_value
+        return self.mesh.boundary_values("Taylor").values(self.t)[0 if u == "u" else 1]
 
     # returns the boundary points for the first type of forced flow linearised Navier Stokes problem
     def bnd_forcing_1(self, u):
-        tn = self.dt*self.t + self.t0
-        xu, yu = self.xu, self.yu
-        xv, yv = self.xv, self.yv
-        if u == "u":
-            uN = np.pi*np.sin(tn)*np.sin(2*np.pi*self.sdomain[1][0])*(np.sin(np.pi*xu)**2)
-            uS = np.pi*np.sin(tn)*np.sin(2*np.pi*self.sdomain[1][1])*(np.sin(np.pi*xu)**2)
-            uW = np.pi*np.sin(tn)*np.sin(2*np.pi*yu)*(np.sin(np.pi*self.sdomain[0][0])**2)
-            uE = np.pi*np.sin(tn)*np.sin(2*np.pi*yu)*(np.sin(np.pi*self.sdomain[0][1])**2)
-            ubnd_value = {'S': uS, 'E': uE, 'W': uW, 'N': uN}
-            return ubnd_value
-        
-        elif u == "v":
-            vN = -np.pi*np.sin(tn)*np.sin(2*np.pi*xv)*(np.sin(np.pi*self.sdomain[1][0])**2)
-            vS = -np.pi*np.sin(tn)*np.sin(2*np.pi*xv)*(np.sin(np.pi*self.sdomain[1][1])**2)
-            vW = -np.pi*np.sin(tn)*np.sin(2*np.pi*self.sdomain[0][0])*(np.sin(np.pi*yv)**2)
-            vE = -np.pi*np.sin(tn)*np.sin(2*np.pi*self.sdomain[0][1])*(np.sin(np.pi*yv)**2)
-            vbnd_value = {'S': vS, 'E': vE, 'W': vW, 'N': vN}
-            return vbnd_value
+        return self.mesh.boundary_values("periodic_forcing_1").values(self.t)[0 if u == "u" else 1]
 
     # returns the boundary points for the second type of forced flow linearised Navier Stokes problem
     def bnd_forcing_2(self, u):
-        tn = self.dt*self.t + self.t0
-        xu, yu = self.xu, self.yu
-        xv, yv = self.xv, self.yv
-        if u == "u":
-            uN = np.sin(xu + tn)*np.sin(self.sdomain[1][0] + tn)
-            uS = np.sin(xu + tn)*np.sin(self.sdomain[1][1] + tn)
-            uW = np.sin(self.sdomain[0][0] + tn)*np.sin(yu + tn)
-            uE = np.sin(self.sdomain[0][1] + tn)*np.sin(yu + tn)
-            ubnd_value = {'S': uS, 'E': uE, 'W': uW, 'N': uN}
-            return ubnd_value
-        
-        elif u == "v":
-            vN = np.cos(xv + tn)*np.cos(self.sdomain[1][0] + tn)
-            vS = np.cos(xv + tn)*np.cos(self.sdomain[1][1] + tn)
-            vW = np.cos(self.sdomain[0][0] + tn)*np.cos(yv + tn)
-            vE = np.cos(self.sdomain[0][1] + tn)*np.cos(yv + tn)
-            vbnd_value = {'S': vS, 'E': vE, 'W': vW, 'N': vN}
-            return vbnd_value      
+        return self.mesh.boundary_values("periodic_forcing_2").values(self.t)[0 if u == "u" else 1]
     
     # this function completes (add boundary and ghost points) the u and v velocity fields 
-    def complete(self, Boundary_type, return_bnd=False):
+    # out: optional VelocityField instance whose (m+2 x n+1, m+1 x n+2) arraies receive the completed fields
+    # if uv_int are the interior views of out (e.g. written by the linear solver) only the boundary and ghost nodes are written
+    def complete(self, Boundary_type, return_bnd=False, out=None):
         # u and v only given interior points m x n-1, m-1 x n
         n = self.n
         m = self.m
         
-        if Boundary_type == "driven_cavity":
-            uN = self.bnd_driven_cavity('u')['N']
-            uS = self.bnd_driven_cavity('u')['S']
-            uW = self.bnd_driven_cavity('u')['W']
-            uE = self.bnd_driven_cavity('u')['E']
-        
-            vN = self.bnd_driven_cavity('v')['N']
-            vS = self.bnd_driven_cavity('v')['S']
-            vW = self.bnd_driven_cavity('v')['W']
-            vE = self.bnd_driven_cavity('v')['E']
+        ubnd_value, vbnd_value = self.mesh.boundary_values(Boundary_type).values(self.t)
+        uN, uS, uW, uE = ubnd_value['N'], ubnd_value['S'], ubnd_value['W'], ubnd_value['E']
+        vN, vS, vW, vE = vbnd_value['N'], vbnd_value['S'], vbnd_value['W'], vbnd_value['E']
 
-        elif Boundary_type == "Taylor":
-            uN = self.bnd_Taylor('u')['N']
-            uS = self.bnd_Taylor('u')['S']
-            uW = self.bnd_Taylor('u')['W']
-            uE = self.bnd_Taylor('u')['E']
-        
-            vN = self.bnd_Taylor('v')['N']
-            vS = self.bnd_Taylor('v')['S']
-            vW = self.bnd_Taylor('v')['W']
-            vE = self.bnd_Taylor('v')['E']
-
-        elif Boundary_type == "periodic_forcing_1":
-            uN = self.bnd_forcing_1('u')['N']
-            uS = self.bnd_forcing_1('u')['S']
-            uW = self.bnd_forcing_1('u')['W']
-            uE = self.bnd_forcing_1('u')['E']
-        
-            vN = self.bnd_forcing_1('v')['N']
-            vS = self.bnd_forcing_1('v')['S']
-            vW = self.bnd_forcing_1('v')['W']
-            vE = self.bnd_forcing_1('v')['E']
-
-        elif Boundary_type == "periodic_forcing_2":
-            uN = self.bnd_forcing_2('u')['N']
-            uS = self.bnd_forcing_2('u')['S']
-            uW = self.bnd_forcing_2('u')['W']
-            uE = self.bnd_forcing_2('u')['E']
-        
-            vN = self.bnd_forcing_2('v')['N']
-            vS = self.bnd_forcing_2('v')['S']
-            vW = self.bnd_forcing_2('v')['W']
-            vE = self.bnd_forcing_2('v')['E']
-
-        u = np.zeros((m+2,n+1))
-        v = np.zeros((m+1,n+2))
-        u[1:m+1,1:n] = self.uv_int[0]
-        v[1:m,1:n+1] = self.uv_int[1]
+        if out is None:
+            u = np.zeros((m+2,n+1))
+            v = np.zeros((m+1,n+2))
+            out = VelocityField(u, v, self.mesh)
+        else:
+            # every node of the buffers is overwritten below
+            u, v = out.get_uv()
+        out.set_int_uv(self.uv_int)
         
         # add boundary and ghost points in
         # ghost nodes added using cubic polynomial interpolation
@@ -419,10 +914,10 @@ class VelocityComplete:
         v[:,-1] = (16.0/5)*vE - 3*v[:,-2] + v[:,-3] - (1.0/5)*v[:,-4]
         if return_bnd == False:
             # if only want the VelocityField instance
-            return VelocityField(u, v, self.mesh)
+            return out
         else:
             # if wanat the boundary points for u and v in numpy array format
-            return VelocityField(u, v, self.mesh), [[uN, uS, uW, uE], [vN, vS, vW, vE]]
+            return out, [[uN, uS, uW, uE], [vN, vS, vW, vE]]
 
 class InitialCondition:
     '''This class contains the set of inition conditions (could be extended later) 
@@ -537,9 +1032,10 @@ class InitialCondition:
 
 	return Init_uv, Init_P
 	    
-class CentredPotential():
+class CentredPotential(object):
     '''This class constructs the structure of CentredPotential (pressure, scalar potential) objects
        It definies the basic operations and properties for CentredPotential objects'''
+    __slots__ = ('p_int', 'mesh')
 
     def __init__(self, p_int, mesh):
         self.mesh = mesh
@@ -548,11 +1044,17 @@ class CentredPotential():
     # complete function returns the pressure with ghost nodes (used only in solving phi field)
     # uses Neumann boundary condition
     # it returns a numpy array not CentredPotential object    
-    def complete(self):
+    # out: optional m+2 x n+2 numpy array which receives the result (if p_int is its interior view only the ghost nodes are written)
+    def complete(self, out=None):
         n = self.mesh.n
         m = self.mesh.m
-        p_cmp = np.zeros((m+2,n+2))
-        p_cmp[1:m+1,1:n+1] = self.p_int
+        if out is None:
+            p_cmp = np.zeros((m+2,n+2))
+        else:
+            # the ghost nodes are all overwritten below (the East and West columns last)
+            p_cmp = out
+        if not same_view(p_cmp[1:m+1,1:n+1], self.p_int):
+            p_cmp[1:m+1,1:n+1] = self.p_int
         # update ghost nodes
         # South
         p_cmp[-1,:] = p_cmp[-2,:]
@@ -568,6 +1070,9 @@ class CentredPotential():
     # returns the interior points of pressure
     def get_value(self):
         return self.p_int
+    # returns a CentredPotential instance with a copy of the array (the mesh is shared)
+    def copy(self):
+        return CentredPotential(np.copy(self.p_int), self.mesh)
 
     # below defines the basic operations for CentredPotential objects
     def __neg__(self):
@@ -585,14 +1090,15 @@ class CentredPotential():
         return CentredPotential(np, self.mesh)
 
     def __radd__(self, other):
-        ## addition between two CentredPotential instances
-        return self.__rsub__(-other)
+        ## right addition, the addition is commutative
+        return self.__add__(other)
 
     def __sub__(self, other):
         return self.__add__(-other)
         
     def __rsub__(self, other):
-        return -self.__sub__(other)
+        ## right subtraction with numpy arraies or integer (other - self)
+        return CentredPotential(other - self.p_int, self.mesh)
 
     def __mul__(self, other):
         pn = self.p_int*other
@@ -604,6 +1110,40 @@ class CentredPotential():
 
     def __truediv__(self, other):
         return self.__mul__(1.0/other)
+
+    ## in place operations: p_int is overwritten (no new array is allocated)
+    def __iadd__(self, other):
+        try:
+            self.p_int += other.get_value()
+        except AttributeError:
+            self.p_int += other
+        return self
+
+    def __isub__(self, other):
+        try:
+            self.p_int -= other.get_value()
+        except AttributeError:
+            self.p_int -= other
+        return self
+
+    def __imul__(self, other):
+        self.p_int *= other
+        return self
+
+    def __itruediv__(self, other):
+        self.p_int /= other
+        return self
+
+    def axpy(self, a, other):
+        # self += a*other in place, other is a CentredPotential instance or a numpy array
+        try:
+            op = other.get_value()
+        except AttributeError:
+            op = other
+        w = self.mesh.workspace('axpy', np.shape(op))
+        np.multiply(a, op, out=w)
+        np.add(self.p_int, w, out=self.p_int)
+        return self
         
     # defines the indexing for CentredPotential objects, return the resutls in the form of numpy array objects
     def __getitem__(self, key):
@@ -611,11 +1151,11 @@ class CentredPotential():
     
     # calculate the Laplacian and Gradient
     def laplace(self):
-        p = self.complete(self)
-        n = self.n
-        m = self.m
-        dx = self.dx
-        dy = self.dy
+        p = self.complete()
+        n = self.mesh.n
+        m = self.mesh.m
+        dx = self.mesh.dx
+        dy = self.mesh.dy
         Lap_P = (p[1:m+1,2:n+2] -2*p[1:m+1,1:n+1] + p[1:m+1,0:n])/(dx**2) +\
                 (p[2:m+2,1:n+1] - 2*p[1:m+1,1:n+1] + p[0:m,1:n+1])/(dy**2)
                 
@@ -628,6 +1168,11 @@ class CentredPotential():
         dy = self.mesh.dy
         p = self.p_int
 
+        if _kernel_backend[0] == 'numba':
+            px = np.empty((m,n-1))
+            py = np.empty((m-1,n))
+            _gradient_kernel(p, dx, dy, px, py)
+            return VelocityField(px, py, self.mesh)
         px = (p[:,1:n] - p[:,0:n-1])/dx
         py = (p[1:m,:] - p[0:m-1,:])/dy
         return VelocityField(px, py, self.mesh)
@@ -710,6 +1255,73 @@ class Exact_solutions():
 
 	return VelocityField(U_exact_bnd, V_exact_bnd, self.mesh), CentredPotential(P_exact, self.mesh), VelocityField(gradpu_exact, gradpv_exact, self.mesh)
  
+# forcing terms of the flow problems in the separable form F(x, y, t) = sum_k c_k(t)*B_k(x, y)
+# name: [u_basis, v_basis, coefficients] (see register_forcing)
+forcing_terms = {}
+
+# registers the forcing term of the flow problem name (used by mesh.forcing_term and Forcing_term)
+# u_basis(X, Y), v_basis(X, Y): the lists of spatial basis fields B_k of Fu and Fv on meshgrids of the interior u and v nodes
+# coefficients(t): the lists of time coefficients c_k of Fu and Fv at time t
+def register_forcing(name, u_basis, v_basis, coefficients):
+    forcing_terms[name] = [u_basis, v_basis, coefficients]
+
+class Separable_forcing:
+    '''This class evaluates a forcing term of the separable form F(x, y, t) = sum_k c_k(t)*B_k(x, y)
+       The spatial basis fields B_k are evaluated once per mesh on the interior u and v nodes (see mesh.forcing_term),
+       at every time level only the scalar coefficients c_k(t) are computed and the fields combined.'''
+
+    def __init__(self, mesh, u_basis, v_basis, coefficients):
+        n = mesh.n
+        m = mesh.m
+        Xu, Yu = np.meshgrid(mesh.xu[1:n], mesh.yu)
+        Xv, Yv = np.meshgrid(mesh.xv, mesh.yv[1:m])
+        self.basis = [u_basis(Xu, Yu), v_basis(Xv, Yv)]
+        self.coefficients = coefficients
+        self.mesh = mesh
+
+    # returns [Fu, Fv] at the time level t (t th iteration)
+    def values(self, t):
+        tn = self.mesh.dt*t + self.mesh.tdomain[0]
+        F = []
+        for basis, c in zip(self.basis, self.coefficients(tn)):
+            f = c[0]*basis[0]
+            w = self.mesh.workspace('forcing', f.shape)
+            for k in xrange(1, len(basis)):
+                np.multiply(c[k], basis[k], out=w)
+                f += w
+            F.append(f)
+        return F
+
+# first type of periodic forcing problem
+def periodic_forcing_1_u_basis(X, Y):
+    return [np.sin(2*np.pi*Y)*(np.sin(np.pi*X)**2),
+            np.sin(2*np.pi*Y)*(np.cos(2*np.pi*X) - 2*(np.sin(np.pi*X)**2)),
+            np.sin(np.pi*Y)*np.sin(np.pi*X)]
+
+def periodic_forcing_1_v_basis(X, Y):
+    return [np.sin(2*np.pi*X)*(np.sin(np.pi*Y)**2),
+            np.sin(2*np.pi*X)*(2*(np.sin(np.pi*Y)**2) - np.cos(2*np.pi*Y)),
+            np.cos(np.pi*X)*np.cos(np.pi*Y)]
+
+def periodic_forcing_1_coefficients(t):
+    return [[np.pi*np.cos(t), -2*(np.pi**3)*np.sin(t), -np.pi*np.sin(t)],
+            [-np.pi*np.cos(t), -2*(np.pi**3)*np.sin(t), np.pi*np.sin(t)]]
+
+# second type of periodic forcing problem, the phases x + t and y + t are separated by the trigonometric addition formulas
+# Fu = cos(x+t)sin(y+t) + cos(y+t)sin(x+t) + 2sin(x+t)sin(y+t) + cos(x-y+t)
+#    = sin(x+y)(cos2t + sin2t) + cos(x+y)(sin2t - cos2t) + cos(x-y)(1 + cost) - sin(x-y)sint
+# Fv = -sin(x+t)cos(y+t) - sin(y+t)cos(x+t) + 2cos(x+t)cos(y+t) - cos(x-y+t)
+#    = -sin(x+y)(cos2t + sin2t) + cos(x+y)(cos2t - sin2t) + cos(x-y)(1 - cost) + sin(x-y)sint
+def periodic_forcing_2_basis(X, Y):
+    return [np.sin(X + Y), np.cos(X + Y), np.cos(X - Y), np.sin(X - Y)]
+
+def periodic_forcing_2_coefficients(t):
+    return [[np.cos(2*t) + np.sin(2*t), np.sin(2*t) - np.cos(2*t), 1 + np.cos(t), -np.sin(t)],
+            [-np.cos(2*t) - np.sin(2*t), np.cos(2*t) - np.sin(2*t), 1 - np.cos(t), np.sin(t)]]
+
+register_forcing('periodic_forcing_1', periodic_forcing_1_u_basis, periodic_forcing_1_v_basis, periodic_forcing_1_coefficients)
+register_forcing('periodic_forcing_2', periodic_forcing_2_basis, periodic_forcing_2_basis, periodic_forcing_2_coefficients)
+
 class Forcing_term:
     '''This class contains the external forcing term that are required for some flow problems e.g periodic_forcing_1'''
 
@@ -731,60 +1343,18 @@ class Forcing_term:
         self.t = t
 	self.test_problem_name = test_problem_name
 	self.Re = mesh.Re
+        self.mesh = mesh
 	
+    # the forcing terms are evaluated by the Separable_forcing provider of the mesh (interior points only)
     def periodic_forcing_1(self):
         # defines the first type of periodic forcing problem
-        n = self.n
-        m = self.m
-        dx = self.dx
-        dy = self.dy
-        dt = self.dt
-	t = self.t
-        Re = self.Re
-	# change all Xu and Xv, Yu, Yv into xu, xv, yu, yv
-        Xu, Yu = np.meshgrid(self.xu, self.yu)
-        Xv, Yv = np.meshgrid(self.xv, self.yv)
-
-        tn = dt*t + self.tdomain[0]
-        # these forcing terms include boundary points
-        Fx = np.pi*np.cos(tn)*np.sin(2*np.pi*Yu)*(np.sin(np.pi*Xu)**2) -\
-             2*(np.pi**3)*np.sin(tn)*np.sin(2*np.pi*Yu)*(np.cos(2*np.pi*Xu) - 2*(np.sin(np.pi*Xu)**2)) -\
-             np.pi*np.sin(tn)*np.sin(np.pi*Yu)*np.sin(np.pi*Xu)
-
-        Fy = -np.pi*np.cos(tn)*np.sin(2*np.pi*Xv)*(np.sin(np.pi*Yv)**2) -\
-             2*(np.pi**3)*np.sin(tn)*np.sin(2*np.pi*Xv)*(2*(np.sin(np.pi*Yv)**2) - np.cos(2*np.pi*Yv)) +\
-             np.pi*np.sin(tn)*np.cos(np.pi*Xv)*np.cos(np.pi*Yv)
-        return [Fx[:,1:n], Fy[1:m,:]]
+        return self.mesh.forcing_term('periodic_forcing_1', self.t)
 
     def periodic_forcing_2(self): 
-        # defines the first type of periodic forcing problem
-        n = self.n
-        m = self.m
-        dx = self.dx
-        dy = self.dy
-        dt = self.dt
-	t = self.t
-        Re = self.Re
-        Xu, Yu = np.meshgrid(self.xu, self.yu)
-        Xv, Yv = np.meshgrid(self.xv, self.yv)      
-
-        tn = dt*t + self.tdomain[0]
-        # these forcing terms include boundary points
-        Fx = np.cos(Xu + tn)*np.sin(Yu + tn) + np.cos(Yu + tn)*np.sin(Xu + tn) +\
-             2*np.sin(Xu + tn)*np.sin(Yu + tn)+ np.cos(Xu - Yu + tn)
-        Fy = -np.sin(Xv + tn)*np.cos(Yv + tn) - np.sin(Yv + tn)*np.cos(Xv + tn) +\
-             2*np.cos(Xv + tn)*np.cos(Yv + tn)- np.cos(Xv - Yv + tn)
-        
-        return [Fx[:,1:n], Fy[1:m,:]]
+        # defines the second type of periodic forcing problem
+        return self.mesh.forcing_term('periodic_forcing_2', self.t)
 
     def select_forcing_term(self):
         # this functions selects the appropriate forcing term functions according to the name of the flow problem
-	if self.test_problem_name == 'periodic_forcing_1':
-	    forcing_term = self.periodic_forcing_1()
-
-	elif self.test_problem_name == 'periodic_forcing_2':
-	    forcing_term = self.periodic_forcing_2()
-
-	else:
-	    forcing_term = 0
-	return forcing_term
+	# (0 for the flow problems without a registered forcing term)
+	return self.mesh.forcing_term(self.test_problem_name, self.t)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-checks the numba stencil kernels against the NumPy ones, the numba tests
+are skipped when numba is not installed.
+usage: python -m unittest test_kernels
+"""
+
+import unittest
+import structure3
+
+
+class Kernel_backends_test(unittest.TestCase):
+
+    @unittest.skipIf(structure3.numba is None, 'numba is not installed')
+    def test_backends_agree(self):
+        differences = structure3.check_kernel_backends()
+        self.assertEqual(sorted(differences), ['diffusion', 'divergence', 'extrapolated_gradient', 'gradient', 'non_linear_convection'])
+        for name in differences:
+            self.assertLess(differences[name], 1e-12, name)
+
+    @unittest.skipIf(structure3.numba is None, 'numba is not installed')
+    def test_backend_restored(self):
+        previous = structure3.kernel_backend()
+        structure3.check_kernel_backends([8, 12])
+        self.assertEqual(structure3.kernel_backend(), previous)
+
+    @unittest.skipIf(structure3.numba is not None, 'numba is installed')
+    def test_numba_missing(self):
+        self.assertRaises(ImportError, structure3.set_kernel_backend, 'numba')
+        self.assertRaises(ImportError, structure3.check_kernel_backends)
+        self.assertEqual(structure3.kernel_backend(), 'numpy')
+
+
+if __name__ == '__main__':
+    unittest.main()
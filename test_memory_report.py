@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that Memory_report accounts for the factorisations and multigrid levels
+held by the preconditioners of the Pressure Poisson solvers.
+usage: python -m unittest test_memory_report
+"""
+
+import unittest
+import numpy as np
+import structure3
+import solvers3
+
+
+class Memory_report_test(unittest.TestCase):
+
+    def setUp(self):
+        self.mesh = structure3.mesh([16, 16], [[0, 1], [0, 1]], [0, 1], 0.1, 1.0)
+        self.linsys = solvers3.LinearSystem_solver(1.0, self.mesh, diagnostics=False)
+        self.report = solvers3.Memory_report()
+
+    def pressure_bytes(self, solve_method):
+        return self.report.object_bytes(self.linsys.Poisson_pressure_matrix(solve_method))
+
+    def test_ILU_factor_counted(self):
+        # ILU holds the same bordered matrix as DIR plus its incomplete factorisation
+        self.assertGreater(self.pressure_bytes('ILU'), self.pressure_bytes('DIR'))
+
+    def test_CG_factor_counted(self):
+        A = self.linsys.Poisson_Neumann_matrix()
+        A_bytes = A.data.nbytes + A.indices.nbytes + A.indptr.nbytes
+        self.assertGreater(self.pressure_bytes('CG'), A_bytes)
+
+    def test_MF_multigrid_counted(self):
+        # the smoother arrays of every level and the coarse grid eigenvalues of the hierarchy (the level meshes are not counted)
+        precd_AL = self.linsys.Poisson_pressure_matrix('MF')
+        MG = precd_AL[2]
+        level_bytes = sum(a.nbytes for a in MG.invdiag + MG.red) + MG.L_coarse.nbytes
+        self.assertGreater(len(MG.levels), 1)
+        self.assertGreaterEqual(self.report.object_bytes(precd_AL) - self.report.object_bytes(precd_AL[:2]), level_bytes)
+
+    def test_step_peak(self):
+        # the peak after reset_peak includes an array allocated since (traced, or in the resident set size)
+        self.report.start()
+        self.report.reset_peak()
+        a = np.ones(2**20)
+        current, peak = self.report.usage()
+        self.assertGreater(peak, 0)
+        self.assertGreaterEqual(peak, current)
+        if self.report.tracing:
+            self.assertGreaterEqual(peak, a.nbytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-checks the fast and matrix free solve methods against the assembled
+matrices and the direct solves on a small grid with random right hand sides.
+usage: python -m unittest test_solvers
+"""
+
+import unittest
+import numpy as np
+import structure3
+import solvers3
+
+
+class Solvers_test(unittest.TestCase):
+
+    def setUp(self):
+        self.m, self.n = 12, 12
+        self.mesh = structure3.mesh([self.m, self.n], [[0, 1], [0, 1]], [0, 1], 0.1, 1.0)
+        self.linsys = solvers3.LinearSystem_solver(1.0, self.mesh, diagnostics=False)
+        self.random = np.random.RandomState(0)
+
+    def velocity_rhs(self):
+        m, n = self.m, self.n
+        return structure3.VelocityField(self.random.rand(m,n-1), self.random.rand(m-1,n), self.mesh)
+
+    def velocity_solve(self, solve_method, rhs):
+        ALuv = [self.linsys.Linsys_velocity_matrix(velocity, solve_method) for velocity in ["u", "v"]]
+        return self.linsys.Linsys_velocity_solver(ALuv, rhs, solve_method=solve_method).get_uv()
+
+    def assertVelocityClose(self, uv, reference, rtol):
+        for i in xrange(2):
+            self.assertLess(np.max(np.abs(uv[i] - reference[i]))/np.max(np.abs(reference[i])), rtol)
+
+    # the cached sparse LU and the fast diagonalisation against BiCG on the assembled matrices
+    def test_velocity_LU(self):
+        rhs = self.velocity_rhs()
+        self.assertVelocityClose(self.velocity_solve('LU', rhs), self.velocity_solve('BICG', rhs), 1e-9)
+
+    def test_velocity_FD(self):
+        rhs = self.velocity_rhs()
+        self.assertVelocityClose(self.velocity_solve('FD', rhs), self.velocity_solve('LU', rhs), 1e-10)
+
+    # the stencil operators against the assembled matrices
+    def test_velocity_operator(self):
+        for velocity in ["u", "v"]:
+            A = self.linsys.Linsys_velocity_assemble(velocity)
+            A_linop = self.linsys.Linsys_velocity_operator(velocity)
+            x = self.random.rand(A.shape[1])
+            self.assertLess(np.max(np.abs(A_linop.matvec(x) - A.dot(x))), 1e-10*np.max(np.abs(A.dot(x))))
+
+    def test_velocity_MF(self):
+        rhs = self.velocity_rhs()
+        self.assertVelocityClose(self.velocity_solve('MF', rhs), self.velocity_solve('LU', rhs), 1e-9)
+
+    def test_pressure_operator(self):
+        A = self.linsys.Poisson_Neumann_matrix()
+        A_linop = self.linsys.Poisson_pressure_operator()
+        x = self.random.rand(self.m*self.n)
+        self.assertLess(np.max(np.abs(A_linop.matvec(x) - A.dot(x))), 1e-10*np.max(np.abs(A.dot(x))))
+
+    # the discrete cosine transform and the matrix free solves against the direct solve of the bordered system
+    def test_pressure_solves(self):
+        rhs = structure3.CentredPotential(self.random.rand(self.m, self.n), self.mesh)
+        reference = self.linsys.Poisson_pressure_solver(rhs, 'DIR', self.linsys.Poisson_pressure_matrix('DIR')).get_value()
+        for solve_method in ['DCT', 'CG', 'MF']:
+            p = self.linsys.Poisson_pressure_solver(rhs, solve_method, self.linsys.Poisson_pressure_matrix(solve_method)).get_value()
+            self.assertLess(np.max(np.abs(p - reference))/np.max(np.abs(reference)), 1e-8, solve_method)
+
+
+if __name__ == '__main__':
+    unittest.main()